@@ -0,0 +1,92 @@
+# python default imports
+import tarfile
+from enum import Enum
+from os import scandir as osScandir, stat as osStat
+from os.path import join as osPathJoin
+from stat import S_ISDIR as statIsDir, S_ISREG as statIsFile
+from time import localtime
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+class ArchiveFormat(Enum):
+    ZIP = 'zip'
+    TARGZ = 'tar.gz'
+
+# Content-Type of the archive formats
+archiveContentTypes = { ArchiveFormat.ZIP: 'application/zip', ArchiveFormat.TARGZ: 'application/gzip' }
+
+def walkArchiveEntries( paramRootDirectory: str, paramNames: list, paramHiddenNames: tuple = () ):
+    # Give back ( path, name in the archive, stat ) for every selected file and directory - directories recursive.
+    # Symbolic links are never followed, so nothing outside of the user directory lands in the archive.
+    for selectedName in paramNames:
+        selectedPath = osPathJoin( paramRootDirectory, selectedName )
+        try:
+            selectedStats = osStat( selectedPath, follow_symlinks=False )
+        except OSError:
+            continue
+        if statIsFile( selectedStats.st_mode ):
+            yield selectedPath, selectedName, selectedStats
+        elif statIsDir( selectedStats.st_mode ):
+            yield from walkDirectory( selectedPath, selectedName, selectedStats, paramHiddenNames )
+
+def walkDirectory( paramDirectory: str, paramArchiveName: str, paramDirectoryStats, paramHiddenNames: tuple ):
+    # The directory itself first - so also empty directories are in the archive
+    yield paramDirectory, paramArchiveName, paramDirectoryStats
+    try:
+        directoryEntries = sorted( osScandir( paramDirectory ), key=lambda directoryEntry: directoryEntry.name )
+    except OSError:
+        return
+    for directoryEntry in directoryEntries:
+        if directoryEntry.name in paramHiddenNames or directoryEntry.is_symlink():
+            continue
+        archiveName = f"{paramArchiveName}/{directoryEntry.name}"
+        try:
+            entryStats = directoryEntry.stat( follow_symlinks=False )
+        except OSError:
+            continue
+        if directoryEntry.is_dir( follow_symlinks=False ):
+            yield from walkDirectory( directoryEntry.path, archiveName, entryStats, paramHiddenNames )
+        elif directoryEntry.is_file( follow_symlinks=False ):
+            yield directoryEntry.path, archiveName, entryStats
+
+def writeZip( paramWriter, paramEntries, paramChunkSize: int = 1048576, paramIsCompressible = lambda paramName: False ):
+    # paramWriter has no seek/tell: zipfile writes a data descriptor behind every file and the central directory at the end.
+    # ZIP64 is used for files from 2 GiB on, the memory need stays one chunk.
+    with ZipFile( paramWriter, "w" ) as zipArchive:
+        for entryPath, archiveName, entryStats in paramEntries:
+            if statIsDir( entryStats.st_mode ):
+                directoryInfo = ZipInfo( f"{archiveName}/", localtime( entryStats.st_mtime )[ :6 ] )
+                # Unix mode and the MS-DOS directory flag
+                directoryInfo.external_attr = ( ( entryStats.st_mode & 0xFFFF ) << 16 ) | 0x10
+                zipArchive.writestr( directoryInfo, b"" )
+                continue
+
+            zipInfo = ZipInfo( archiveName, localtime( entryStats.st_mtime )[ :6 ] )
+            zipInfo.file_size = entryStats.st_size
+            zipInfo.external_attr = ( entryStats.st_mode & 0xFFFF ) << 16
+            # Already compressed formats (images, video, archives) are only stored - deflate costs CPU for nothing
+            zipInfo.compress_type = ZIP_DEFLATED if paramIsCompressible( archiveName ) else ZIP_STORED
+            try:
+                with open( entryPath, "rb" ) as sourceHandler, zipArchive.open( zipInfo, "w", force_zip64=entryStats.st_size >= 0x7FFFFFFF ) as zipEntry:
+                    while chunk := sourceHandler.read( paramChunkSize ):
+                        zipEntry.write( chunk )
+            except FileNotFoundError:
+                # Deleted in the meantime
+                continue
+
+def writeTarGz( paramWriter, paramEntries, paramChunkSize: int = 1048576 ):
+    # Stream mode "w|gz": tarfile never seeks and writes block after block
+    with tarfile.open( fileobj=paramWriter, mode="w|gz", bufsize=paramChunkSize ) as tarArchive:
+        for entryPath, archiveName, entryStats in paramEntries:
+            tarInfo = tarfile.TarInfo( archiveName )
+            tarInfo.mtime = entryStats.st_mtime
+            tarInfo.mode = entryStats.st_mode & 0o7777
+            if statIsDir( entryStats.st_mode ):
+                tarInfo.type = tarfile.DIRTYPE
+                tarArchive.addfile( tarInfo )
+                continue
+            tarInfo.size = entryStats.st_size
+            try:
+                with open( entryPath, "rb" ) as sourceHandler:
+                    tarArchive.addfile( tarInfo, sourceHandler )
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,114 @@
+# python default imports
+from enum import Enum
+from threading import Lock
+from time import monotonic, sleep
+
+class TransferDirection(Enum):
+    # Uplink and downlink are limited each by itself
+    SEND = 'send'
+    RECEIVE = 'receive'
+
+class TokenBucket:
+    def __init__( self, paramRate: float, paramBurst: float ):
+        # paramRate bytes per second, at most paramBurst bytes at once after a pause
+        self.rate = paramRate
+        self.burst = paramBurst
+        self.tokens = paramBurst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def reserve( self, paramSize: int ):
+        # Take the tokens at once - also more than there are (debt). Give back the seconds until the own debt is paid.
+        # Who comes later waits behind the debt of the others: streams that take pieces of the same size get a turn one after the other.
+        with self.lock:
+            now = monotonic()
+            self.tokens = min( self.burst, self.tokens + ( now - self.updated ) * self.rate )
+            self.updated = now
+            self.tokens -= paramSize
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class TransferStream:
+    def __init__( self, paramScheduler, paramDirection: TransferDirection, paramUserKey: str, paramBuckets: list ):
+        # One big transfer (download, archive, upload) - the buckets of the connection, the user and the server
+        self.scheduler = paramScheduler
+        self.direction = paramDirection
+        self.userKey = paramUserKey
+        self.buckets = paramBuckets
+
+    def throttle( self, paramSize: int ):
+        # Wait until paramSize bytes may go - the slowest bucket decides
+        waitSeconds = max( bucket.reserve( paramSize ) for bucket in self.buckets )
+        if waitSeconds > 0:
+            sleep( waitSeconds )
+        self.scheduler.addTransfer( self.direction, paramSize, waitSeconds )
+
+    def close( self ):
+        self.scheduler.closeStream( self )
+
+class TransferScheduler:
+    def __init__( self, paramGlobalRate: float = 0, paramUserRate: float = 0, paramConnectionRate: float = 0, paramSmallSize: int = 1048576, paramQuantum: int = 65536, paramBurstTime: float = 0.1 ):
+        # Rates in bytes per second for each direction, 0: no limit.
+        # paramSmallSize: smaller answers (pages, /list, small files from the content cache) are never delayed, they are only counted -
+        #   the big transfers wait for them, so interactive requests stay fast while big downloads run.
+        # paramQuantum: big transfers are sent in pieces of this size - every stream gets its turn with the same piece (fair sharing).
+        self.globalRate = paramGlobalRate
+        self.userRate = paramUserRate
+        self.connectionRate = paramConnectionRate
+        self.smallSize = paramSmallSize
+        self.quantum = paramQuantum
+        self.burstTime = paramBurstTime
+
+        self.globalBuckets = { direction: self.newBucket( paramGlobalRate ) for direction in TransferDirection }
+
+        # ( user, direction ) -> [ bucket, active streams ] - removed with the last stream of the user
+        self.userBuckets = {}
+        self.lock = Lock()
+
+        # Statistics
+        self.activeStreams = 0
+        self.shapedBytes = { direction: 0 for direction in TransferDirection }
+        self.waitSeconds = { direction: 0.0 for direction in TransferDirection }
+
+    def newBucket( self, paramRate: float ):
+        if paramRate <= 0:
+            return None
+        return TokenBucket( paramRate, max( self.quantum, paramRate * self.burstTime ) )
+
+    def isShaped( self, paramSize: int = None ):
+        # paramSize None: the size is unknown before (chunked archive) - then it is a big transfer
+        return paramSize == None or paramSize >= self.smallSize
+
+    def openStream( self, paramUserKey: str, paramDirection: TransferDirection ):
+        buckets = [ self.globalBuckets[ paramDirection ], self.newBucket( self.connectionRate ) ]
+        if self.userRate > 0:
+            with self.lock:
+                userBucket = self.userBuckets.setdefault( ( paramUserKey, paramDirection ), [ self.newBucket( self.userRate ), 0 ] )
+                userBucket[ 1 ] += 1
+            buckets.append( userBucket[ 0 ] )
+        with self.lock:
+            self.activeStreams += 1
+        return TransferStream( self, paramDirection, paramUserKey, [ bucket for bucket in buckets if bucket != None ] )
+
+    def closeStream( self, paramStream: TransferStream ):
+        with self.lock:
+            self.activeStreams -= 1
+            userBucket = self.userBuckets.get( ( paramStream.userKey, paramStream.direction ) )
+            if userBucket != None:
+                userBucket[ 1 ] -= 1
+                if userBucket[ 1 ] <= 0:
+                    del self.userBuckets[ ( paramStream.userKey, paramStream.direction ) ]
+
+    def account( self, paramDirection: TransferDirection, paramSize: int ):
+        # A small answer: counted in the server bucket, but sent at once
+        globalBucket = self.globalBuckets[ paramDirection ]
+        if globalBucket != None:
+            globalBucket.reserve( paramSize )
+
+    def addTransfer( self, paramDirection: TransferDirection, paramSize: int, paramWaitSeconds: float ):
+        with self.lock:
+            self.shapedBytes[ paramDirection ] += paramSize
+            self.waitSeconds[ paramDirection ] += paramWaitSeconds
+
+    def getStatistics( self ):
+        with self.lock:
+            return { "activeStreams": self.activeStreams, "shapedBytes": { direction.value: value for direction, value in self.shapedBytes.items() }, "waitSeconds": { direction.value: value for direction, value in self.waitSeconds.items() } }
@@ -0,0 +1,345 @@
+# python default imports
+import json
+import platform
+import ssl
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from enum import Enum
+from math import ceil
+from http.client import HTTPConnection, HTTPSConnection
+from os import makedirs, cpu_count, kill, urandom
+from os.path import join as osPathJoin, dirname, abspath, exists
+from shutil import copyfile, rmtree, which
+from signal import SIGINT
+from socket import socket, create_connection, AF_INET, SOCK_STREAM
+from subprocess import Popen, run, DEVNULL, STDOUT, TimeoutExpired
+from tempfile import mkdtemp
+from threading import Thread, Event
+from time import perf_counter, sleep, time
+
+# Example: python3 benchmark.py --clients 16 --duration 10 --output before.json
+# Example: python3 benchmark.py --scenarios list,small --mode asyncio --processes 4 --output after.json
+# The server runs in an own process in a temporary directory (self-signed certificate, generated test files),
+# the clients are threads - with --client-processes in more processes, so the clients are not limited by one GIL.
+
+projectDirectory = dirname( abspath( __file__ ) )
+
+class BenchmarkScenario(Enum):
+    # /list of a directory with many files
+    LIST = 'list'
+    # Download of a small file (from the content cache)
+    SMALL = 'small'
+    # Download of a big file (sendfile or the send buffer)
+    LARGE = 'large'
+    # multipart/form-data upload
+    UPLOAD = 'upload'
+
+def parseArguments():
+    argumentParser = ArgumentParser( description="Load and throughput benchmark for the SimpleFileServer (localhost)" )
+    argumentParser.add_argument( "--scenarios", default=",".join( scenario.value for scenario in BenchmarkScenario ), help="comma separated: " + ", ".join( scenario.value for scenario in BenchmarkScenario ) )
+    argumentParser.add_argument( "--clients", type=int, default=8, help="concurrent clients (one keep-alive connection each)" )
+    argumentParser.add_argument( "--client-processes", type=int, default=1, help="the clients are split into this many processes" )
+    argumentParser.add_argument( "--duration", type=float, default=10.0, help="seconds per scenario" )
+    argumentParser.add_argument( "--warmup", type=float, default=1.0, help="seconds per scenario that are not measured" )
+    argumentParser.add_argument( "--list-files", type=int, default=1000, help="files in the directory of the /list scenario" )
+    argumentParser.add_argument( "--small-size", type=int, default=4096, help="bytes of the small download" )
+    argumentParser.add_argument( "--large-size", type=int, default=67108864, help="bytes of the large download" )
+    argumentParser.add_argument( "--upload-size", type=int, default=4194304, help="bytes of one upload" )
+    argumentParser.add_argument( "--mode", default="threadpool", help="serial, threadpool or asyncio" )
+    argumentParser.add_argument( "--workers", type=int, default=32, help="webServerWorkers" )
+    argumentParser.add_argument( "--processes", type=int, default=1, help="webServerProcesses (pre-forked workers)" )
+    argumentParser.add_argument( "--plain", action="store_true", help="without TLS" )
+    argumentParser.add_argument( "--port", type=int, default=0, help="0: a free port" )
+    argumentParser.add_argument( "--output", default=None, help="JSON file with the results (to diff two commits)" )
+    argumentParser.add_argument( "--serve", default=None, help="internal: run the server with this JSON configuration" )
+    return argumentParser.parse_args()
+
+def runServer( paramServerConfig: dict ):
+    # Runs in the server process - the current directory is the temporary benchmark directory
+    sys.path.insert( 0, projectDirectory )
+    from webserver import WebServer, ServerMode
+    from prefork import PreforkServer
+
+    serverArguments = { "paramHost": "127.0.0.1", "paramPort": paramServerConfig[ "port" ], "paramMode": ServerMode( paramServerConfig[ "mode" ] ), "paramWorkers": paramServerConfig[ "workers" ],
+                        "paramTls": paramServerConfig[ "tls" ], "paramMaxConnectionsPerIp": 0, "paramKeepAliveRequests": 1000000 }
+    if paramServerConfig[ "processes" ] > 1:
+        webService = PreforkServer( paramServerConfig[ "processes" ], False, **serverArguments )
+    else:
+        webService = WebServer( **serverArguments )
+    webService.serveForever()
+
+def createCertificate( paramDirectory: str ):
+    # Self-signed like runSimpleFileServer.sh, but without questions and with a faster key
+    if which( "openssl" ) == None:
+        raise RuntimeError( "openssl is needed for the certificate (or use --plain)" )
+    run( [ "openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-keyout", osPathJoin( paramDirectory, "key.pem" ), "-out", osPathJoin( paramDirectory, "cert.pem" ),
+           "-days", "1", "-nodes", "-subj", "/CN=localhost" ], check=True, stdout=DEVNULL, stderr=DEVNULL )
+
+def writeRandomFile( paramPath: str, paramSize: int ):
+    # Random content - a compressing path can not cheat
+    with open( paramPath, "wb" ) as fileHandler:
+        remaining = paramSize
+        while remaining > 0:
+            remaining -= fileHandler.write( urandom( min( remaining, 1048576 ) ) )
+
+def prepareDirectory( paramDirectory: str, paramArguments ):
+    # Same structure as ./wwwdata of the project: images/favicon and userdata/guest with the test files
+    userDirectory = osPathJoin( paramDirectory, "wwwdata", "userdata", "guest" )
+    makedirs( userDirectory )
+    makedirs( osPathJoin( paramDirectory, "wwwdata", "images" ) )
+    faviconPath = osPathJoin( projectDirectory, "wwwdata", "images", "favicon_server_32x32.ico" )
+    if exists( faviconPath ):
+        copyfile( faviconPath, osPathJoin( paramDirectory, "wwwdata", "images", "favicon_server_32x32.ico" ) )
+
+    writeRandomFile( osPathJoin( userDirectory, "small.bin" ), paramArguments.small_size )
+    writeRandomFile( osPathJoin( userDirectory, "large.bin" ), paramArguments.large_size )
+    for fileIndex in range( paramArguments.list_files ):
+        with open( osPathJoin( userDirectory, f"file-{fileIndex:06d}.txt" ), "w" ) as fileHandler:
+            fileHandler.write( f"File number {fileIndex}\n" )
+
+def getFreePort():
+    with socket( AF_INET, SOCK_STREAM ) as freeSocket:
+        freeSocket.bind( ( "127.0.0.1", 0 ) )
+        return freeSocket.getsockname()[ 1 ]
+
+def waitForServer( paramPort: int, paramServerProcess: Popen, paramTimeout: float = 30.0 ):
+    deadline = time() + paramTimeout
+    while time() < deadline:
+        if paramServerProcess.poll() != None:
+            raise RuntimeError( "The server process has stopped" )
+        try:
+            create_connection( ( "127.0.0.1", paramPort ), timeout=1 ).close()
+            return
+        except OSError:
+            sleep( 0.1 )
+    raise RuntimeError( "The server does not answer" )
+
+def getProcessTree( paramPid: int ):
+    # The server process and its pre-forked workers (Linux /proc)
+    processIds = [ paramPid ]
+    try:
+        with open( f"/proc/{paramPid}/task/{paramPid}/children" ) as childrenFile:
+            for childPid in childrenFile.read().split():
+                processIds.extend( getProcessTree( int( childPid ) ) )
+    except OSError:
+        pass
+    return processIds
+
+def readProcessUsage( paramPid: int ):
+    # ( resident memory in bytes, cpu seconds ) of the server with all workers - ( 0, 0.0 ) without /proc
+    residentBytes, cpuTicks = 0, 0
+    for processId in getProcessTree( paramPid ):
+        try:
+            with open( f"/proc/{processId}/statm" ) as statmFile:
+                residentBytes += int( statmFile.read().split()[ 1 ] ) * 4096
+            with open( f"/proc/{processId}/stat" ) as statFile:
+                # The name in brackets may have spaces - the fields behind it: utime is 14, stime is 15
+                statFields = statFile.read().rsplit( ")", 1 )[ 1 ].split()
+                cpuTicks += int( statFields[ 11 ] ) + int( statFields[ 12 ] )
+        except OSError:
+            continue
+    return ( residentBytes, cpuTicks / 100 )
+
+class UsageSampler( Thread ):
+    def __init__( self, paramPid: int, paramInterval: float = 0.2 ):
+        # Peak of the resident memory while a scenario runs
+        super().__init__( daemon=True )
+        self.pid = paramPid
+        self.interval = paramInterval
+        self.stopEvent = Event()
+        self.peakResidentBytes = 0
+
+    def run( self ):
+        while self.stopEvent.wait( self.interval ) == False:
+            self.peakResidentBytes = max( self.peakResidentBytes, readProcessUsage( self.pid )[ 0 ] )
+
+    def stop( self ):
+        self.stopEvent.set()
+        self.join()
+
+def openConnection( paramPort: int, paramTls: bool ):
+    if paramTls == False:
+        return HTTPConnection( "127.0.0.1", paramPort, timeout=60 )
+    # Self-signed - only for localhost
+    sslContext = ssl.create_default_context()
+    sslContext.check_hostname = False
+    sslContext.verify_mode = ssl.CERT_NONE
+    return HTTPSConnection( "127.0.0.1", paramPort, timeout=60, context=sslContext )
+
+def getScenarioRequest( paramScenario: str, paramClientId: str, paramUploadBody: bytes ):
+    # ( method, path, body, headers )
+    match BenchmarkScenario( paramScenario ):
+        case BenchmarkScenario.LIST:
+            return ( "GET", "/list", None, {} )
+        case BenchmarkScenario.SMALL:
+            return ( "GET", "/download?FilePath=small.bin", None, {} )
+        case BenchmarkScenario.LARGE:
+            return ( "GET", "/download?FilePath=large.bin", None, {} )
+        case BenchmarkScenario.UPLOAD:
+            # Every client overwrites its own file - the disk does not fill up
+            boundary = "benchmarkboundary"
+            bodyHead = f'--{boundary}\r\nContent-Disposition: form-data; name="Filename"; filename="upload-{paramClientId}.bin"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode( 'ascii' )
+            return ( "POST", "/upload", [ bodyHead, paramUploadBody, f"\r\n--{boundary}--\r\n".encode( 'ascii' ) ], { "Content-Type": f"multipart/form-data; boundary={boundary}" } )
+
+def runClient( paramScenario: str, paramClientId: str, paramPort: int, paramTls: bool, paramUploadSize: int, paramWarmupEnd: float, paramEnd: float ):
+    # One client: request after request on one keep-alive connection until the end. Only requests after the warmup count.
+    latencies = []
+    sentBytes, receivedBytes, errors = 0, 0, 0
+    uploadBody = urandom( paramUploadSize ) if paramScenario == BenchmarkScenario.UPLOAD.value else b""
+    method, path, body, headers = getScenarioRequest( paramScenario, paramClientId, uploadBody )
+    if body != None:
+        headers[ "Content-Length" ] = str( sum( len( bodyPart ) for bodyPart in body ) )
+    connection = openConnection( paramPort, paramTls )
+    while time() < paramEnd:
+        requestStart = perf_counter()
+        try:
+            connection.putrequest( method, path )
+            for headerName, headerValue in headers.items():
+                connection.putheader( headerName, headerValue )
+            connection.endheaders()
+            if body != None:
+                for bodyPart in body:
+                    connection.send( bodyPart )
+            response = connection.getresponse()
+            responseBytes = 0
+            while ( responseChunk := response.read( 1048576 ) ):
+                responseBytes += len( responseChunk )
+            if response.status != 200:
+                raise RuntimeError( f"Status {response.status}" )
+        except Exception:
+            # Count it and try again with a new connection
+            errors += 1
+            connection.close()
+            connection = openConnection( paramPort, paramTls )
+            continue
+        if time() < paramWarmupEnd:
+            continue
+        latencies.append( perf_counter() - requestStart )
+        receivedBytes += responseBytes
+        sentBytes += len( uploadBody )
+    connection.close()
+    return { "latencies": latencies, "sentBytes": sentBytes, "receivedBytes": receivedBytes, "errors": errors }
+
+def runClientGroup( paramScenario: str, paramClientIds: list, paramPort: int, paramTls: bool, paramUploadSize: int, paramWarmupEnd: float, paramEnd: float ):
+    # The clients of one client process as threads
+    with ThreadPoolExecutor( max_workers=len( paramClientIds ) ) as executor:
+        clientResults = list( executor.map( lambda clientId: runClient( paramScenario, clientId, paramPort, paramTls, paramUploadSize, paramWarmupEnd, paramEnd ), paramClientIds ) )
+    return clientResults
+
+def getPercentile( paramSortedValues: list, paramPercent: float ):
+    # Nearest rank: the smallest value that is not lower than paramPercent of all values
+    if not paramSortedValues:
+        return 0.0
+    return paramSortedValues[ max( 0, ceil( paramPercent / 100 * len( paramSortedValues ) ) - 1 ) ]
+
+def runScenario( paramScenario: str, paramArguments, paramPort: int, paramTls: bool, paramServerPid: int ):
+    clientIds = [ f"{clientIndex:04d}" for clientIndex in range( paramArguments.clients ) ]
+    clientProcesses = max( 1, min( paramArguments.client_processes, len( clientIds ) ) )
+    clientGroups = [ clientIds[ groupIndex::clientProcesses ] for groupIndex in range( clientProcesses ) ]
+
+    # The time of the start: all clients begin and end at the same time, also in other processes
+    warmupEnd = time() + 0.5 + paramArguments.warmup
+    end = warmupEnd + paramArguments.duration
+    usageSampler = UsageSampler( paramServerPid )
+    usageSampler.start()
+    with ProcessPoolExecutor( max_workers=clientProcesses ) as executor:
+        groupFutures = [ executor.submit( runClientGroup, paramScenario, clientGroup, paramPort, paramTls, paramArguments.upload_size, warmupEnd, end ) for clientGroup in clientGroups ]
+        sleep( max( 0.0, warmupEnd - time() ) )
+        cpuSecondsBefore = readProcessUsage( paramServerPid )[ 1 ]
+        sleep( max( 0.0, end - time() ) )
+        cpuSecondsAfter = readProcessUsage( paramServerPid )[ 1 ]
+        clientResults = [ clientResult for groupFuture in groupFutures for clientResult in groupFuture.result() ]
+    usageSampler.stop()
+
+    latencies = sorted( latency for clientResult in clientResults for latency in clientResult[ "latencies" ] )
+    transferredBytes = sum( clientResult[ "sentBytes" ] + clientResult[ "receivedBytes" ] for clientResult in clientResults )
+    return {
+        "requests": len( latencies ),
+        "errors": sum( clientResult[ "errors" ] for clientResult in clientResults ),
+        "seconds": paramArguments.duration,
+        "requestsPerSecond": round( len( latencies ) / paramArguments.duration, 2 ),
+        "latencyMilliseconds": {
+            "mean": round( sum( latencies ) * 1000 / len( latencies ), 3 ) if latencies else 0.0,
+            "p50": round( getPercentile( latencies, 50 ) * 1000, 3 ),
+            "p90": round( getPercentile( latencies, 90 ) * 1000, 3 ),
+            "p99": round( getPercentile( latencies, 99 ) * 1000, 3 ),
+            "max": round( latencies[ -1 ] * 1000, 3 ) if latencies else 0.0,
+        },
+        "megabytesPerSecond": round( transferredBytes / 1048576 / paramArguments.duration, 2 ),
+        "serverCpuSeconds": round( cpuSecondsAfter - cpuSecondsBefore, 2 ),
+        "serverPeakResidentMegabytes": round( usageSampler.peakResidentBytes / 1048576, 1 ),
+    }
+
+def getGitCommit():
+    try:
+        return run( [ "git", "rev-parse", "--short", "HEAD" ], cwd=projectDirectory, capture_output=True, text=True, timeout=10 ).stdout.strip()
+    except ( OSError, TimeoutExpired ):
+        return ""
+
+def printResults( paramResults: dict ):
+    print( f"{'scenario':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'MB/s':>10}{'cpu s':>8}{'RSS MB':>8}" )
+    for scenario, scenarioResult in paramResults[ "scenarios" ].items():
+        latency = scenarioResult[ "latencyMilliseconds" ]
+        print( f"{scenario:<10}{scenarioResult[ 'requests' ]:>10}{scenarioResult[ 'errors' ]:>8}{scenarioResult[ 'requestsPerSecond' ]:>10}{latency[ 'p50' ]:>10}{latency[ 'p99' ]:>10}"
+               f"{scenarioResult[ 'megabytesPerSecond' ]:>10}{scenarioResult[ 'serverCpuSeconds' ]:>8}{scenarioResult[ 'serverPeakResidentMegabytes' ]:>8}" )
+
+def main():
+    arguments = parseArguments()
+    if arguments.serve != None:
+        runServer( json.loads( arguments.serve ) )
+        return
+
+    scenarios = [ scenario.strip() for scenario in arguments.scenarios.split( "," ) if scenario.strip() ]
+    for scenario in scenarios:
+        # ValueError with the name if the scenario is unknown
+        BenchmarkScenario( scenario )
+
+    benchmarkDirectory = mkdtemp( prefix="simplefileserver-benchmark-" )
+    serverProcess = None
+    try:
+        print( f"Prepare {benchmarkDirectory}" )
+        if arguments.plain == False:
+            createCertificate( benchmarkDirectory )
+        prepareDirectory( benchmarkDirectory, arguments )
+
+        port = arguments.port or getFreePort()
+        serverConfig = { "port": port, "mode": arguments.mode, "workers": arguments.workers, "processes": arguments.processes, "tls": arguments.plain == False }
+        with open( osPathJoin( benchmarkDirectory, "server.log" ), "w" ) as serverLog:
+            serverProcess = Popen( [ sys.executable, abspath( __file__ ), "--serve", json.dumps( serverConfig ) ], cwd=benchmarkDirectory, stdout=serverLog, stderr=STDOUT )
+        waitForServer( port, serverProcess )
+
+        results = {
+            "benchmark": {
+                "time": round( time() ),
+                "commit": getGitCommit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": cpu_count(),
+                "parameters": { name: value for name, value in vars( arguments ).items() if name not in ( "serve", "output" ) },
+            },
+            "scenarios": {},
+        }
+        for scenario in scenarios:
+            print( f"Run {scenario} ({arguments.clients} clients, {arguments.duration} s)" )
+            results[ "scenarios" ][ scenario ] = runScenario( scenario, arguments, port, serverConfig[ "tls" ], serverProcess.pid )
+
+        printResults( results )
+        if arguments.output != None:
+            with open( arguments.output, "w" ) as outputFile:
+                json.dump( results, outputFile, indent=2, sort_keys=True )
+                outputFile.write( "\n" )
+            print( f"Results: {arguments.output}" )
+    finally:
+        if serverProcess != None and serverProcess.poll() == None:
+            # Ctrl+C for the server - with pre-forked workers they are stopped, too
+            kill( serverProcess.pid, SIGINT )
+            try:
+                serverProcess.wait( 10 )
+            except TimeoutExpired:
+                serverProcess.kill()
+                serverProcess.wait()
+        rmtree( benchmarkDirectory, ignore_errors=True )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# python default imports
+import hashlib
+from os import link as osLink, replace as osReplace, remove as osRemove, chmod as osChmod, makedirs as osMakedirs, scandir as osScandir, stat as osStat
+from os.path import join as osPathJoin, dirname as osPathDirname
+from re import compile as reCompile
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+# Only hashes - never a path
+digestPattern = reCompile( r"[0-9a-f]{64}" )
+
+class BlobStore:
+    def __init__( self, paramBlobDirectory: str = "./wwwdata/blobs", paramHashName: str = "sha256", paramGracePeriod: float = 60.0 ):
+        # Every content is stored once as blobs/<hash>/<first 2 chars>/<hash value>.
+        # A file in a user directory is a hard link to its blob: the kernel counts the references (st_nlink - 1),
+        # downloads, Range and sendfile work without any change and a blob without user file is garbage.
+        # The blob directory must be on the same filesystem as the user directories.
+        self.blobDirectory = osPathJoin( paramBlobDirectory, paramHashName )
+        self.temporaryDirectory = osPathJoin( paramBlobDirectory, "tmp" )
+        self.hashName = paramHashName
+        # A new blob has a reference only a moment after it is stored - the garbage collection does not touch it before
+        self.gracePeriod = paramGracePeriod
+        self.temporaryMaxAge = 86400.0
+        osMakedirs( self.blobDirectory, exist_ok=True )
+        osMakedirs( self.temporaryDirectory, exist_ok=True )
+
+        # Running counters - a metrics scrape never walks the store. Counted once here and exact again after every
+        # garbage collection (it walks all blobs anyway); in between store and link count up. A removed or overwritten
+        # user file is only seen by the next collection, and so are the blobs that other worker processes stored.
+        self.statisticsLock = Lock()
+        self.statistics = { **self.countBlobs(), "collectedBlobs": 0, "collectedBytes": 0 }
+
+    def newHash( self ):
+        return hashlib.new( self.hashName )
+
+    def getTemporaryPath( self ):
+        # Uploads are written here first - on the same filesystem as the blobs
+        return osPathJoin( self.temporaryDirectory, uuid4().hex )
+
+    def getBlobPath( self, paramDigest: str ):
+        return osPathJoin( self.blobDirectory, paramDigest[ :2 ], paramDigest )
+
+    def hashFile( self, paramSourceFile: str, paramChunkSize: int = 1048576 ):
+        fileHash = self.newHash()
+        with open( paramSourceFile, "rb" ) as fileHandler:
+            while chunk := fileHandler.read( paramChunkSize ):
+                fileHash.update( chunk )
+        return fileHash.hexdigest()
+
+    def storeFile( self, paramTemporaryPath: str, paramTargetPath: str, paramDigest: str = None ):
+        # The written file becomes a blob (or is dropped if the content is already known) and the target links to it.
+        if paramDigest == None:
+            paramDigest = self.hashFile( paramTemporaryPath )
+        blobPath = self.getBlobPath( paramDigest )
+        osMakedirs( osPathDirname( blobPath ), exist_ok=True )
+        blobSize = osStat( paramTemporaryPath ).st_size
+        try:
+            # Read only - nobody may change a content that more users share
+            osChmod( paramTemporaryPath, 0o444 )
+            osLink( paramTemporaryPath, blobPath )
+            self.countStatistics( blobs=1, storedBytes=blobSize )
+        except FileExistsError:
+            # Known content (maybe by a parallel upload right now) - the new copy is not needed
+            pass
+        osRemove( paramTemporaryPath )
+        self.linkToTarget( blobPath, paramTargetPath )
+        self.countStatistics( references=1, logicalBytes=blobSize )
+        return paramDigest
+
+    def linkBlob( self, paramDigest: str, paramSize: int, paramTargetPath: str ):
+        # Upload without data: True if the content is known and now in paramTargetPath
+        if digestPattern.fullmatch( paramDigest ) == None:
+            return False
+        blobPath = self.getBlobPath( paramDigest )
+        try:
+            if osStat( blobPath ).st_size != paramSize:
+                return False
+            self.linkToTarget( blobPath, paramTargetPath )
+        except FileNotFoundError:
+            # Unknown - or removed by the garbage collection in this moment
+            return False
+        self.countStatistics( references=1, logicalBytes=paramSize )
+        return True
+
+    def linkToTarget( self, paramBlobPath: str, paramTargetPath: str ):
+        # Replace the target at once - like a normal upload that overwrites a file
+        temporaryLink = self.getTemporaryPath()
+        osLink( paramBlobPath, temporaryLink )
+        osReplace( temporaryLink, paramTargetPath )
+        try:
+            # The target was already a link to this blob: rename does nothing then and the temporary link stays
+            osRemove( temporaryLink )
+        except FileNotFoundError:
+            pass
+
+    def collectGarbage( self ):
+        # Remove every blob without a user file. Give back ( removed blobs, freed bytes ).
+        removedBlobs, freedBytes = 0, 0
+        for blobEntry in self.walkBlobs():
+            blobStats = blobEntry.stat( follow_symlinks=False )
+            # st_ctime changes with every new or removed link
+            if blobStats.st_nlink <= 1 and time() - blobStats.st_ctime > self.gracePeriod:
+                try:
+                    osRemove( blobEntry.path )
+                except FileNotFoundError:
+                    continue
+                removedBlobs += 1
+                freedBytes += blobStats.st_size
+
+        # Left over from broken uploads
+        with osScandir( self.temporaryDirectory ) as temporaryEntries:
+            for temporaryEntry in temporaryEntries:
+                try:
+                    if time() - temporaryEntry.stat( follow_symlinks=False ).st_mtime > self.temporaryMaxAge:
+                        osRemove( temporaryEntry.path )
+                except FileNotFoundError:
+                    pass
+        blobCounts = self.countBlobs()
+        with self.statisticsLock:
+            self.statistics.update( blobCounts )
+            self.statistics[ "collectedBlobs" ] += removedBlobs
+            self.statistics[ "collectedBytes" ] += freedBytes
+        return removedBlobs, freedBytes
+
+    def countBlobs( self ):
+        # One walk: blobs and bytes on disk, references and the bytes the users see (without deduplication)
+        blobCount, storedBytes, referenceCount, logicalBytes = 0, 0, 0, 0
+        for blobEntry in self.walkBlobs():
+            try:
+                blobStats = blobEntry.stat( follow_symlinks=False )
+            except FileNotFoundError:
+                continue
+            blobCount += 1
+            storedBytes += blobStats.st_size
+            referenceCount += blobStats.st_nlink - 1
+            logicalBytes += blobStats.st_size * ( blobStats.st_nlink - 1 )
+        return { "blobs": blobCount, "storedBytes": storedBytes, "references": referenceCount, "logicalBytes": logicalBytes }
+
+    def countStatistics( self, **paramChanges ):
+        with self.statisticsLock:
+            for name, change in paramChanges.items():
+                self.statistics[ name ] += change
+
+    def getStatistics( self ):
+        with self.statisticsLock:
+            return dict( self.statistics )
+
+    def walkBlobs( self ):
+        with osScandir( self.blobDirectory ) as prefixEntries:
+            prefixDirectories = [ prefixEntry.path for prefixEntry in prefixEntries if prefixEntry.is_dir( follow_symlinks=False ) ]
+        for prefixDirectory in prefixDirectories:
+            with osScandir( prefixDirectory ) as blobEntries:
+                yield from [ blobEntry for blobEntry in blobEntries if blobEntry.is_file( follow_symlinks=False ) ]
@@ -0,0 +1,38 @@
+class ChunkedWriter:
+    def __init__( self, paramClientSocket, paramChunked: bool = True, paramFlushSize: int = 65536 ):
+        # File like writer for a body with unknown length: Transfer-Encoding chunked for HTTP/1.1,
+        # for HTTP/1.0 the plain bytes and the end of the body is the closed connection.
+        self.clientSocket = paramClientSocket
+        self.chunked = paramChunked
+        self.flushSize = paramFlushSize
+
+        # Small writes are collected, so the client does not get thousands of tiny chunks
+        self.buffer = bytearray()
+        self.bytesWritten = 0
+        self.closed = False
+
+    def write( self, paramData ):
+        self.buffer.extend( paramData )
+        if len( self.buffer ) >= self.flushSize:
+            self.flush()
+        return len( paramData )
+
+    def flush( self ):
+        if not self.buffer:
+            return
+        if self.chunked:
+            # Example: 1a\r\n<26 bytes>\r\n
+            self.clientSocket.sendall( b"%x\r\n" % len( self.buffer ) + self.buffer + b"\r\n" )
+        else:
+            self.clientSocket.sendall( self.buffer )
+        self.bytesWritten += len( self.buffer )
+        self.buffer.clear()
+
+    def close( self ):
+        if self.closed:
+            return
+        self.flush()
+        if self.chunked:
+            # Last chunk: size 0 and no trailer
+            self.clientSocket.sendall( b"0\r\n\r\n" )
+        self.closed = True
@@ -0,0 +1,109 @@
+# python default imports
+from socket import socket
+from time import monotonic
+
+# my own python imports
+from bandwidth import TransferDirection
+
+class ClientConnection:
+    def __init__( self, paramSocket: socket, paramAddress: tuple, paramChunkSize: int = 65536, paramTransferScheduler = None ):
+        self.socket = paramSocket
+        self.address = paramAddress
+        self.chunkSize = paramChunkSize
+
+        # Received but not yet used bytes - the begin of the next (pipelined) request lives here
+        self.buffer = bytearray()
+
+        # Keep-Alive state of the current request
+        self.requestCount = 0
+        self.keepAlive = False
+        self.httpVersion = "HTTP/1.1"
+        self.acceptEncoding = ""
+
+        # Metrics: the used (not only received) and the sent bytes of the connection, the status code of the current answer
+        self.bytesReceived = 0
+        self.bytesSent = 0
+        self.statusCode = None
+        self.requestMethod = ""
+        self.requestPath = ""
+        self.routePath = ""
+
+        # Bandwidth (see bandwidth.py): a big transfer of the current request waits in its stream, everything else is only counted
+        self.transferScheduler = paramTransferScheduler
+        self.sendStream = None
+        self.receiveStream = None
+
+    def fill( self ):
+        # Read the next piece from the socket into the buffer; False if the client closed the connection
+        chunk = self.socket.recv( self.chunkSize )
+        if not chunk:
+            return False
+        if self.receiveStream != None:
+            self.receiveStream.throttle( len( chunk ) )
+        self.buffer.extend( chunk )
+        return True
+
+    def readUntil( self, paramDelimiter: bytes, paramMaxSize: int, paramDeadline: float = None ):
+        # Give back everything up to and with the delimiter, None if the client closed before.
+        # paramDeadline (monotonic time): the whole read must be done until then - a client that sends
+        # one byte after the other does not get a new timeout with every byte (TimeoutError).
+        searchStart = 0
+        while ( position := self.buffer.find( paramDelimiter, searchStart ) ) == -1:
+            if len( self.buffer ) > paramMaxSize:
+                raise ValueError( f"No {repr( paramDelimiter )} within {paramMaxSize} bytes" )
+            # Search again only in the new bytes (and the possible cut delimiter)
+            searchStart = max( 0, len( self.buffer ) - len( paramDelimiter ) + 1 )
+            if paramDeadline != None:
+                remainingTime = paramDeadline - monotonic()
+                if remainingTime <= 0:
+                    raise TimeoutError( f"No {repr( paramDelimiter )} in time" )
+                self.socket.settimeout( remainingTime )
+            if self.fill() == False:
+                return None
+        position += len( paramDelimiter )
+        data = bytes( self.buffer[ :position ] )
+        del self.buffer[ :position ]
+        self.bytesReceived += len( data )
+        return data
+
+    def readExact( self, paramSize: int ):
+        # Read exactly paramSize bytes, less only if the client closed the connection
+        while len( self.buffer ) < paramSize:
+            if self.fill() == False:
+                break
+        data = bytes( self.buffer[ :paramSize ] )
+        del self.buffer[ :paramSize ]
+        self.bytesReceived += len( data )
+        return data
+
+    def hasBufferedData( self ):
+        return len( self.buffer ) > 0
+
+    # Socket like methods, so the connection can be used everywhere a client socket was used
+
+    def recv( self, paramSize: int ):
+        if self.buffer:
+            return self.readExact( min( paramSize, len( self.buffer ) ) )
+        data = self.socket.recv( paramSize )
+        if self.receiveStream != None:
+            self.receiveStream.throttle( len( data ) )
+        self.bytesReceived += len( data )
+        return data
+
+    def sendall( self, paramData: bytes ):
+        if self.statusCode == None and paramData[ :5 ] == b"HTTP/":
+            # Example: HTTP/1.1 200 OK - the first header of the answer
+            self.statusCode = int( paramData[ 9:12 ] )
+        if self.sendStream != None:
+            self.sendStream.throttle( len( paramData ) )
+        elif self.transferScheduler != None:
+            # Small and interactive answers are never delayed, but the big transfers wait for them
+            self.transferScheduler.account( TransferDirection.SEND, len( paramData ) )
+        self.socket.sendall( paramData )
+        self.bytesSent += len( paramData )
+
+    def settimeout( self, paramTimeout: float ):
+        self.socket.settimeout( paramTimeout )
+
+    def close( self ):
+        self.socket.close()
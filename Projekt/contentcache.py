@@ -0,0 +1,86 @@
+# python default imports
+from collections import OrderedDict
+from os import stat_result
+from threading import Lock
+
+class CachedFile:
+    def __init__( self, paramContent: bytes, paramFileStats: stat_result, paramEntityTag: str, paramLastModified: str ):
+        self.content = paramContent
+        self.size = len( paramContent )
+
+        # The file is still the same as long as inode, size and mtime are the same
+        self.fileIdentity = ( paramFileStats.st_ino, paramFileStats.st_size, paramFileStats.st_mtime_ns )
+
+        self.entityTag = paramEntityTag
+        self.lastModified = paramLastModified
+
+        # Ready encoded response headers of this file, the key is chosen by the caller (e.g. status and keep-alive)
+        self.responseHeaders = {}
+
+        # Compressed versions of the content: encoding -> bytes
+        self.encodedContents = {}
+
+class ContentCache:
+    def __init__( self, paramMaxBytes: int = 67108864, paramMaxFileSize: int = 1048576 ):
+        # LRU: the oldest used file is at the begin of the ordered dictionary
+        self.maxBytes = paramMaxBytes
+        self.maxFileSize = paramMaxFileSize
+        self.cachedFiles = OrderedDict()
+        self.usedBytes = 0
+        self.lock = Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def isCacheable( self, paramFileStats: stat_result ):
+        return paramFileStats.st_size <= self.maxFileSize and paramFileStats.st_size <= self.maxBytes
+
+    def lookup( self, paramPath: str, paramFileStats: stat_result ):
+        # Give back the cached file if it was not changed on disk since, otherwise None
+        with self.lock:
+            cachedFile = self.cachedFiles.get( paramPath )
+            if cachedFile != None and cachedFile.fileIdentity != ( paramFileStats.st_ino, paramFileStats.st_size, paramFileStats.st_mtime_ns ):
+                # Changed on disk - the old content is worthless
+                self.removeEntry( paramPath )
+                self.invalidations += 1
+                cachedFile = None
+
+            if cachedFile == None:
+                self.misses += 1
+                return None
+
+            self.cachedFiles.move_to_end( paramPath )
+            self.hits += 1
+            return cachedFile
+
+    def store( self, paramPath: str, paramCachedFile: CachedFile ):
+        if paramCachedFile.size > self.maxFileSize or paramCachedFile.size > self.maxBytes:
+            return
+        with self.lock:
+            if paramPath in self.cachedFiles:
+                self.removeEntry( paramPath )
+            self.cachedFiles[ paramPath ] = paramCachedFile
+            self.usedBytes += paramCachedFile.size
+
+            # Remove the longest not used files until the byte budget fits again
+            while self.usedBytes > self.maxBytes:
+                oldestPath = next( iter( self.cachedFiles ) )
+                self.removeEntry( oldestPath )
+                self.evictions += 1
+
+    def remove( self, paramPath: str ):
+        with self.lock:
+            if paramPath in self.cachedFiles:
+                self.removeEntry( paramPath )
+                self.invalidations += 1
+
+    def removeEntry( self, paramPath: str ):
+        # Only call with the lock
+        self.usedBytes -= self.cachedFiles.pop( paramPath ).size
+
+    def getStatistics( self ):
+        with self.lock:
+            return { "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations, "entries": len( self.cachedFiles ), "bytes": self.usedBytes, "maxBytes": self.maxBytes }
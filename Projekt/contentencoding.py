@@ -0,0 +1,170 @@
+# python default imports
+import zlib
+from re import compile as reCompile, escape as reEscape
+from os import replace as osReplace, remove as osRemove, makedirs as osMakedirs, listdir as osListdir, stat_result
+from os.path import join as osPathJoin, dirname as osPathDirname, basename as osPathBasename, exists as osPathExists
+from uuid import uuid4
+
+# Optional: only used if the module is installed - gzip always works with the default python
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+# Best compression first - the server takes the first one the client accepts
+supportedEncodings = [ encoding for encoding, available in ( ( "zstd", zstd != None ), ( "br", brotli != None ), ( "gzip", True ) ) if available ]
+
+# Sidecar file extension per encoding
+encodingExtensions = { "gzip": "gz", "br": "br", "zstd": "zst" }
+
+# Sidecar files live in this hidden directory next to the original file
+sidecarDirectory = ".compressed"
+
+# Text formats that get much smaller; images, video, audio and archives are already compressed
+compressibleTypes = ( "text/", "application/json", "application/xml", "application/x-javascript", "application/javascript", "image/svg+xml" )
+
+def isCompressible( paramContentType: str ):
+    return paramContentType.startswith( compressibleTypes )
+
+def negotiateEncoding( paramAcceptEncoding: str ):
+    # Example: Accept-Encoding: gzip, deflate, br;q=0.9, zstd;q=0
+    # Give back the encoding to use or None for the plain content
+    qualities = {}
+    for acceptedEncoding in paramAcceptEncoding.lower().split( "," ):
+        name, _, parameters = acceptedEncoding.strip().partition( ";" )
+        quality = 1.0
+        if parameters.strip().startswith( "q=" ):
+            try:
+                quality = float( parameters.strip()[ 2: ] )
+            except ValueError:
+                quality = 0.0
+        qualities[ name.strip() ] = quality
+
+    bestEncoding, bestQuality = None, 0.0
+    for encoding in supportedEncodings:
+        quality = qualities.get( encoding, qualities.get( "*", 0.0 ) )
+        if quality > bestQuality:
+            bestEncoding, bestQuality = encoding, quality
+    return bestEncoding
+
+class StreamCompressor:
+    def __init__( self, paramEncoding: str, paramLevel: int = 6 ):
+        # Same interface for all encodings: compress( bytes ) and flush() at the end
+        match paramEncoding:
+            case "gzip":
+                # wbits 31 = gzip header and trailer
+                self.compressor = zlib.compressobj( paramLevel, zlib.DEFLATED, 31 )
+            case "br":
+                self.compressor = brotli.Compressor( quality=min( paramLevel, 11 ) )
+            case "zstd":
+                self.compressor = zstd.ZstdCompressor( level=paramLevel )
+            case _:
+                raise ValueError( f"Unknown encoding: {paramEncoding}" )
+        self.encoding = paramEncoding
+
+    def compress( self, paramData ):
+        if self.encoding == "br":
+            return self.compressor.process( bytes( paramData ) )
+        return self.compressor.compress( paramData )
+
+    def syncFlush( self ):
+        # Everything written so far can be decompressed by the client - the stream goes on
+        match self.encoding:
+            case "gzip":
+                return self.compressor.flush( zlib.Z_SYNC_FLUSH )
+            case "br":
+                return self.compressor.flush()
+            case "zstd":
+                return self.compressor.flush( zstd.ZstdCompressor.FLUSH_BLOCK )
+
+    def flush( self ):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+def compressBytes( paramEncoding: str, paramData: bytes, paramLevel: int = 6 ):
+    streamCompressor = StreamCompressor( paramEncoding, paramLevel )
+    return streamCompressor.compress( paramData ) + streamCompressor.flush()
+
+class CompressingWriter:
+    def __init__( self, paramWriter, paramEncoding: str, paramSourceFile: str = None, paramFileStats: stat_result = None, paramLevel: int = 6 ):
+        # Compresses everything and gives it to paramWriter (e.g. a ChunkedWriter).
+        # With a source file the compressed bytes are also stored on disk as sidecar for the next download.
+        self.writer = paramWriter
+        self.encoding = paramEncoding
+        self.compressor = StreamCompressor( paramEncoding, paramLevel )
+        self.sourceFile = paramSourceFile
+        self.sidecarPath = None
+        self.sidecarHandler = None
+        self.temporaryPath = None
+        if paramSourceFile != None:
+            self.sidecarPath = getSidecarPath( paramSourceFile, paramFileStats, paramEncoding )
+            try:
+                osMakedirs( osPathDirname( self.sidecarPath ), exist_ok=True )
+                # Unique temporary name: parallel downloads of the same file do not write into the same file
+                self.temporaryPath = f"{self.sidecarPath}.{uuid4().hex}.tmp"
+                self.sidecarHandler = open( self.temporaryPath, "wb" )
+            except OSError as e:
+                print( f"Error: Sidecar not writable {repr(e)}" )
+                self.sidecarHandler = None
+
+    def write( self, paramData ):
+        compressedData = self.compressor.compress( paramData )
+        if compressedData:
+            self.forward( compressedData )
+        return len( paramData )
+
+    def flush( self ):
+        # Streamed pages: the client should see the rows written so far
+        self.forward( self.compressor.syncFlush() )
+        self.writer.flush()
+
+    def forward( self, paramData: bytes ):
+        if self.sidecarHandler != None:
+            self.sidecarHandler.write( paramData )
+        self.writer.write( paramData )
+
+    def close( self ):
+        # End of the content - only now the sidecar file is complete and may be used
+        self.forward( self.compressor.flush() )
+        self.writer.close()
+        if self.sidecarHandler != None:
+            self.sidecarHandler.close()
+            self.sidecarHandler = None
+            osReplace( self.temporaryPath, self.sidecarPath )
+            removeOldSidecars( self.sourceFile, self.encoding, self.sidecarPath )
+
+    def abort( self ):
+        # Client is gone - a half sidecar file must never be used
+        if self.sidecarHandler != None:
+            self.sidecarHandler.close()
+            self.sidecarHandler = None
+            try:
+                osRemove( self.temporaryPath )
+            except OSError:
+                pass
+
+def getSidecarPath( paramSourceFile: str, paramFileStats: stat_result, paramEncoding: str ):
+    # Example: wwwdata/userdata/guest/.compressed/log.txt.<mtime>-<size>.gz
+    # mtime and size are in the name: a changed original never finds an old sidecar
+    return osPathJoin( osPathDirname( paramSourceFile ), sidecarDirectory, f"{osPathBasename( paramSourceFile )}.{paramFileStats.st_mtime_ns}-{paramFileStats.st_size}.{encodingExtensions[ paramEncoding ]}" )
+
+def removeOldSidecars( paramSourceFile: str, paramEncoding: str, paramKeepPath: str ):
+    # Only the newest version of a file needs a sidecar
+    sidecarFolder = osPathJoin( osPathDirname( paramSourceFile ), sidecarDirectory )
+    oldSidecarPattern = reCompile( reEscape( osPathBasename( paramSourceFile ) ) + r"\.\d+-\d+\." + reEscape( encodingExtensions[ paramEncoding ] ) )
+    try:
+        for sidecarName in osListdir( sidecarFolder ):
+            sidecarPath = osPathJoin( sidecarFolder, sidecarName )
+            if oldSidecarPattern.fullmatch( sidecarName ) and sidecarPath != paramKeepPath:
+                osRemove( sidecarPath )
+    except OSError:
+        pass
+
+def sidecarExists( paramSidecarPath: str ):
+    return osPathExists( paramSidecarPath )
@@ -0,0 +1,119 @@
+# python default imports
+from os import scandir as osScandir, stat as osStat
+from threading import Lock
+from time import monotonic
+
+# Sort keys for the listing and how a row is compared
+sortKeys = {
+    "name": lambda row: row[ "name" ].lower(),
+    "size": lambda row: row[ "sizeBytes" ],
+    "created": lambda row: row[ "creationTimestamp" ],
+    "modified": lambda row: row[ "modifiedTimestamp" ],
+}
+
+class DirectoryIndex:
+    def __init__( self, paramFormatTimestamp, paramMaxAge: float = 30.0, paramHiddenNames: tuple = () ):
+        # Path -> ( directory identity, scan time, { name: row }, ordered rows, { ( sort key, descending ): sorted rows } )
+        self.listings = {}
+        self.lock = Lock()
+        self.formatTimestamp = paramFormatTimestamp
+
+        # Changes inside a file (size, mtime) do not change the directory mtime - a listing is refreshed at least this often
+        self.maxAge = paramMaxAge
+
+        # Internal entries of the server (e.g. compressed sidecar files) are not shown
+        self.hiddenNames = set( paramHiddenNames )
+
+    def getListing( self, paramDirectory: str ):
+        # Give back the rows of the directory: directories first, then files. The list is shared - only read it!
+        # A new scan is only made if the directory was changed (new, deleted or renamed entries) or the listing is too old.
+        directoryStats = osStat( paramDirectory )
+        directoryIdentity = ( directoryStats.st_ino, directoryStats.st_mtime_ns )
+
+        with self.lock:
+            cachedListing = self.listings.get( paramDirectory )
+        if cachedListing != None:
+            cachedIdentity, scanTime, _, orderedRows, _ = cachedListing
+            if cachedIdentity == directoryIdentity and monotonic() - scanTime < self.maxAge:
+                return orderedRows
+
+        # Incremental: a row is reused (no new formatting) if the stat of the entry is still the same - a file written in place
+        # has a new size or mtime. The listing keeps the time of the last full scan: after maxAge everything is made new.
+        reuseRows = {}
+        scanTime = monotonic()
+        if cachedListing != None and scanTime - cachedListing[ 1 ] < self.maxAge:
+            reuseRows = cachedListing[ 2 ]
+            scanTime = cachedListing[ 1 ]
+
+        rows = {}
+        with osScandir( paramDirectory ) as directoryEntries:
+            for directoryEntry in directoryEntries:
+                if directoryEntry.name in self.hiddenNames:
+                    continue
+                try:
+                    oldRow = reuseRows.get( directoryEntry.name )
+                    if oldRow != None and oldRow[ "statIdentity" ] == self.getStatIdentity( directoryEntry.stat() ):
+                        rows[ directoryEntry.name ] = oldRow
+                        continue
+                    rows[ directoryEntry.name ] = self.createRow( directoryEntry )
+                except OSError:
+                    # Deleted between scandir and stat
+                    continue
+
+        orderedRows = self.sortRows( rows )
+        with self.lock:
+            self.listings[ paramDirectory ] = ( directoryIdentity, scanTime, rows, orderedRows, {} )
+        return orderedRows
+
+    def getSortedListing( self, paramDirectory: str, paramSortKey: str, paramDescending: bool = False ):
+        # Like getListing but sorted (directories stay first). Every sort order is made once per scan of the directory.
+        orderedRows = self.getListing( paramDirectory )
+        if paramSortKey not in sortKeys:
+            return orderedRows
+
+        with self.lock:
+            cachedListing = self.listings.get( paramDirectory )
+        if cachedListing == None or cachedListing[ 3 ] is not orderedRows:
+            # Scanned again in the meantime - sort without storing it
+            sortedViews = {}
+        else:
+            sortedViews = cachedListing[ 4 ]
+
+        viewKey = ( paramSortKey, paramDescending )
+        sortedRows = sortedViews.get( viewKey )
+        if sortedRows == None:
+            sortKey = sortKeys[ paramSortKey ]
+            sortedRows = sorted( ( row for row in orderedRows if row[ "type" ] == "DIR" ), key=sortKey, reverse=paramDescending ) + sorted( ( row for row in orderedRows if row[ "type" ] != "DIR" ), key=sortKey, reverse=paramDescending )
+            with self.lock:
+                sortedViews[ viewKey ] = sortedRows
+        return sortedRows
+
+    def createRow( self, paramDirectoryEntry ):
+        # Example: os.stat_result(st_mode=, st_ino=, st_dev=, st_nlink=, st_uid=, st_gid=, st_size=, st_atime=, st_mtime=, st_ctime=)
+        # scandir knows the type without an extra stat
+        fileStats = paramDirectoryEntry.stat()
+        if paramDirectoryEntry.is_dir():
+            fileType = "DIR"
+        elif paramDirectoryEntry.is_file():
+            fileType = "FILE"
+        else:
+            fileType = "UNKNOWN"
+
+        # The formatted strings are made once per entry and not on every request
+        return { "name": paramDirectoryEntry.name, "type": fileType, "size": format( fileStats.st_size / 1024, ".2f" ), "creationDate": self.formatTimestamp( fileStats.st_ctime ), "modifiedDate": self.formatTimestamp( fileStats.st_mtime ),
+                 "statIdentity": self.getStatIdentity( fileStats ), "sizeBytes": fileStats.st_size, "creationTimestamp": fileStats.st_ctime, "modifiedTimestamp": fileStats.st_mtime }
+
+    def getStatIdentity( self, paramFileStats ):
+        # Changes with every write, truncate, chmod or replace of the entry
+        return ( paramFileStats.st_ino, paramFileStats.st_size, paramFileStats.st_mtime_ns, paramFileStats.st_ctime_ns )
+
+    def sortRows( self, paramRows: dict ):
+        # Directories first - like the old listDirectory
+        directoryInfo = [ row for row in paramRows.values() if row[ "type" ] == "DIR" ]
+        fileInfo = [ row for row in paramRows.values() if row[ "type" ] != "DIR" ]
+        return directoryInfo + fileInfo
+
+    def invalidate( self, paramDirectory: str ):
+        # The server changed something in the directory by itself (e.g. overwritten upload)
+        with self.lock:
+            self.listings.pop( paramDirectory, None )
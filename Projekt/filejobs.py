@@ -0,0 +1,104 @@
+# python default imports
+import json
+from concurrent.futures import ThreadPoolExecutor, wait as futuresWait
+from enum import Enum
+from os import makedirs as osMakedirs, listdir as osListdir, remove as osRemove, replace as osReplace, stat as osStat
+from os.path import join as osPathJoin
+from re import compile as reCompile
+from threading import Lock
+from time import time, monotonic
+from uuid import uuid4
+
+class FileOperation(Enum):
+    COPY = 'copy'
+    MOVE = 'move'
+    DELETE = 'delete'
+
+# Only ids made by the server - never a path
+jobIdPattern = reCompile( r"[0-9a-f]{32}" )
+
+class FileJobManager:
+    def __init__( self, paramJobDirectory: str = "./wwwdata/jobs", paramWorkers: int = 2, paramMaxAge: float = 86400.0, paramStatusInterval: float = 0.5 ):
+        # Copy, move and delete of big trees run in own threads - the worker of the request is free again at once.
+        # The status is a file <id>.json, so every pre-forked worker process can answer the poll of the client.
+        self.jobDirectory = paramJobDirectory
+        self.maxAge = paramMaxAge
+        self.statusInterval = paramStatusInterval
+        osMakedirs( self.jobDirectory, exist_ok=True )
+
+        # Threads are started with the first job (also after a fork)
+        self.executor = ThreadPoolExecutor( max_workers=max( 1, paramWorkers ), thread_name_prefix="FileJob" )
+        self.futures = {}
+        self.lock = Lock()
+
+    def submit( self, paramOperation: FileOperation, paramSource: str, paramTarget: str, paramFunction ):
+        # paramFunction( progress ) does the work, progress( bytes, files ) counts it.
+        # Give back the job id.
+        self.removeExpiredJobs()
+        jobId = uuid4().hex
+        jobStatus = { "id": jobId, "operation": paramOperation.value, "source": paramSource, "target": paramTarget,
+                      "state": "queued", "bytes": 0, "files": 0, "error": "", "started": time(), "finished": None }
+        self.writeStatus( jobStatus )
+        with self.lock:
+            self.futures[ jobId ] = self.executor.submit( self.runJob, jobStatus, paramFunction )
+        return jobId
+
+    def runJob( self, paramJobStatus: dict, paramFunction ):
+        paramJobStatus[ "state" ] = "running"
+        self.writeStatus( paramJobStatus )
+        lastWrite = monotonic()
+
+        def progress( paramBytes: int, paramFiles: int ):
+            nonlocal lastWrite
+            paramJobStatus[ "bytes" ] += paramBytes
+            paramJobStatus[ "files" ] += paramFiles
+            if monotonic() - lastWrite >= self.statusInterval:
+                # Not for every chunk - only often enough for a progress bar
+                self.writeStatus( paramJobStatus )
+                lastWrite = monotonic()
+
+        try:
+            paramFunction( progress )
+            paramJobStatus[ "state" ] = "done"
+        except Exception as e:
+            paramJobStatus[ "state" ] = "failed"
+            paramJobStatus[ "error" ] = e.strerror if isinstance( e, OSError ) and e.strerror else str( e )
+            print( f"Error: {repr(e)}" )
+        paramJobStatus[ "finished" ] = time()
+        self.writeStatus( paramJobStatus )
+        with self.lock:
+            self.futures.pop( paramJobStatus[ "id" ], None )
+
+    def waitForJob( self, paramJobId: str, paramTimeout: float ):
+        # Small jobs are finished at once - then the client needs no poll
+        with self.lock:
+            jobFuture = self.futures.get( paramJobId )
+        if jobFuture != None:
+            futuresWait( [ jobFuture ], paramTimeout )
+        return self.getJob( paramJobId )
+
+    def getJob( self, paramJobId: str ):
+        # None if the id is unknown (or expired)
+        if jobIdPattern.fullmatch( paramJobId ) == None:
+            return None
+        try:
+            with open( osPathJoin( self.jobDirectory, f"{paramJobId}.json" ), "r" ) as statusHandler:
+                return json.load( statusHandler )
+        except ( OSError, ValueError ):
+            return None
+
+    def writeStatus( self, paramJobStatus: dict ):
+        # Replaced at once - a reader never sees a half written status
+        statusPath = osPathJoin( self.jobDirectory, f"{paramJobStatus[ 'id' ]}.json" )
+        with open( f"{statusPath}.tmp", "w" ) as statusHandler:
+            json.dump( paramJobStatus, statusHandler )
+        osReplace( f"{statusPath}.tmp", statusPath )
+
+    def removeExpiredJobs( self ):
+        for statusFilename in osListdir( self.jobDirectory ):
+            statusPath = osPathJoin( self.jobDirectory, statusFilename )
+            try:
+                if time() - osStat( statusPath ).st_mtime > self.maxAge:
+                    osRemove( statusPath )
+            except FileNotFoundError:
+                pass
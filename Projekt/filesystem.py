@@ -1,33 +1,239 @@
-from os.path import exists as osPathExists, getsize as osPathGetsize, join as osPathJoin
-from os import mkdir as osMkdir, remove as osRmdir, listdir as osListdir, stat as osStat
+from os.path import exists as osPathExists, lexists as osPathLexists, getsize as osPathGetsize, join as osPathJoin, dirname as osPathDirname, realpath as osPathRealpath
+from os import mkdir as osMkdir, rmdir as osRmdir, remove as osRemove, replace as osReplace, link as osLink, scandir as osScandir, stat as osStat, fstat as osFstat, fchmod as osFchmod, utime as osUtime, stat_result
+from os import copy_file_range as osCopyFileRange, sendfile as osSendfile, pread as osPread, pwrite as osPwrite, lseek as osLseek, SEEK_SET
 from datetime import datetime
-from stat import S_ISDIR as statIsDir, S_ISREG as statIsFile
+from threading import Lock
+from time import monotonic
+from email.utils import formatdate
+from errno import EXDEV, EINVAL
+from fcntl import ioctl
+from stat import S_ISREG as statIsFile, S_ISDIR as statIsDir, S_IMODE as statMode
+
+# ioctl to share the blocks of a file (reflink) on btrfs, xfs, ...
+FICLONE = 0x40049409
+
+# my own python imports
+from contentcache import ContentCache, CachedFile
+from directoryindex import DirectoryIndex
+from contentencoding import sidecarDirectory
+from blobstore import BlobStore
 
 class Filesystem:
-    def __init__( self, paramWorkDirectory: str = "./wwwdata", paramUserDirectory: str = "userdata" ):
+    def __init__( self, paramWorkDirectory: str = "./wwwdata", paramUserDirectory: str = "userdata", paramCacheBytes: int = 67108864, paramCacheFileSize: int = 1048576, paramDeduplicate: bool = False ):
         self.workDirectory = paramWorkDirectory
         self.userDirectory = paramUserDirectory
 
+        # Small and often read files (favicon, small user files) are kept in memory
+        self.contentCache = ContentCache( paramCacheBytes, paramCacheFileSize )
+
+        # Directory listings are scanned again only if the directory was changed
+        self.directoryIndex = DirectoryIndex( self.getDateTimeFromTimestamp, paramHiddenNames=( sidecarDirectory, ) )
+
+        # Copy: bytes per kernel call (progress is reported after each) and the buffer of the Python fallback
+        self.copyChunkSize = 8388608
+        self.copyBufferSize = 1048576
+
+        # Optional: every content is stored only once, user files are hard links to it (see blobstore.py)
+        self.blobStore = BlobStore( self.madeWorkPath( "blobs" ) ) if paramDeduplicate else None
+        # The garbage collection walks all blobs - it runs after changes, but only once per grace period
+        self.garbageLock = Lock()
+        self.garbageCollected = 0.0
+
     def __str__( self ):
         return f"The working directory is: {self.workDirectory}"
 
-    def doMove( self, paramSource: str, paramTarget: str ):
-        # Can be a file or directory to move
-        pass
+    def doMove( self, paramSource: str, paramTarget: str, paramProgress = None ):
+        # Can be a file or directory to move. An existing target is never overwritten (FileExistsError).
+        # paramProgress( bytes, files ) is only called if the data must be copied to an other filesystem.
+        if osPathLexists( paramTarget ):
+            raise FileExistsError( "Target already exists" )
+        try:
+            # Same filesystem: only the directory entry changes, also for big trees
+            osReplace( paramSource, paramTarget )
+        except OSError as e:
+            if e.errno != EXDEV:
+                raise
+            # Other filesystem: copy everything, then remove the source
+            self.doCopy( paramSource, paramTarget, paramProgress )
+            if statIsDir( osStat( paramSource, follow_symlinks=False ).st_mode ):
+                self.removeTree( paramSource )
+            else:
+                osRemove( paramSource )
+        self.notifyChanged( paramSource )
+        self.notifyChanged( paramTarget )
+        # Moved to an other filesystem: the source was a reference to a blob
+        self.collectGarbage()
+
+    def doCopy( self, paramSource: str, paramTarget: str, paramProgress = None ):
+        # Can be a file or directory to copy. An existing target is never overwritten (FileExistsError).
+        # paramProgress( bytes, files ) is called while copying.
+        if osPathLexists( paramTarget ):
+            raise FileExistsError( "Target already exists" )
+        sourceStats = osStat( paramSource, follow_symlinks=False )
+        if statIsDir( sourceStats.st_mode ):
+            if ( osPathRealpath( paramTarget ) + "/" ).startswith( osPathRealpath( paramSource ) + "/" ):
+                raise OSError( EINVAL, "A directory can not be copied into itself", paramTarget )
+            self.copyDirectory( paramSource, paramTarget, sourceStats, paramProgress )
+        elif statIsFile( sourceStats.st_mode ):
+            self.copyFile( paramSource, paramTarget, paramProgress )
+        else:
+            raise OSError( EINVAL, "Only files and directories can be copied", paramSource )
+        self.notifyChanged( paramTarget )
+
+    def doRemove( self, paramTarget: str, paramProgress = None ):
+        # Can be a file or directory (with everything inside) to remove. Symbolic links are removed, not followed.
+        if statIsDir( osStat( paramTarget, follow_symlinks=False ).st_mode ):
+            self.removeTree( paramTarget, paramProgress )
+        else:
+            osRemove( paramTarget )
+            if paramProgress != None:
+                paramProgress( 0, 1 )
+        self.notifyChanged( paramTarget )
+        self.collectGarbage()
+
+    def storeFile( self, paramTemporaryPath: str, paramTargetPath: str, paramDigest: str = None ):
+        # A completely written upload gets its place in the user directory at once.
+        # Deduplicated: a known content is not stored again (paramDigest is computed if not given).
+        if self.blobStore == None:
+            osReplace( paramTemporaryPath, paramTargetPath )
+        else:
+            self.blobStore.storeFile( paramTemporaryPath, paramTargetPath, paramDigest )
+        self.notifyChanged( paramTargetPath )
+        # An overwritten file can leave its old content without a reference
+        self.collectGarbage()
+
+    def linkContent( self, paramDigest: str, paramSize: int, paramTargetPath: str ):
+        # Deduplicated upload without data: True if the content is known and now in paramTargetPath
+        if self.blobStore == None or self.blobStore.linkBlob( paramDigest, paramSize, paramTargetPath ) == False:
+            return False
+        self.notifyChanged( paramTargetPath )
+        self.collectGarbage()
+        return True
+
+    def collectGarbage( self ):
+        # Contents without a user file are not needed anymore. A blob that lost its last reference just now is
+        # kept for the grace period (a parallel upload could link it) - a later change collects it.
+        if self.blobStore == None or monotonic() - self.garbageCollected < self.blobStore.gracePeriod:
+            return
+        if self.garbageLock.acquire( blocking=False ) == False:
+            # Runs already in an other thread
+            return
+        try:
+            self.garbageCollected = monotonic()
+            self.blobStore.collectGarbage()
+        except OSError as e:
+            print( f"Error: {repr(e)}" )
+        finally:
+            self.garbageLock.release()
+
+    def detachFile( self, paramTarget: str, paramKeepContent: bool = True ):
+        # Before a file is changed in place (append or overwrite): a shared content gets an own copy first,
+        # otherwise the file of every other user would change too
+        try:
+            targetStats = osStat( paramTarget )
+        except FileNotFoundError:
+            return
+        if targetStats.st_nlink <= 1:
+            return
+        if paramKeepContent == False:
+            # Overwritten anyway - only the own reference is removed
+            osRemove( paramTarget )
+        else:
+            temporaryPath = f"{paramTarget}.{targetStats.st_ino}.tmp"
+            with open( paramTarget, "rb" ) as sourceHandler, open( temporaryPath, "xb" ) as targetHandler:
+                self.copyFileContent( sourceHandler.fileno(), targetHandler.fileno() )
+            osReplace( temporaryPath, paramTarget )
+        # The blob has one reference less
+        self.collectGarbage()
+
+    def copyDirectory( self, paramSource: str, paramTarget: str, paramSourceStats: stat_result, paramProgress = None ):
+        osMkdir( paramTarget, statMode( paramSourceStats.st_mode ) | 0o700 )
+        with osScandir( paramSource ) as directoryEntries:
+            for entry in directoryEntries:
+                if entry.name == sidecarDirectory:
+                    # Compressed sidecar files are made again when needed
+                    continue
+                if entry.is_dir( follow_symlinks=False ):
+                    self.copyDirectory( entry.path, osPathJoin( paramTarget, entry.name ), entry.stat( follow_symlinks=False ), paramProgress )
+                elif entry.is_file( follow_symlinks=False ):
+                    self.copyFile( entry.path, osPathJoin( paramTarget, entry.name ), paramProgress )
+                # Symbolic links are not copied - they could point outside of the user directory
+        osUtime( paramTarget, ns=( paramSourceStats.st_atime_ns, paramSourceStats.st_mtime_ns ) )
+
+    def copyFile( self, paramSource: str, paramTarget: str, paramProgress = None ):
+        if self.blobStore != None:
+            # Deduplicated: the copy is only one more reference to the same content (not to an other filesystem)
+            try:
+                osLink( paramSource, paramTarget )
+                if paramProgress != None:
+                    paramProgress( 0, 1 )
+                return
+            except OSError as e:
+                if e.errno != EXDEV:
+                    raise
+
+        with open( paramSource, "rb" ) as sourceHandler, open( paramTarget, "xb" ) as targetHandler:
+            sourceStats = osFstat( sourceHandler.fileno() )
+            try:
+                self.copyFileContent( sourceHandler.fileno(), targetHandler.fileno(), paramProgress )
+                osFchmod( targetHandler.fileno(), statMode( sourceStats.st_mode ) )
+            except BaseException:
+                # No half file stays behind
+                osRemove( paramTarget )
+                raise
+        osUtime( paramTarget, ns=( sourceStats.st_atime_ns, sourceStats.st_mtime_ns ) )
+        if paramProgress != None:
+            paramProgress( 0, 1 )
 
-    def doCopy( self, paramSource: str, paramTarget: str ):
-        # Can be a file or directory to copy
-        pass
+    def copyFileContent( self, paramSourceDescriptor: int, paramTargetDescriptor: int, paramProgress = None ):
+        # The fastest way that works here - the bytes go through Python only in the last fallback:
+        # 1. reflink: the copy shares the blocks (btrfs, xfs, ...) and needs no time and no space
+        # 2. copy_file_range: the kernel copies (on NFS/SMB even on the server)
+        # 3. sendfile: the kernel copies from page cache to page cache
+        # 4. pread/pwrite with one buffer
+        try:
+            ioctl( paramTargetDescriptor, FICLONE, paramSourceDescriptor )
+            if paramProgress != None:
+                paramProgress( osFstat( paramTargetDescriptor ).st_size, 0 )
+            return
+        except OSError:
+            pass
+
+        copiedBytes = 0
+        def copyFileRange():
+            return osCopyFileRange( paramSourceDescriptor, paramTargetDescriptor, self.copyChunkSize, copiedBytes, copiedBytes )
+        def sendFile():
+            osLseek( paramTargetDescriptor, copiedBytes, SEEK_SET )
+            return osSendfile( paramTargetDescriptor, paramSourceDescriptor, copiedBytes, self.copyChunkSize )
+        def readWrite():
+            return osPwrite( paramTargetDescriptor, osPread( paramSourceDescriptor, self.copyBufferSize, copiedBytes ), copiedBytes )
+
+        for copyFunction in ( copyFileRange, sendFile, readWrite ):
+            try:
+                # Until the end of the file (also if it grows while copying)
+                while ( writtenBytes := copyFunction() ) > 0:
+                    copiedBytes += writtenBytes
+                    if paramProgress != None:
+                        paramProgress( writtenBytes, 0 )
+                return
+            except OSError:
+                if copyFunction == readWrite:
+                    raise
+                # Not supported between these two files - continue at the same byte with the next way
 
     def madeWorkPath( self, paramTarget: str ):
         return osPathJoin( self.workDirectory, paramTarget )
 
     def madeUserPath( self, paramTarget: str, paramUsername: str = "guest" ):
-        if "%2F" in paramTarget:
-            # Only for Download path - replace %2F with Slash - Join the working Directory
-            paramTarget = paramTarget.replace( '%2F', '/' )
+        # paramTarget is already URL-decoded (HttpRequest) - it is never decoded again here
         return osPathJoin( self.workDirectory, self.userDirectory, paramUsername, paramTarget )
 
+    def isUserPath( self, paramTarget: str, paramUsername: str = "guest" ):
+        # True if paramTarget is inside the user directory - also after '..' and symbolic links are resolved
+        userRoot = osPathRealpath( osPathJoin( self.workDirectory, self.userDirectory, paramUsername ) )
+        targetPath = osPathRealpath( paramTarget )
+        return targetPath.startswith( userRoot + "/" )
+
     def checkExists( self, paramTarget: str ):
         # Debugging output
         #print( f"Func. checkExists( param1: {paramTarget} )" )
@@ -49,44 +255,70 @@ class Filesystem:
         return False
 
     def getDateTimeFromTimestamp(self, paramTimestamp: datetime.timestamp):
-        return str( datetime.fromtimestamp( paramTimestamp ) ).split( "." )[ 0 ]
+        return datetime.fromtimestamp( paramTimestamp ).strftime( "%Y-%m-%d %H:%M:%S" )
 
-    def listDirectory( self, paramTargetDirectory: str ):
-        if self.checkExists( paramTargetDirectory ) == False:
-            print( "Error - Directory does not exists" )
-            return
+    def getHttpDateFromTimestamp( self, paramTimestamp: float ):
+        # Example: Wed, 21 Oct 2015 07:28:00 GMT
+        return formatdate( paramTimestamp, usegmt=True )
 
-        directoryInfo = []
-        fileInfo = []
+    def getFileStats( self, paramSourceFile: str ):
+        # None if the file does not exist
+        try:
+            return osStat( paramSourceFile )
+        except OSError:
+            return None
+
+    def getValidatorsFromStats( self, paramFileStats: stat_result ):
+        # Both HTTP validators from one stat: ETag (inode, size, mtime) and Last-Modified
+        entityTag = f'"{paramFileStats.st_ino:x}-{paramFileStats.st_size:x}-{paramFileStats.st_mtime_ns:x}"'
+        return entityTag, self.getHttpDateFromTimestamp( paramFileStats.st_mtime )
 
+    def getCachedFile( self, paramSourceFile: str ):
+        # Give back the file content with its validators from memory - read it only if new or changed on disk.
+        # None if the file does not exist or is too big for the cache.
         try:
-            # Example: os.stat_result(st_mode=, st_ino=, st_dev=, st_nlink=, st_uid=, st_gid=, st_size=, st_atime=, st_mtime=, st_ctime=)
-
-            # Switch between directoryInfo and fileInfo
-            tmpSwitcher = None
-            for elementDirectoryOrFile in osListdir( paramTargetDirectory ):
-                # Get the right directory
-                tmpFilePath = osPathJoin( paramTargetDirectory, elementDirectoryOrFile )
-                fileStats = osStat( tmpFilePath )
-                fileType = None
-                if statIsDir( fileStats.st_mode ):
-                    fileType = "DIR"
-                    tmpSwitcher = directoryInfo
-                elif statIsFile( fileStats.st_mode ):
-                    fileType = "FILE"
-                    tmpSwitcher = fileInfo
-                else:
-                    fileType = "UNKNOWN"
+            fileStats = osStat( paramSourceFile )
+        except OSError:
+            self.contentCache.remove( paramSourceFile )
+            return None
+        if statIsFile( fileStats.st_mode ) == False or self.contentCache.isCacheable( fileStats ) == False:
+            return None
 
-                tmpSwitcher.append( { "name": elementDirectoryOrFile, "type": fileType, "size": format(fileStats.st_size/1024, ".2f"), "creationDate": self.getDateTimeFromTimestamp( fileStats.st_ctime ), "modifiedDate": self.getDateTimeFromTimestamp( fileStats.st_atime ) } )
+        cachedFile = self.contentCache.lookup( paramSourceFile, fileStats )
+        if cachedFile != None:
+            return cachedFile
 
-            # give the combine info back
-            return directoryInfo + fileInfo
+        with open( paramSourceFile, "rb" ) as fileHandler:
+            # Validators from the opened file - so they fit to the read content also if the file changes right now
+            fileStats = osFstat( fileHandler.fileno() )
+            content = fileHandler.read( fileStats.st_size + 1 )
+        if len( content ) != fileStats.st_size:
+            # Written while reading - do not cache a half file
+            return None
+
+        cachedFile = CachedFile( content, fileStats, *self.getValidatorsFromStats( fileStats ) )
+        self.contentCache.store( paramSourceFile, cachedFile )
+        return cachedFile
+
+    def listDirectory( self, paramTargetDirectory: str, paramSortKey: str = "", paramDescending: bool = False ):
+        if self.checkExists( paramTargetDirectory ) == False:
+            print( "Error - Directory does not exists" )
+            return
+
+        try:
+            # give the combine info back: directories first, then files
+            if paramSortKey:
+                return self.directoryIndex.getSortedListing( paramTargetDirectory, paramSortKey, paramDescending )
+            return self.directoryIndex.getListing( paramTargetDirectory )
         except Exception as e:
             # no directories or files found
             print( f"Error: {repr(e)}" )
             return []
 
+    def notifyChanged( self, paramTarget: str ):
+        # The server wrote paramTarget by itself - the listing of its directory is not valid anymore
+        self.directoryIndex.invalidate( osPathDirname( paramTarget ) )
+
     def makeDirectory( self, paramTargetDirectory: str ):
         if self.checkExists( paramTargetDirectory ) == False:
             try:
@@ -98,15 +330,34 @@ class Filesystem:
         else:
             print( "Path already exists!" )
 
-    def removeDirectory( self, paramTargetDirectory: str, paramIsRecursive: bool = False ):
+    def removeDirectory( self, paramTargetDirectory: str, paramIsRecursive: bool = False, paramProgress = None ):
         if paramIsRecursive == False:
             try:
                 osRmdir( paramTargetDirectory )
             except:
                 print( "Directory can not be removed. It is not empty, yet!" )
                 return False
+            self.notifyChanged( paramTargetDirectory )
             return True
 
-        # Recursive
-        # ToDo: Delete directory with content - other directories or files
-        return False
+        # Recursive: directories and files inside first
+        try:
+            self.removeTree( paramTargetDirectory, paramProgress )
+        except OSError as e:
+            print( f"Error: {repr(e)}" )
+            return False
+        finally:
+            self.notifyChanged( paramTargetDirectory )
+        return True
+
+    def removeTree( self, paramTargetDirectory: str, paramProgress = None ):
+        # Symbolic links are removed and never followed
+        with osScandir( paramTargetDirectory ) as directoryEntries:
+            for entry in directoryEntries:
+                if entry.is_dir( follow_symlinks=False ):
+                    self.removeTree( entry.path, paramProgress )
+                else:
+                    osRemove( entry.path )
+                    if paramProgress != None:
+                        paramProgress( 0, 1 )
+        osRmdir( paramTargetDirectory )
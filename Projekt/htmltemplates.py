@@ -0,0 +1,20 @@
+# python default imports
+from string import Formatter
+
+class HtmlTemplate:
+    def __init__( self, paramTemplate: str ):
+        # Template with {name} fields like str.format ({{ and }} for a brace).
+        # The static text between the fields is encoded once - a render only joins ready bytes.
+        self.parts = []
+        for literalText, fieldName, _, _ in Formatter().parse( paramTemplate ):
+            self.parts.append( ( literalText.encode( 'utf-8' ), fieldName ) )
+
+    def render( self, **paramValues ):
+        # Values are text (encoded here) or ready bytes - they are not escaped, that is the job of the caller
+        renderedParts = []
+        for staticPart, fieldName in self.parts:
+            renderedParts.append( staticPart )
+            if fieldName != None:
+                fieldValue = paramValues[ fieldName ]
+                renderedParts.append( fieldValue if isinstance( fieldValue, bytes ) else str( fieldValue ).encode( 'utf-8' ) )
+        return b"".join( renderedParts )
@@ -0,0 +1,72 @@
+# Example URL: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Range
+# Example: Range: bytes=0-499, 1000-, -500
+
+def parseRangeHeader( paramRangeHeader: str, paramFileSize: int, paramMaxRanges: int = 16 ):
+    # Give back a sorted list of (firstByte, lastByte) tuples.
+    # None: header is unknown or broken and must be ignored (full 200 answer).
+    # Empty list: no range fits into the file (416 answer).
+    rangeUnit, _, rangeSpecifiers = paramRangeHeader.partition( "=" )
+    if rangeUnit.strip().lower() != "bytes" or rangeSpecifiers.strip() == "":
+        return None
+
+    byteRanges = []
+    for rangeSpecifier in rangeSpecifiers.split( "," ):
+        firstText, separator, lastText = rangeSpecifier.strip().partition( "-" )
+        if separator == "":
+            return None
+        try:
+            if firstText == "":
+                # Suffix: the last N bytes
+                suffixLength = int( lastText )
+                if suffixLength <= 0:
+                    continue
+                firstByte, lastByte = max( 0, paramFileSize - suffixLength ), paramFileSize - 1
+            else:
+                firstByte = int( firstText )
+                lastByte = int( lastText ) if lastText != "" else paramFileSize - 1
+                if lastText != "" and lastByte < firstByte:
+                    return None
+        except ValueError:
+            return None
+
+        if firstByte >= paramFileSize:
+            # Not satisfiable - maybe an other range is
+            continue
+        byteRanges.append( ( firstByte, min( lastByte, paramFileSize - 1 ) ) )
+
+    # Overlapping and touching ranges are merged - a client can not ask for the same bytes again and again
+    mergedRanges = mergeRanges( byteRanges )
+    if len( mergedRanges ) > paramMaxRanges:
+        # Too many pieces: the whole file is cheaper
+        return None
+    return mergedRanges
+
+def mergeRanges( paramByteRanges: list ):
+    # Give back a sorted list of (firstByte, lastByte) tuples - overlapping and touching ranges are one
+    mergedRanges = []
+    for firstByte, lastByte in sorted( paramByteRanges ):
+        if mergedRanges and firstByte <= mergedRanges[ -1 ][ 1 ] + 1:
+            mergedRanges[ -1 ] = ( mergedRanges[ -1 ][ 0 ], max( mergedRanges[ -1 ][ 1 ], lastByte ) )
+        else:
+            mergedRanges.append( ( firstByte, lastByte ) )
+    return mergedRanges
+
+# Example URL: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Content-Range
+# Example: Content-Range: bytes 200-1000/67589
+
+def parseContentRange( paramContentRange: str ):
+    # Give back ( firstByte, lastByte, completeLength ) or None if the header is broken.
+    # An unknown complete length ("*") is given back as None.
+    rangeUnit, _, rangeText = paramContentRange.strip().partition( " " )
+    byteRange, separator, lengthText = rangeText.strip().partition( "/" )
+    firstText, rangeSeparator, lastText = byteRange.partition( "-" )
+    if rangeUnit.lower() != "bytes" or separator == "" or rangeSeparator == "":
+        return None
+    if firstText.isdigit() == False or lastText.isdigit() == False or ( lengthText != "*" and lengthText.isdigit() == False ):
+        return None
+
+    firstByte, lastByte = int( firstText ), int( lastText )
+    completeLength = None if lengthText == "*" else int( lengthText )
+    if lastByte < firstByte or ( completeLength != None and lastByte >= completeLength ):
+        return None
+    return ( firstByte, lastByte, completeLength )
@@ -0,0 +1,79 @@
+# python default imports
+from urllib.parse import parse_qsl, unquote
+
+# Example request header:
+# GET /list?offset=0&sort=name HTTP/1.1\r\nHost: 192.168.0.1:8443\r\nAccept-Encoding: gzip\r\n\r\n
+
+class HttpRequest:
+    def __init__( self, paramMethod: str, paramTarget: str, paramHttpVersion: str, paramHeaders: dict ):
+        self.method = paramMethod
+        self.target = paramTarget
+        self.httpVersion = paramHttpVersion
+        # Header names are lower case - one dictionary lookup instead of a search through all lines
+        self.headers = paramHeaders
+
+        # The path is URL-decoded, the query string is split into (name, value) pairs and decoded, too.
+        # A value may have a '=' inside and a name may come more than once (queryFields keeps all of them).
+        path, _, self.queryString = paramTarget.partition( "?" )
+        self.path = unquote( path )
+        self.queryFields = parse_qsl( self.queryString, keep_blank_values=True )
+        self.query = dict( self.queryFields )
+
+        # The form of a POST body - set by setBody if the route reads the body
+        self.body = b""
+        self.formFields = []
+        self.form = {}
+
+    def getHeader( self, paramName: str, paramDefault: str = "" ):
+        return self.headers.get( paramName.lower(), paramDefault )
+
+    def getContentLength( self ):
+        # None if there is no (valid) Content-Length
+        contentLength = self.headers.get( "content-length", "" )
+        return int( contentLength ) if contentLength.isdigit() else None
+
+    def setBody( self, paramBody: bytes ):
+        # application/x-www-form-urlencoded: Example: FilePath=a%3Db.txt&Target=folder%2Fnew.txt
+        self.body = paramBody
+        self.formFields = parse_qsl( paramBody.decode( 'utf-8', 'replace' ), keep_blank_values=True )
+        self.form = dict( self.formFields )
+
+def parseRequest( paramRequestHeader: bytes, paramMaxHeaderCount: int = 100 ):
+    # One pass over the header bytes (with the empty line at the end) - gives back a HttpRequest.
+    # ValueError: broken request line, header line, too many header lines or a body length that is not exactly known (answer 400 and close).
+    headerLines = paramRequestHeader.split( b"\r\n" )
+    requestLine = headerLines[ 0 ].split( b" " )
+    if len( requestLine ) != 3 or requestLine[ 2 ].startswith( b"HTTP/" ) == False or requestLine[ 0 ].isalpha() == False:
+        raise ValueError( f"Broken request line {repr( headerLines[ 0 ][ :100 ] )}" )
+    method, target, httpVersion = ( requestPart.decode( 'latin-1' ) for requestPart in requestLine )
+
+    headers = {}
+    headerCount = 0
+    for headerLine in headerLines[ 1: ]:
+        if headerLine == b"":
+            continue
+        headerCount += 1
+        if headerCount > paramMaxHeaderCount:
+            raise ValueError( f"More than {paramMaxHeaderCount} header lines" )
+        name, separator, value = headerLine.partition( b":" )
+        # No space in or before the name and no folded lines (RFC 9112) - otherwise two servers could read two different requests
+        if separator == b"" or name == b"" or name != name.strip() or b" " in name or b"\t" in name:
+            raise ValueError( f"Broken header line {repr( headerLine[ :100 ] )}" )
+        name = name.decode( 'latin-1' ).lower()
+        value = value.strip().decode( 'latin-1' )
+        if name in headers:
+            # A header that comes more than once is one list
+            if name in ( "content-length", "host" ):
+                raise ValueError( f"Header {name} more than once" )
+            headers[ name ] = f"{headers[ name ]}, {value}"
+        else:
+            headers[ name ] = value
+
+    # The body ends only after Content-Length bytes. Transfer-Encoding (chunked) is not read by any route:
+    # its body would be taken as the next request - and a proxy in front could see an other request than this server.
+    if "transfer-encoding" in headers:
+        raise ValueError( f"Transfer-Encoding {headers[ 'transfer-encoding' ][ :100 ]} is not supported" )
+    contentLength = headers.get( "content-length" )
+    if contentLength != None and ( contentLength.isascii() == False or contentLength.isdigit() == False ):
+        raise ValueError( f"Broken Content-Length {repr( contentLength[ :100 ] )}" )
+    return HttpRequest( method, target, httpVersion, headers )
@@ -0,0 +1,43 @@
+class Route:
+    def __init__( self, paramPath: str, paramHandler, paramReadBody: bool ):
+        # paramPath: the registered path (also the name in the metrics)
+        # paramHandler( clientSocket, request )
+        # paramReadBody: the form body of a POST is read before the handler is called (False: the handler streams it itself)
+        self.path = paramPath
+        self.handler = paramHandler
+        self.readBody = paramReadBody
+
+class RoutingTable:
+    def __init__( self ):
+        # Exact path: one dictionary lookup - { path: { method: Route } }
+        self.routes = {}
+        # Path with something behind it (Example: /jobs/<id>) - the longest prefix first
+        self.prefixRoutes = []
+        # All methods that any route knows
+        self.methods = set()
+
+    def addRoute( self, paramMethods: tuple, paramPath: str, paramHandler, paramPrefix: bool = False, paramReadBody: bool = True ):
+        # Example: addRoute( ( 'GET', 'POST' ), '/list', self.serveList )
+        if paramPrefix:
+            for prefixPath, methodRoutes in self.prefixRoutes:
+                if prefixPath == paramPath:
+                    break
+            else:
+                methodRoutes = {}
+                self.prefixRoutes.append( ( paramPath, methodRoutes ) )
+                self.prefixRoutes.sort( key=lambda prefixRoute: len( prefixRoute[ 0 ] ), reverse=True )
+        else:
+            methodRoutes = self.routes.setdefault( paramPath, {} )
+
+        for method in paramMethods:
+            methodRoutes[ method ] = Route( paramPath, paramHandler, paramReadBody )
+            self.methods.add( method )
+
+    def findRoute( self, paramMethod: str, paramPath: str ):
+        # Give back ( Route or None, True if the path is known with an other method )
+        methodRoutes = self.routes.get( paramPath )
+        if methodRoutes == None:
+            methodRoutes = next( ( prefixRoutes for prefixPath, prefixRoutes in self.prefixRoutes if paramPath.startswith( prefixPath ) ), None )
+            if methodRoutes == None:
+                return ( None, False )
+        return ( methodRoutes.get( paramMethod ), True )
@@ -0,0 +1,169 @@
+# python default imports
+from bisect import bisect_left
+from cProfile import Profile
+from io import StringIO
+from pstats import Stats
+from threading import Lock
+
+# Example URL: https://prometheus.io/docs/instrumenting/exposition_formats/
+# Example: webserver_requests_total{route="/list",method="GET",code="200"} 42
+
+# Upper bounds in seconds (request time, TLS handshake) and in bytes per second (transfers)
+latencyBuckets = ( 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0 )
+throughputBuckets = ( 131072, 1048576, 10485760, 52428800, 104857600, 262144000, 524288000, 1073741824, 4294967296 )
+
+# A request that moved less bytes says nothing about the throughput
+throughputMinBytes = 1048576
+
+def formatLabels( paramLabels: dict ):
+    # Example: {route="/list",method="GET"} - backslash, quote and newline are escaped
+    if not paramLabels:
+        return ""
+    labelTexts = []
+    for name, value in paramLabels.items():
+        value = str( value ).replace( "\\", "\\\\" ).replace( '"', '\\"' ).replace( "\n", "\\n" )
+        labelTexts.append( f'{name}="{value}"' )
+    return "{" + ",".join( labelTexts ) + "}"
+
+class Histogram:
+    def __init__( self, paramBuckets: tuple ):
+        # One counter per bucket (not cumulative, that is done by render) and one for +Inf
+        self.buckets = paramBuckets
+        self.counts = [ 0 ] * ( len( paramBuckets ) + 1 )
+        self.sum = 0.0
+        self.count = 0
+
+    def observe( self, paramValue: float ):
+        self.counts[ bisect_left( self.buckets, paramValue ) ] += 1
+        self.sum += paramValue
+        self.count += 1
+
+    def render( self, paramName: str, paramLabels: dict ):
+        lines = []
+        cumulativeCount = 0
+        for upperBound, bucketCount in zip( self.buckets + ( "+Inf", ), self.counts ):
+            cumulativeCount += bucketCount
+            lines.append( f"{paramName}_bucket{formatLabels( { **paramLabels, 'le': upperBound } )} {cumulativeCount}" )
+        lines.append( f"{paramName}_sum{formatLabels( paramLabels )} {self.sum}" )
+        lines.append( f"{paramName}_count{formatLabels( paramLabels )} {self.count}" )
+        return lines
+
+class Metrics:
+    def __init__( self ):
+        # Everything of this process - every pre-forked worker has its own numbers (Prometheus adds them up)
+        self.lock = Lock()
+
+        # Requests: ( route, method, code ) -> count; per route the time and the bytes in and out
+        self.requests = {}
+        self.requestSeconds = {}
+        self.bytesSent = {}
+        self.bytesReceived = {}
+
+        # Throughput of big downloads and uploads
+        self.throughput = { "download": Histogram( throughputBuckets ), "upload": Histogram( throughputBuckets ) }
+
+        # Connections and TLS handshakes
+        self.handshakeSeconds = Histogram( latencyBuckets )
+        self.activeConnections = 0
+        self.connections = 0
+        self.rejectedConnections = 0
+
+    def connectionOpened( self ):
+        with self.lock:
+            self.activeConnections += 1
+            self.connections += 1
+
+    def connectionClosed( self ):
+        with self.lock:
+            self.activeConnections -= 1
+
+    def connectionRejected( self ):
+        with self.lock:
+            self.rejectedConnections += 1
+
+    def observeHandshake( self, paramSeconds: float ):
+        with self.lock:
+            self.handshakeSeconds.observe( paramSeconds )
+
+    def observeRequest( self, paramRoute: str, paramMethod: str, paramCode: int, paramSeconds: float, paramBytesSent: int, paramBytesReceived: int ):
+        # paramRoute is the registered path (Example: /jobs/ and not /jobs/<id>) - so the number of series stays small
+        with self.lock:
+            requestKey = ( paramRoute, paramMethod, paramCode )
+            self.requests[ requestKey ] = self.requests.get( requestKey, 0 ) + 1
+            if paramRoute not in self.requestSeconds:
+                self.requestSeconds[ paramRoute ] = Histogram( latencyBuckets )
+            self.requestSeconds[ paramRoute ].observe( paramSeconds )
+            self.bytesSent[ paramRoute ] = self.bytesSent.get( paramRoute, 0 ) + paramBytesSent
+            self.bytesReceived[ paramRoute ] = self.bytesReceived.get( paramRoute, 0 ) + paramBytesReceived
+            if paramSeconds > 0:
+                if paramBytesSent >= throughputMinBytes:
+                    self.throughput[ "download" ].observe( paramBytesSent / paramSeconds )
+                if paramBytesReceived >= throughputMinBytes:
+                    self.throughput[ "upload" ].observe( paramBytesReceived / paramSeconds )
+
+    def render( self, paramMoreMetrics: list = () ):
+        # Prometheus text format. paramMoreMetrics: ( name, type, help, [ ( labels, value ) ] ) from other parts (TLS, cache, ...)
+        lines = []
+        def addMetric( paramName: str, paramType: str, paramHelp: str, paramSamples ):
+            lines.append( f"# HELP {paramName} {paramHelp}" )
+            lines.append( f"# TYPE {paramName} {paramType}" )
+            for labels, value in paramSamples:
+                lines.append( f"{paramName}{formatLabels( labels )} {value}" )
+
+        with self.lock:
+            addMetric( "webserver_requests_total", "counter", "Requests by route, method and status code.",
+                       ( ( { "route": route, "method": method, "code": code }, count ) for ( route, method, code ), count in sorted( self.requests.items(), key=str ) ) )
+            lines.append( "# HELP webserver_request_duration_seconds Time from the complete request header to the end of the answer." )
+            lines.append( "# TYPE webserver_request_duration_seconds histogram" )
+            for route, histogram in sorted( self.requestSeconds.items() ):
+                lines.extend( histogram.render( "webserver_request_duration_seconds", { "route": route } ) )
+            addMetric( "webserver_sent_bytes_total", "counter", "Bytes sent to the clients (header and body).", ( ( { "route": route }, value ) for route, value in sorted( self.bytesSent.items() ) ) )
+            addMetric( "webserver_received_bytes_total", "counter", "Bytes received from the clients (header and body).", ( ( { "route": route }, value ) for route, value in sorted( self.bytesReceived.items() ) ) )
+            lines.append( f"# HELP webserver_transfer_bytes_per_second Throughput of downloads and uploads with at least {throughputMinBytes} bytes." )
+            lines.append( "# TYPE webserver_transfer_bytes_per_second histogram" )
+            for direction, histogram in self.throughput.items():
+                lines.extend( histogram.render( "webserver_transfer_bytes_per_second", { "direction": direction } ) )
+            lines.append( "# HELP webserver_tls_handshake_duration_seconds Time of the successful TLS handshakes." )
+            lines.append( "# TYPE webserver_tls_handshake_duration_seconds histogram" )
+            lines.extend( self.handshakeSeconds.render( "webserver_tls_handshake_duration_seconds", {} ) )
+            addMetric( "webserver_active_connections", "gauge", "Connections that are served now.", ( ( {}, self.activeConnections ), ) )
+            addMetric( "webserver_connections_total", "counter", "Accepted connections.", ( ( {}, self.connections ), ) )
+            addMetric( "webserver_rejected_connections_total", "counter", "Connections closed at once (too many from one IP address).", ( ( {}, self.rejectedConnections ), ) )
+
+        for name, metricType, helpText, samples in paramMoreMetrics:
+            addMetric( name, metricType, helpText, samples )
+        return "\n".join( lines ) + "\n"
+
+class RequestProfiler:
+    def __init__( self ):
+        # cProfile of the requests, added up per route. Only one request is profiled at the same time,
+        # the others run without profiler - so it is a sample and the server is not much slower.
+        self.profilerLock = Lock()
+        self.statsLock = Lock()
+        self.routeStats = {}
+
+    def run( self, paramRoute: str, paramFunction, *paramArguments ):
+        if self.profilerLock.acquire( blocking=False ) == False:
+            return paramFunction( *paramArguments )
+        profiler = Profile()
+        try:
+            return profiler.runcall( paramFunction, *paramArguments )
+        finally:
+            self.profilerLock.release()
+            with self.statsLock:
+                if paramRoute in self.routeStats:
+                    self.routeStats[ paramRoute ].add( profiler )
+                else:
+                    self.routeStats[ paramRoute ] = Stats( profiler )
+
+    def getReport( self, paramRoute: str = None, paramLimit: int = 40 ):
+        # Text: the functions with the most cumulative time - one route or all routes
+        report = StringIO()
+        with self.statsLock:
+            for route, routeStats in sorted( self.routeStats.items() ):
+                if paramRoute != None and route != paramRoute:
+                    continue
+                report.write( f"===== {route} =====\n" )
+                routeStats.stream = report
+                routeStats.sort_stats( "cumulative" ).print_stats( paramLimit )
+        return report.getvalue()
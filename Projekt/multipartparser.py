@@ -0,0 +1,114 @@
+# python default imports
+from re import compile as reCompile
+
+# Example: form-data; name="Filename"; filename="my file.txt"
+headerParameterPattern = reCompile( r';\s*([^=;\s]+)\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;]*))' )
+
+def parseHeaderParameters( paramHeaderValue: str ):
+    # Give back the main value and a dictionary of all parameters behind it
+    mainValue = paramHeaderValue.split( ";", 1 )[ 0 ].strip().lower()
+    parameters = {}
+    for match in headerParameterPattern.finditer( paramHeaderValue ):
+        name, quotedValue, plainValue = match.groups()
+        parameters[ name.lower() ] = quotedValue.replace( '\\"', '"' ) if quotedValue is not None else plainValue.strip()
+    return mainValue, parameters
+
+class MultipartParser:
+    def __init__( self, paramClientSocket, paramBoundary: str, paramContentLength: int, paramChunkSize: int = 262144, paramMaxPartHeaderSize: int = 16384 ):
+        # Reads a multipart/form-data body piece by piece from the connection.
+        # Never more than Content-Length bytes are read, so a following (pipelined) request stays untouched.
+        self.clientSocket = paramClientSocket
+        self.delimiter = b"\r\n--" + paramBoundary.encode( 'latin-1' )
+        self.remaining = paramContentLength
+        self.chunkSize = paramChunkSize
+        self.maxPartHeaderSize = paramMaxPartHeaderSize
+
+        # The body begins direct with "--boundary" - prefix a CRLF so that every delimiter looks the same
+        self.buffer = bytearray( b"\r\n" )
+        self.finished = False
+        self.started = False
+
+    def fill( self ):
+        # Read the next piece of the body; False if the whole body is already read
+        if self.remaining <= 0:
+            return False
+        chunk = self.clientSocket.recv( min( self.chunkSize, self.remaining ) )
+        if not chunk:
+            raise ConnectionError( "Client closed the connection during the upload" )
+        self.remaining -= len( chunk )
+        self.buffer.extend( chunk )
+        return True
+
+    def skipToDelimiter( self ):
+        # Throw away everything before the next delimiter (the preamble before the first part)
+        while ( position := self.buffer.find( self.delimiter ) ) == -1:
+            del self.buffer[ :max( 0, len( self.buffer ) - len( self.delimiter ) + 1 ) ]
+            if self.fill() == False:
+                raise ValueError( "Multipart boundary not found" )
+        del self.buffer[ :position + len( self.delimiter ) ]
+
+    def nextPart( self ):
+        # Give back the headers (lowercase names) of the next part or None after the last part
+        if self.finished:
+            return None
+        if self.started == False:
+            self.skipToDelimiter()
+            self.started = True
+
+        # Behind a delimiter follows "--" for the end or CRLF for a new part
+        while len( self.buffer ) < 2:
+            if self.fill() == False:
+                raise ValueError( "Multipart body is truncated" )
+        if self.buffer[ :2 ] == b"--":
+            self.finished = True
+            self.drain()
+            return None
+
+        while ( position := self.buffer.find( b"\r\n\r\n" ) ) == -1:
+            if len( self.buffer ) > self.maxPartHeaderSize:
+                raise ValueError( "Multipart part header too large" )
+            if self.fill() == False:
+                raise ValueError( "Multipart body is truncated" )
+
+        partHeaders = {}
+        for headerLine in self.buffer[ 2:position ].decode( 'utf-8', 'replace' ).split( "\r\n" ):
+            if ":" in headerLine:
+                name, value = headerLine.split( ":", 1 )
+                partHeaders[ name.strip().lower() ] = value.strip()
+        del self.buffer[ :position + 4 ]
+        return partHeaders
+
+    def streamPart( self, paramWriter ):
+        # Give the part data piece by piece to paramWriter until the next delimiter. The delimiter may be cut
+        # between two chunks, so the last len(delimiter)-1 bytes stay in the buffer until more data is there.
+        written = 0
+        while ( position := self.buffer.find( self.delimiter ) ) == -1:
+            safeLength = len( self.buffer ) - len( self.delimiter ) + 1
+            if safeLength > 0:
+                paramWriter( self.buffer[ :safeLength ] )
+                written += safeLength
+                del self.buffer[ :safeLength ]
+            if self.fill() == False:
+                raise ValueError( "Multipart body is truncated" )
+
+        if position > 0:
+            paramWriter( self.buffer[ :position ] )
+            written += position
+        del self.buffer[ :position + len( self.delimiter ) ]
+        return written
+
+    def readPart( self, paramMaxSize: int = 65536 ):
+        # Small form fields are given back as bytes
+        data = bytearray()
+        def collect( paramData ):
+            if len( data ) + len( paramData ) > paramMaxSize:
+                raise ValueError( "Multipart form field too large" )
+            data.extend( paramData )
+        self.streamPart( collect )
+        return bytes( data )
+
+    def drain( self ):
+        # Read the epilogue behind the last boundary, the connection is then ready for the next request
+        self.buffer.clear()
+        while self.fill():
+            self.buffer.clear()
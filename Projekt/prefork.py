@@ -0,0 +1,121 @@
+# python default imports
+from os import fork as osFork, wait as osWait, kill as osKill, _exit as osExit, getpid as osGetpid
+from signal import signal, setitimer, SIGINT, SIGTERM, SIGHUP, SIGALRM, ITIMER_REAL, default_int_handler
+from time import time, sleep
+
+# my own python imports
+from webserver import WebServer
+from tlscontext import createSslContext
+
+class PreforkServer:
+    def __init__( self, paramProcesses: int, paramReusePort: bool = False, paramTicketKeyLifetime: float = 43200.0, **paramServerArguments ):
+        print( f"Run PreforkServer with {paramProcesses} worker processes" )
+        self.processes = max( 1, paramProcesses )
+        self.reusePort = paramReusePort
+        self.serverArguments = paramServerArguments
+
+        # One TLS context for all workers: a session ticket of one worker is valid in all others.
+        # Rotation of the ticket keys: a new context here and the workers are replaced one after the other.
+        self.ticketKeyLifetime = paramTicketKeyLifetime
+        if self.serverArguments.get( "paramTls", True ):
+            self.serverArguments[ "paramSslContext" ] = createSslContext( self.serverArguments.get( "paramCert", "cert.pem" ), self.serverArguments.get( "paramKey", "key.pem" ), self.serverArguments.get( "paramDH", "dhparam.pem" ) )
+
+        # Inherited socket: bind once here and every worker gets a copy of the listening socket with fork().
+        # Reuse port: every worker binds its own socket and the kernel balances the connections between them.
+        self.webService = None
+        if self.reusePort == False:
+            self.webService = WebServer( **self.serverArguments )
+
+        # Worker process id -> start time (needed to slow down a restart loop of a broken worker)
+        self.workerPids = {}
+        self.running = False
+
+    def serveForever( self ):
+        self.running = True
+        signal( SIGINT, self.stopWorkers )
+        signal( SIGTERM, self.stopWorkers )
+
+        for _ in range( self.processes ):
+            self.startWorker()
+
+        if self.ticketKeyLifetime > 0 and "paramSslContext" in self.serverArguments:
+            signal( SIGALRM, self.rotateTicketKeys )
+            setitimer( ITIMER_REAL, self.ticketKeyLifetime, self.ticketKeyLifetime )
+
+        # Supervise: wait for dying workers and start a new one as long as no Ctrl+C was hit
+        while self.workerPids:
+            try:
+                workerPid, workerStatus = osWait()
+            except ChildProcessError:
+                break
+
+            startTime = self.workerPids.pop( workerPid, None )
+            if startTime is None or self.running == False:
+                continue
+
+            print( f"Error: Worker {workerPid} died with status {workerStatus} - restart" )
+            if time() - startTime < 1:
+                # Crashes directly after the start - do not burn the CPU with fork()
+                sleep( 1 )
+            if self.running:
+                self.startWorker()
+
+        setitimer( ITIMER_REAL, 0 )
+        print( "All workers stopped" )
+
+    def startWorker( self ):
+        workerPid = osFork()
+        if workerPid != 0:
+            self.workerPids[ workerPid ] = time()
+            return
+
+        # Child process: Ctrl+C and SIGTERM end the serve loop like a Ctrl+C in the single process mode
+        signal( SIGINT, default_int_handler )
+        signal( SIGTERM, default_int_handler )
+        # SIGHUP: replaced by a new worker - no new clients, but the running requests are finished
+        signal( SIGHUP, self.retireWorker )
+        exitCode = 0
+        try:
+            if self.webService == None:
+                self.webService = WebServer( **self.serverArguments, paramReusePort=True )
+            elif "paramSslContext" in self.serverArguments:
+                # Inherited socket: the server object is from the parent, the context maybe newer
+                self.webService.sslContext = self.serverArguments[ "paramSslContext" ]
+            print( f"Worker {osGetpid()} started" )
+            self.webService.serveForever()
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print( f"Error: Worker {osGetpid()} {repr(e)}" )
+            exitCode = 1
+        # Never return into the supervisor loop of the parent
+        osExit( exitCode )
+
+    def retireWorker( self, paramSignal: int, paramFrame ):
+        self.webService.drainOnStop = True
+        raise KeyboardInterrupt()
+
+    def rotateTicketKeys( self, paramSignal: int, paramFrame ):
+        # New ticket keys for new workers. Tickets of the old keys end in a full handshake - nothing else changes for the client.
+        if self.running == False:
+            return
+        print( "Rotate TLS session ticket keys - replace the workers" )
+        self.serverArguments[ "paramSslContext" ] = createSslContext( self.serverArguments.get( "paramCert", "cert.pem" ), self.serverArguments.get( "paramKey", "key.pem" ), self.serverArguments.get( "paramDH", "dhparam.pem" ) )
+        for workerPid in list( self.workerPids ):
+            # The old worker is not started again when it ends (see serveForever)
+            self.workerPids.pop( workerPid )
+            self.startWorker()
+            try:
+                osKill( workerPid, SIGHUP )
+            except ProcessLookupError:
+                pass
+
+    def stopWorkers( self, paramSignal: int, paramFrame ):
+        if self.running:
+            print( "Keyboard interrupt: Ctrl+C - stop all workers" )
+        self.running = False
+        for workerPid in list( self.workerPids ):
+            try:
+                osKill( workerPid, SIGTERM )
+            except ProcessLookupError:
+                pass
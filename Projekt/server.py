@@ -1,4 +1,5 @@
-from webserver import WebServer
+from webserver import WebServer, ServerMode
+from prefork import PreforkServer
 
 # change this IP-Address if it not only local.
 webServerIpAddress = "127.0.0.1"
@@ -6,15 +7,63 @@ webServerIpAddress = "127.0.0.1"
 # Change to your favourite port.
 webServerPort = 8443
 
+# Serving engine: ServerMode.SERIAL, ServerMode.THREADPOOL or ServerMode.ASYNCIO
+webServerMode = ServerMode.THREADPOOL
+
+# How many clients are served at the same time and how many may wait for a free worker.
+webServerWorkers = 32
+webServerBacklog = 128
+
+# More than 1 process: pre-fork worker processes to use all CPU cores (Linux only).
+# Reuse port: every worker binds the port by itself (SO_REUSEPORT) instead of sharing the inherited socket.
+webServerProcesses = 1
+webServerReusePort = False
+
+# False only behind a TLS terminating proxy: plaintext downloads are sent zero-copy with sendfile.
+webServerTls = True
+
+# Slow clients: the TLS handshake and the request header must be complete in this time, a running upload/download may be idle that long.
+# One IP address may hold only this many connections at the same time (0: no limit).
+webServerHandshakeTimeout = 10.0
+webServerHeaderTimeout = 20.0
+webServerClientTimeout = 30.0
+webServerMaxConnectionsPerIp = 8
+
+# TLS session ticket keys are made new after this many seconds (old tickets then need one full handshake).
+webServerTicketKeyLifetime = 43200.0
+
+# True: the same content of all users is stored only once (user files are hard links to ./wwwdata/blobs).
+# Single-tenant only: who knows the SHA-256 and size of any stored file gets it without upload.
+webServerDeduplicate = False
+
+# Metrics are always on: https://your-ip-address:8443/metrics (Prometheus). Access log: a file for one JSON line per request (None: off).
+# Profile: cProfile of the requests, the result at /metrics/profile - costs time, only to find a slow spot.
+webServerAccessLog = None
+webServerProfile = False
+
+# Bandwidth in bytes per second for each direction (0: no limit): for the whole server, per user (IP address) and per connection.
+# Only big downloads, archives and uploads wait - they share the bandwidth fairly, pages and small files go out at once.
+webServerBandwidthGlobal = 0
+webServerBandwidthUser = 0
+webServerBandwidthConnection = 0
+
+# Resumable uploads: the biggest file in bytes that one upload session may announce (0: only limited by the free disk space).
+webServerMaxUploadSize = 0
+
+webServerArguments = { "paramHost": webServerIpAddress, "paramPort": webServerPort, "paramMode": webServerMode, "paramWorkers": webServerWorkers, "paramBacklog": webServerBacklog, "paramTls": webServerTls, "paramDeduplicate": webServerDeduplicate,
+                       "paramHandshakeTimeout": webServerHandshakeTimeout, "paramHeaderTimeout": webServerHeaderTimeout, "paramClientTimeout": webServerClientTimeout, "paramMaxConnectionsPerIp": webServerMaxConnectionsPerIp,
+                       "paramAccessLog": webServerAccessLog, "paramProfile": webServerProfile,
+                       "paramBandwidthGlobal": webServerBandwidthGlobal, "paramBandwidthUser": webServerBandwidthUser, "paramBandwidthConnection": webServerBandwidthConnection,
+                       "paramMaxUploadSize": webServerMaxUploadSize }
+
 # Create a new object from my own created class.
-webService = WebServer( webServerIpAddress, webServerPort )
+if webServerProcesses > 1:
+    webService = PreforkServer( webServerProcesses, webServerReusePort, webServerTicketKeyLifetime, **webServerArguments )
+else:
+    webService = WebServer( **webServerArguments, paramTicketKeyLifetime=webServerTicketKeyLifetime )
 
-while True:
-    # Listen for incoming connections, again..again or it is Ctrl+C hitting!
-    if webService.listen() == 3:
-        break
+# Listen for incoming connections, again..again or it is Ctrl+C hitting!
+webService.serveForever()
 
 # Destroy the created class to save the memory from usedspace of the object.
 del webService
-
-
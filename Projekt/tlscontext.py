@@ -0,0 +1,43 @@
+# python default imports
+import ssl
+from os.path import exists as osPathExists
+from ssl import SSLContext, PROTOCOL_TLS_SERVER, OP_NO_TLSv1, OP_NO_TLSv1_1, OP_NO_SSLv2, OP_NO_SSLv3, OP_NO_TICKET
+
+def createSslContext( paramCert: str = "cert.pem", paramKey: str = "key.pem", paramDH: str = "dhparam.pem", paramTickets: int = 2 ):
+    # One context for all connections (and all pre-forked worker processes that are forked after it).
+    # The session ticket keys are made by OpenSSL with the context: same context - a ticket of one worker works in every worker.
+    # A new context is a new key (rotation), old tickets end in a normal full handshake.
+    sslContext = SSLContext( PROTOCOL_TLS_SERVER )
+    sslContext.load_cert_chain( certfile=paramCert, keyfile=paramKey )
+
+    # For a better security like a apache2-web-server
+    if osPathExists( paramDH ):
+        # Cipher Suites: Diffie-Hellman and Elliptic-Curve key transfer
+        sslContext.set_ciphers( "ECDHE+AESGCM:ECDHE+CHACHA20:ECDHE+SHA256" )
+
+        # ECDHE-Curve: X25519 is the fastest, prime256v1 for old clients.
+        # set_ecdh_curve( "prime256v1" ) allowed only one curve - the OpenSSL default list starts already with X25519, prime256v1.
+        if hasattr( sslContext, "set_groups" ):
+            sslContext.set_groups( "X25519:prime256v1" )
+
+        # Diffie-Hellman
+        sslContext.load_dh_params( paramDH )
+
+        # disable unsecure protocols
+        sslContext.options |= OP_NO_TLSv1
+        sslContext.options |= OP_NO_TLSv1_1
+        sslContext.options |= OP_NO_SSLv2
+        sslContext.options |= OP_NO_SSLv3
+
+    # Session resumption: a returning client skips the full handshake.
+    # TLS 1.3 and TLS 1.2 with session tickets, TLS 1.2 also with the session cache of the context.
+    sslContext.options &= ~OP_NO_TICKET
+    sslContext.num_tickets = paramTickets
+
+    # Kernel TLS: let the kernel encrypt, so downloads can use sendfile also with TLS (where supported)
+    if hasattr( ssl, "OP_ENABLE_KTLS" ):
+        sslContext.options |= ssl.OP_ENABLE_KTLS
+
+    # Only HTTP/1.1 is spoken - a client asking for h2 knows it at once and does not try
+    sslContext.set_alpn_protocols( [ "http/1.1" ] )
+    return sslContext
@@ -0,0 +1,131 @@
+# python default imports
+import json
+from os import open as osOpen, statvfs as osStatvfs, close as osClose, pwrite as osPwrite, write as osWrite, truncate as osTruncate, remove as osRemove, replace as osReplace, makedirs as osMakedirs, listdir as osListdir, stat as osStat, O_WRONLY, O_CREAT, O_EXCL, O_APPEND
+from os.path import join as osPathJoin
+from re import compile as reCompile
+from time import time
+from uuid import uuid4
+
+# my own python imports
+from httprange import mergeRanges
+
+# Only ids made by the server - never a path
+sessionIdPattern = reCompile( r"[0-9a-f]{32}" )
+
+class UploadSessionManager:
+    def __init__( self, paramSessionDirectory: str = "./wwwdata/uploads", paramMaxAge: float = 86400.0, paramMaxSize: int = 0 ):
+        # Everything is stored on disk: sessions survive a restart and all pre-forked worker processes see the same state.
+        #   <id>.json   : filename, user and size of the upload
+        #   <id>.part   : the file itself, chunks are written at their offset
+        #   <id>.ranges : one line "first last" per received chunk, appended with O_APPEND (no lock needed)
+        self.sessionDirectory = paramSessionDirectory
+        self.maxAge = paramMaxAge
+        # The size of a session comes from the client: at most paramMaxSize bytes (0: no own limit) and never more than the free disk space
+        self.maxSize = paramMaxSize
+        osMakedirs( self.sessionDirectory, exist_ok=True )
+
+    def getSessionPath( self, paramSessionId: str, paramExtension: str ):
+        return osPathJoin( self.sessionDirectory, f"{paramSessionId}.{paramExtension}" )
+
+    def createSession( self, paramFilename: str, paramSize: int, paramUsername: str = "guest" ):
+        # None if the upload is too big
+        self.removeExpiredSessions()
+        if self.canStore( paramSize ) == False:
+            return None
+        sessionId = uuid4().hex
+        with open( self.getSessionPath( sessionId, "json" ), "x" ) as sessionHandler:
+            json.dump( { "filename": paramFilename, "size": paramSize, "username": paramUsername, "created": time() }, sessionHandler )
+
+        # Sparse file with the final size: every chunk can be written in any order
+        osClose( osOpen( self.getSessionPath( sessionId, "part" ), O_WRONLY | O_CREAT | O_EXCL, 0o644 ) )
+        osTruncate( self.getSessionPath( sessionId, "part" ), paramSize )
+        osClose( osOpen( self.getSessionPath( sessionId, "ranges" ), O_WRONLY | O_CREAT | O_EXCL, 0o644 ) )
+        return sessionId
+
+    def canStore( self, paramSize: int ):
+        if self.maxSize > 0 and paramSize > self.maxSize:
+            return False
+        # Blocks that an unprivileged process can still use
+        fileSystemStats = osStatvfs( self.sessionDirectory )
+        return paramSize <= fileSystemStats.f_bavail * fileSystemStats.f_frsize
+
+    def getSession( self, paramSessionId: str ):
+        # None if the id is unknown (or finalized, or expired)
+        if sessionIdPattern.fullmatch( paramSessionId ) == None:
+            return None
+        try:
+            with open( self.getSessionPath( paramSessionId, "json" ), "r" ) as sessionHandler:
+                return json.load( sessionHandler )
+        except ( OSError, ValueError ):
+            return None
+
+    def writeChunk( self, paramSessionId: str, paramOffset: int, paramReadChunk ):
+        # paramReadChunk() gives the next piece of the request body, b"" at the end.
+        # Give back the number of written bytes.
+        fileDescriptor = osOpen( self.getSessionPath( paramSessionId, "part" ), O_WRONLY )
+        writtenBytes = 0
+        try:
+            while chunk := paramReadChunk():
+                osPwrite( fileDescriptor, chunk, paramOffset + writtenBytes )
+                writtenBytes += len( chunk )
+        finally:
+            osClose( fileDescriptor )
+        return writtenBytes
+
+    def markReceived( self, paramSessionId: str, paramFirstByte: int, paramLastByte: int ):
+        # Only after the chunk is complete on disk - a broken chunk is never counted
+        rangesDescriptor = osOpen( self.getSessionPath( paramSessionId, "ranges" ), O_WRONLY | O_APPEND )
+        try:
+            osWrite( rangesDescriptor, f"{paramFirstByte} {paramLastByte}\n".encode( "ascii" ) )
+        finally:
+            osClose( rangesDescriptor )
+
+    def getReceivedRanges( self, paramSessionId: str ):
+        # Sorted and merged list of ( firstByte, lastByte )
+        receivedRanges = []
+        with open( self.getSessionPath( paramSessionId, "ranges" ), "r" ) as rangesHandler:
+            for rangeLine in rangesHandler:
+                firstText, _, lastText = rangeLine.strip().partition( " " )
+                if firstText.isdigit() and lastText.isdigit():
+                    receivedRanges.append( ( int( firstText ), int( lastText ) ) )
+        return mergeRanges( receivedRanges )
+
+    def getStatus( self, paramSessionId: str, paramSession: dict ):
+        receivedRanges = self.getReceivedRanges( paramSessionId )
+        missingRanges = []
+        nextByte = 0
+        for firstByte, lastByte in receivedRanges:
+            if firstByte > nextByte:
+                missingRanges.append( ( nextByte, firstByte - 1 ) )
+            nextByte = max( nextByte, lastByte + 1 )
+        if nextByte < paramSession[ "size" ]:
+            missingRanges.append( ( nextByte, paramSession[ "size" ] - 1 ) )
+
+        return { "id": paramSessionId, "filename": paramSession[ "filename" ], "size": paramSession[ "size" ],
+                 "received": [ list( byteRange ) for byteRange in receivedRanges ], "missing": [ list( byteRange ) for byteRange in missingRanges ],
+                 "complete": len( missingRanges ) == 0 }
+
+    def finalizeSession( self, paramSessionId: str, paramTargetPath: str, paramStoreFile = osReplace ):
+        # Atomic: the user directory sees the file only complete (rename on the same filesystem).
+        # paramStoreFile( source, target ) can store it an other way (deduplicated).
+        paramStoreFile( self.getSessionPath( paramSessionId, "part" ), paramTargetPath )
+        self.removeSession( paramSessionId )
+
+    def removeSession( self, paramSessionId: str ):
+        for extension in ( "part", "ranges", "json" ):
+            try:
+                osRemove( self.getSessionPath( paramSessionId, extension ) )
+            except FileNotFoundError:
+                pass
+
+    def removeExpiredSessions( self ):
+        # Never finished uploads do not fill the disk forever (the ranges file changes with every chunk)
+        for sessionFilename in osListdir( self.sessionDirectory ):
+            sessionId, _, extension = sessionFilename.partition( "." )
+            if extension != "json":
+                continue
+            try:
+                if time() - osStat( self.getSessionPath( sessionId, "ranges" ) ).st_mtime > self.maxAge:
+                    self.removeSession( sessionId )
+            except FileNotFoundError:
+                self.removeSession( sessionId )
@@ -1,11 +1,66 @@
 # python default imports
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from functools import partial
+from html import escape as htmlEscape
+from re import compile as reCompile
+from stat import S_ISREG as statIsFile
 from enum import Enum
-from os.path import exists as osPathExists
-from socket import socket, AF_INET, SOCK_STREAM
-from ssl import SSLContext, PROTOCOL_TLS_SERVER, OP_NO_TLSv1, OP_NO_TLSv1_1, OP_NO_SSLv2, OP_NO_SSLv3
+from os import open as osOpen, write as osWrite, remove as osRemove, sendfile as osSendfile, O_WRONLY, O_CREAT, O_APPEND
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, SO_REUSEPORT
+from select import poll, POLLIN, POLLOUT
+from ssl import SSLContext, SSLError, SSLSocket, SSLWantReadError, SSLWantWriteError
+from threading import BoundedSemaphore, Lock, local as threadLocal
+from time import time, monotonic, perf_counter
+from urllib.parse import quote as urlQuote
+from uuid import uuid4
 
 # my own python imports
 from filesystem import Filesystem
+from clientconnection import ClientConnection
+from multipartparser import MultipartParser, parseHeaderParameters
+from httprange import parseRangeHeader, parseContentRange
+from chunkedwriter import ChunkedWriter
+from directoryindex import sortKeys
+from contentencoding import negotiateEncoding, isCompressible, compressBytes, CompressingWriter, getSidecarPath, sidecarExists, sidecarDirectory
+from archivestream import ArchiveFormat, archiveContentTypes, walkArchiveEntries, writeZip, writeTarGz
+from uploadsession import UploadSessionManager
+from filejobs import FileOperation, FileJobManager
+from tlscontext import createSslContext
+from htmltemplates import HtmlTemplate
+from httprequest import HttpRequest, parseRequest
+from httprouter import RoutingTable
+from metrics import Metrics, RequestProfiler
+from bandwidth import TransferDirection, TransferScheduler
+
+# Not in the ASCII filename of a header: control characters (CR/LF would start a new header), quote, backslash and non-ASCII
+unsafeHeaderCharacterPattern = reCompile( r'[^\x20-\x7e]|["\\]' )
+
+# A percent sequence in an already decoded name is a second encoding - never decoded, never accepted
+percentSequencePattern = reCompile( r"%[0-9A-Fa-f]{2}" )
+
+# Linux kernel TLS (linux/tls.h): the socket has a send key if getsockopt( SOL_TLS, TLS_TX ) works - Python has no names for them
+SOL_TLS = 282
+TLS_TX = 1
+
+class ServerMode(Enum):
+    # One client after the other - the old behaviour
+    SERIAL = 'serial'
+    # Accept in the main thread and serve every client in a worker thread
+    THREADPOOL = 'threadpool'
+    # Accept with an asyncio event loop and serve every client in a worker thread
+    ASYNCIO = 'asyncio'
+
+class SendPath(Enum):
+    # Plaintext listener: the kernel copies the file direct into the socket
+    SENDFILE = 'sendfile'
+    # Kernel TLS: the kernel encrypts and sends the file (needs ssl.OP_ENABLE_KTLS of Python 3.12+, an OpenSSL built with kTLS and the Linux tls module)
+    KTLS = 'ktls-sendfile'
+    # Userspace TLS: large reads into one reused buffer
+    BUFFERED = 'buffered'
 
 class PostForm(Enum):
     USERNAME = 'txtUsername'
@@ -14,13 +69,26 @@ class PostForm(Enum):
     RESET = 'btnReset'
     DOWNLOAD = 'FilePath'
     UPLOAD = 'Filename'
+    TARGET = 'Target'
+    OPERATION = 'Operation'
     ENCTYPEMULTIPART = 'multipart/form-data'
 
 class HtmlStatusCode(Enum):
     OK = "HTTP/1.1 200 OK\r\n"
+    CREATED = "HTTP/1.1 201 Created\r\n"
+    ACCEPTED = "HTTP/1.1 202 Accepted\r\n"
+    PARTIALCONTENT = "HTTP/1.1 206 Partial Content\r\n"
+    NOTMODIFIED = "HTTP/1.1 304 Not Modified\r\n"
+    BADREQUEST = "HTTP/1.1 400 Bad Request\r\n"
     FORBIDDEN = "HTTP/1.1 403 Forbidden\r\n"
     NOTFOUND = "HTTP/1.1 404 Not Found\r\n"
     CONFLICT = "HTTP/1.1 409 Conflict\r\n"
+    LENGTHREQUIRED = "HTTP/1.1 411 Length Required\r\n"
+    PAYLOADTOOLARGE = "HTTP/1.1 413 Content Too Large\r\n"
+    RANGENOTSATISFIABLE = "HTTP/1.1 416 Range Not Satisfiable\r\n"
+
+# Status lines are encoded once and not for every answer
+statusLines = { statusCode: statusCode.value.encode( 'ascii' ) for statusCode in HtmlStatusCode }
 
 class ContentType(Enum):
     OCTETSTREAM = 'application/octet-stream'
@@ -48,74 +116,379 @@ class ContentType(Enum):
     GZIP = 'application/gzip'
 
 class WebServer:
-    def __init__( self, paramHost: str, paramPort: int, paramCert: str = "cert.pem", paramKey: str = "key.pem", paramDH: str = "dhparam.pem" ):
-        print("Run WebServer")
-        # init filesystem
-        self.filesystemService = Filesystem()
+    def __init__( self, paramHost: str, paramPort: int, paramCert: str = "cert.pem", paramKey: str = "key.pem", paramDH: str = "dhparam.pem", paramMode: ServerMode = ServerMode.SERIAL, paramWorkers: int = 16, paramBacklog: int = 128, paramClientTimeout: float = 30.0, paramReusePort: bool = False, paramKeepAliveTimeout: float = 5.0, paramKeepAliveRequests: int = 100, paramMaxHeaderSize: int = 16384, paramTls: bool = True, paramDeduplicate: bool = False, paramSslContext: SSLContext = None, paramTicketKeyLifetime: float = 43200.0, paramHandshakeTimeout: float = 10.0, paramHeaderTimeout: float = 20.0, paramMaxConnectionsPerIp: int = 8, paramAccessLog: str = None, paramProfile: bool = False, paramBandwidthGlobal: float = 0, paramBandwidthUser: float = 0, paramBandwidthConnection: float = 0, paramMaxUploadSize: int = 0 ):
+        print( f"Run WebServer ({paramMode.value})" )
+        # init filesystem - deduplicated: same contents of all users are stored only once
+        self.filesystemService = Filesystem( paramDeduplicate=paramDeduplicate )
 
         # Needed for redirect method <meta ... refresh... />
         # Security risk if they fished from the HTML-Header from socket - it could manuipulated!
         self.host = paramHost
         self.port = paramPort
 
+        # Plaintext only behind a TLS terminating proxy - then downloads can use the zero-copy sendfile
+        self.tls = paramTls
+        self.scheme = "https" if self.tls else "http"
+
+        # Serving engine: how many clients are served at the same time and how many may wait in the kernel queue
+        self.mode = paramMode
+        self.workers = max( 1, paramWorkers )
+        self.backlog = max( 1, paramBacklog )
+
+        # A client that sends nothing must not hold a worker forever:
+        # the TLS handshake and the request header must be complete in time (also if the client sends byte after byte),
+        # while a body (upload) or a download runs the client may be idle paramClientTimeout seconds.
+        self.handshakeTimeout = paramHandshakeTimeout
+        self.headerTimeout = paramHeaderTimeout
+        self.clientTimeout = paramClientTimeout
+
+        # One address may only use some of the workers (0: no limit). More connections are closed at once.
+        self.maxConnectionsPerIp = paramMaxConnectionsPerIp
+        self.connectionsPerIp = {}
+        self.connectionsPerIpLock = Lock()
+
+        # HTTP/1.1 persistent connections: idle time between two requests and requests per connection (TLS session)
+        self.keepAliveTimeout = paramKeepAliveTimeout
+        self.keepAliveRequests = max( 1, paramKeepAliveRequests )
+
+        # Bigger request headers, more header lines and bigger form bodies (POST without upload) are refused
+        self.maxHeaderSize = paramMaxHeaderSize
+        self.maxHeaderCount = 100
+        self.maxFormSize = 1048576
+
         # Standard Socket configuration
         self.webSocket = socket( AF_INET, SOCK_STREAM )
+        self.webSocket.setsockopt( SOL_SOCKET, SO_REUSEADDR, 1 )
+        if paramReusePort:
+            # More processes bind the same port, the kernel balances the connections between them
+            self.webSocket.setsockopt( SOL_SOCKET, SO_REUSEPORT, 1 )
         self.webSocket.bind(( paramHost, paramPort ))
-        self.webSocket.listen( 1 )
-
-        # SSL Configuration
-        self.sslContext = SSLContext( PROTOCOL_TLS_SERVER )
-        self.sslContext.load_cert_chain( certfile=paramCert, keyfile=paramKey )
+        self.webSocket.listen( self.backlog )
 
-        # For a better security like a apache2-web-server
-        if osPathExists( paramDH ):
-            # Cipher Suites: Diffie-Hellman and Elliptic-Curve key transfer
-            self.sslContext.set_ciphers( "ECDHE+AESGCM:ECDHE+CHACHA20:ECDHE+SHA256" )
+        # SSL Configuration (see tlscontext.py). A given context is shared - pre-forked workers use the same session ticket keys.
+        # A context made here is made new after paramTicketKeyLifetime seconds (0: never), that is the rotation of the ticket keys.
+        self.certificateFiles = ( paramCert, paramKey, paramDH )
+        self.ticketKeyLifetime = paramTicketKeyLifetime if paramSslContext == None else 0
+        self.sslContext = None
+        if self.tls:
+            self.sslContext = paramSslContext or createSslContext( *self.certificateFiles )
+        self.sslContextCreated = monotonic()
+        self.sslContextLock = Lock()
 
-            # Set ECDHE-Curve
-            self.sslContext.set_ecdh_curve( "prime256v1" )
+        # Stop of a replaced pre-forked worker: running requests are finished first
+        self.drainOnStop = False
 
-            # Diffie-Hellman
-            self.sslContext.load_dh_params(paramDH)
+        # Handshakes and how many of them were resumed (a returning client with a session ticket)
+        self.tlsStatistics = { "handshakes": 0, "resumed": 0, "failed": 0, "handshakeSeconds": 0.0, "alpn": 0, "rotations": 0 }
+        self.tlsStatisticsLock = Lock()
 
-            # disable unsecure protocols
-            self.sslContext.options |= OP_NO_TLSv1
-            self.sslContext.options |= OP_NO_TLSv1_1
-            self.sslContext.options |= OP_NO_SSLv2
-            self.sslContext.options |= OP_NO_SSLv3
-
-        self.sslSocket = self.sslContext.wrap_socket( self.webSocket, server_side=True )
+        # The listening socket stays plain. Every client socket is wrapped by itself (see handleClient),
+        # so the TLS handshake runs in the worker and not in accept() where it blocks every other user.
 
         # Web - Server favicon.ico filename with path
         self.favicon = 'images/favicon_server_32x32.ico'
 
-        # Set chunk size ; Experiment with chunk sizes but result the same chaos by the upload.
-        self.chunkSize = 8192
-        #self.chunkSize = 4096
-        #self.chunkSize = 2048
-        #self.chunkSize = 1024
-        #self.chunkSize = 512
-        #self.chunkSize = 256
-        #self.chunkSize = 128
+        # /list shows this many rows per page if the client does not ask for an other limit
+        self.listPageSize = 500
+        self.listMaxPageSize = 5000
+
+        # Compression: smaller bodies are not worth it, bigger files are compressed once into a sidecar file
+        self.compressMinSize = 1024
+        self.compressMaxSize = 2147483648
+
+        # Browser caching: static images may be reused a day, user files always ask again (cheap with 304)
+        self.cacheControlStatic = "public, max-age=86400"
+        self.cacheControlUserFile = "private, no-cache"
+
+        # Uploads are parsed as bytes, a bigger piece means less Python work per megabyte
+        self.uploadChunkSize = 262144
+
+        # Resumable uploads: chunks of one file come in any order and over more connections (see handleUploadSession).
+        # Same disk as the user directory - the finished file is only renamed. paramMaxUploadSize: bytes of one file (0: only the free disk space).
+        self.uploadSessions = UploadSessionManager( self.filesystemService.madeWorkPath( "uploads" ), paramMaxSize=paramMaxUploadSize )
+        self.uploadSessionChunkSize = 8388608
+        # Deduplicated: the browser sends the hash of files up to this size before the upload - a known content needs no upload.
+        # The browser can hash only the whole file in memory (crypto.subtle), so bigger files are uploaded.
+        self.uploadHashName = self.filesystemService.blobStore.hashName if self.filesystemService.blobStore != None else ""
+        self.uploadHashMaxSize = 268435456 if self.filesystemService.blobStore != None else 0
+
+        # Copy, move and delete run as background job. A job that is finished in this time is answered at once, otherwise the client polls /jobs/<id>.
+        self.fileJobs = FileJobManager( self.filesystemService.madeWorkPath( "jobs" ) )
+        self.fileJobWaitTime = 0.5
+
+        # Downloads without sendfile read into one reused buffer per worker thread
+        self.sendBufferSize = 1048576
+        self.sendBuffers = threadLocal()
+
+        # Request counts, times and bytes per route, connections and handshakes (see /metrics)
+        self.metrics = Metrics()
+        # Optional: cProfile of the requests (/metrics/profile) and one JSON line per request in the access log
+        self.profiler = RequestProfiler() if paramProfile else None
+        self.accessLog = osOpen( paramAccessLog, O_WRONLY | O_CREAT | O_APPEND, 0o644 ) if paramAccessLog != None else None
+
+        # Bandwidth in bytes per second for each direction (0: no limit) - for the whole server, per user and per connection.
+        # Only big transfers wait (see bandwidth.py), small answers like pages and /list go out at once.
+        self.transferScheduler = None
+        if paramBandwidthGlobal > 0 or paramBandwidthUser > 0 or paramBandwidthConnection > 0:
+            self.transferScheduler = TransferScheduler( paramBandwidthGlobal, paramBandwidthUser, paramBandwidthConnection )
+
+        # Which download send path is used how often
+        self.sendPathCounter = { sendPath: 0 for sendPath in SendPath }
+        self.sendPathLock = Lock()
+
+        # Ready bytes for the answers: connection header (keep-alive or close), static pages and templates
+        self.connectionHeaders = { keepAlive: self.getConnectionHeader( keepAlive ).encode( 'ascii' ) for keepAlive in ( True, False ) }
+        self.compilePages()
+
+        # Method + path to handler (see registerRoutes)
+        self.routes = RoutingTable()
+        self.registerRoutes()
 
     def __del__( self ):
         print( "Close WebServer" )
-        self.sslSocket.close()
         self.webSocket.close()
 
     def listen(self):
         try:
-            clientSocket, clientAddress = self.sslSocket.accept()
+            clientSocket, clientAddress = self.webSocket.accept()
         except KeyboardInterrupt:
             print( "Keyboard interrupt: Ctrl+C" )
             return 3
-        except:
+        except OSError as e:
+            print( f"Error: accept {repr(e)}" )
             return -1
-        self.filterClientRequest( clientSocket )
+        self.handleClient( clientSocket, clientAddress )
+
+    def serveForever( self ):
+        # Run the selected serving engine until Ctrl+C is hit
+        match self.mode:
+            case ServerMode.SERIAL:
+                while self.listen() != 3:
+                    pass
+            case ServerMode.THREADPOOL:
+                self.serveThreadPool()
+            case ServerMode.ASYNCIO:
+                try:
+                    asyncio.run( self.serveAsyncio() )
+                except KeyboardInterrupt:
+                    print( "Keyboard interrupt: Ctrl+C" )
+
+    def serveThreadPool( self ):
+        # Only accept as many clients as workers plus waiting slots exist - the rest waits in the kernel backlog
+        freeSlots = BoundedSemaphore( self.workers + self.backlog )
+        executor = ThreadPoolExecutor( max_workers=self.workers, thread_name_prefix="WebServer" )
+        try:
+            while True:
+                freeSlots.acquire()
+                try:
+                    clientSocket, clientAddress = self.webSocket.accept()
+                except OSError as e:
+                    freeSlots.release()
+                    print( f"Error: accept {repr(e)}" )
+                    continue
+                if self.acquireClientSlot( clientAddress ) == False:
+                    freeSlots.release()
+                    clientSocket.close()
+                    continue
+                future = executor.submit( self.handleClient, clientSocket, clientAddress )
+                future.add_done_callback( lambda _, paramClientAddress=clientAddress: self.releaseClientSlot( paramClientAddress ) )
+                future.add_done_callback( lambda _: freeSlots.release() )
+        except KeyboardInterrupt:
+            print( "Keyboard interrupt: Ctrl+C" )
+        finally:
+            if self.drainOnStop:
+                # No new clients, but the running requests are finished
+                self.webSocket.close()
+            executor.shutdown( wait=self.drainOnStop, cancel_futures=self.drainOnStop == False )
+
+    async def serveAsyncio( self ):
+        # The event loop accepts, the blocking request handling runs in the executor
+        loop = asyncio.get_running_loop()
+        freeWorkers = asyncio.Semaphore( self.workers )
+        executor = ThreadPoolExecutor( max_workers=self.workers, thread_name_prefix="WebServer" )
+        self.webSocket.setblocking( False )
+
+        async def serveClient( paramClientSocket: socket, paramClientAddress: tuple ):
+            try:
+                await loop.run_in_executor( executor, self.handleClient, paramClientSocket, paramClientAddress )
+            finally:
+                self.releaseClientSlot( paramClientAddress )
+                freeWorkers.release()
+
+        runningClients = set()
+        try:
+            while True:
+                await freeWorkers.acquire()
+                try:
+                    clientSocket, clientAddress = await loop.sock_accept( self.webSocket )
+                except OSError as e:
+                    freeWorkers.release()
+                    print( f"Error: accept {repr(e)}" )
+                    continue
+                if self.acquireClientSlot( clientAddress ) == False:
+                    freeWorkers.release()
+                    clientSocket.close()
+                    continue
+                # The accepted socket inherits non-blocking from the listener - the handler needs blocking
+                clientSocket.setblocking( True )
+                task = loop.create_task( serveClient( clientSocket, clientAddress ) )
+                runningClients.add( task )
+                task.add_done_callback( runningClients.discard )
+        finally:
+            self.webSocket.setblocking( True )
+            if self.drainOnStop:
+                self.webSocket.close()
+            executor.shutdown( wait=self.drainOnStop, cancel_futures=self.drainOnStop == False )
+
+    def compilePages( self ):
+        # Static pages are made once to bytes - a request only sends them.
+        # Pages with values are templates: the static parts are encoded once, only the values per request (see htmltemplates.py).
+        pageSources = {
+            "index": """<!DOCTYPE html><html lang="en"><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><b>Welcome Guest</b><hr /><br /><a href='/list'>Show your files!</a><br /><br /><a href='/signup'>Sign Up</a></body></html>""",
+            "signup": f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Register a new User to the Simple File Server Python</h2><form action='/register' method='POST'>
+                          <input type='text' name='{PostForm.USERNAME.value}' placeholder='{PostForm.USERNAME.name}' />
+                          <input type='password' name='{PostForm.PASSWORD.value}' placeholder='{PostForm.PASSWORD.name}' />
+                          <input type='submit' name='{PostForm.SUBMIT.value}' value='Register' />
+                          <input type='reset' name='{PostForm.RESET.value}' value='Reset' />
+                          </form><hr /><br /><pre>Form is disabled. The Submit-Button is not functional because it always is positiv message that a new user created.<br />But it is not the case! Sorry, for that -.-</pre></body></html>""",
+            "signupError": """<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Signup could not complete an unknown error occured!</h2></body></html>""",
+            "signupCompleted": f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title><meta http-equiv='refresh' content='5;url={self.scheme}://{self.host}:{self.port}' /></head><body><h2>Signup successfull!</h2><pre>Page refresh in 5 seconds or click <a href='/list'>here</a>!</pre></body></html>""",
+            "notImplemented": """<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Not implemented!</h2></body></html>""",
+            "notFound": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Not found!</h2></body></html>""",
+            "onlyGetAndPost": """<!DOCTYPE html><html lang="en"><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><b>Only GET-AND-POST-Requests allowed!</b><hr /></body></html>""",
+            "downloadNotFound": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Download file not found!</h2></body></html>""",
+            "downloadEmpty": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Download file is empty!</h2></body></html>""",
+            "archiveEmpty": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Nothing selected for the archive!</h2></body></html>""",
+            "uploadOnlyPost": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Upload only with POST!</h2></body></html>""",
+            "badRequest": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Bad request!</h2></body></html>""",
+            "formTooLarge": """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Form data too large!</h2></body></html>""",
+            "uploadCompleted": f"""<!DOCTYPE html><html><head><title>SimpleFileServerPython</title><meta http-equiv='refresh' content='5;url={self.scheme}://{self.host}:{self.port}/list' /></head><body><h2>Upload completed!</h2><pre>Page refresh in 5 seconds or click <a href='/list'>here</a>!</pre></body></html>""",
+        }
+        self.pages = { pageName: pageSource.encode( 'utf-8' ) for pageName, pageSource in pageSources.items() }
+        # Compressed version of a big static page - made with the first request that accepts the encoding
+        self.compressedPages = {}
+
+        self.pageTemplates = {
+            "uploadFailed": HtmlTemplate( """<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Upload failed!</h2><pre>{message}</pre></body></html>""" ),
+            "listHead": HtmlTemplate( f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Upload new file:</h2><form action='/upload' method='POST' enctype='{PostForm.ENCTYPEMULTIPART.value}'><input type='file' name='{PostForm.UPLOAD.value}' placeholder='File (*.*)' /><input type='submit' name='{PostForm.SUBMIT.value}' value='Upload' /></form><p>Big file (resumable, parallel): <input type='file' id='resumableFile' /><button onclick='resumableUpload()'>Upload</button> <span id='resumableState'></span></p>{{uploadScript}}<form action='/files' method='POST'><select name='{PostForm.OPERATION.value}'><option value='{FileOperation.MOVE.value}'>Move</option><option value='{FileOperation.COPY.value}'>Copy</option><option value='{FileOperation.DELETE.value}'>Delete</option></select> <input type='text' name='{PostForm.DOWNLOAD.value}' placeholder='Source' /> <input type='text' name='{PostForm.TARGET.value}' placeholder='Target' /> <input type='submit' name='{PostForm.SUBMIT.value}' value='Start' /></form><hr /><h2>List of files</h2><p>{{pageLinks}}</p><form id='archiveForm' action='/archive' method='POST'><select name='format'><option value='{ArchiveFormat.ZIP.value}'>ZIP</option><option value='{ArchiveFormat.TARGZ.value}'>tar.gz</option></select> <input type='submit' value='Download selected' /></form><table border='1'><tr><th></th><th>Type</th><th>{{sortName}}</th><th>{{sortSize}}</th><th>{{sortCreated}}</th><th>{{sortModified}}</th></tr>""" ),
+            "listTail": HtmlTemplate( """</table><p>{pageLinks}</p></body></html>""" ),
+        }
+        # The script of the resumable upload is the same for every /list page
+        self.resumableUploadScript = self.getResumableUploadScript().encode( 'utf-8' )
+
+    def acquireClientSlot( self, paramClientAddress: tuple ):
+        # False if this address has already its maximum of connections - a slowloris client can not take every worker
+        if self.maxConnectionsPerIp <= 0:
+            return True
+        with self.connectionsPerIpLock:
+            connectionCount = self.connectionsPerIp.get( paramClientAddress[ 0 ], 0 )
+            if connectionCount >= self.maxConnectionsPerIp:
+                print( f"Error: too many connections from {paramClientAddress[ 0 ]}" )
+                self.metrics.connectionRejected()
+                return False
+            self.connectionsPerIp[ paramClientAddress[ 0 ] ] = connectionCount + 1
+        return True
+
+    def releaseClientSlot( self, paramClientAddress: tuple ):
+        if self.maxConnectionsPerIp <= 0:
+            return
+        with self.connectionsPerIpLock:
+            connectionCount = self.connectionsPerIp.get( paramClientAddress[ 0 ], 0 ) - 1
+            if connectionCount > 0:
+                self.connectionsPerIp[ paramClientAddress[ 0 ] ] = connectionCount
+            else:
+                self.connectionsPerIp.pop( paramClientAddress[ 0 ], None )
+
+    def handleClient( self, paramClientSocket: socket, paramClientAddress: tuple ):
+        # Runs in a worker: TLS handshake, request and close of a single client
+        self.metrics.connectionOpened()
+        try:
+            paramClientSocket.settimeout( self.clientTimeout )
+            clientSocket = self.doHandshake( paramClientSocket ) if self.tls else paramClientSocket
+        except ( SSLError, OSError ) as e:
+            # Broken or too slow handshake - only this client is affected
+            print( f"Error: TLS handshake {paramClientAddress[ 0 ]} {repr(e)}" )
+            with self.tlsStatisticsLock:
+                self.tlsStatistics[ "failed" ] += 1
+            paramClientSocket.close()
+            self.metrics.connectionClosed()
+            return
+
+        connection = ClientConnection( clientSocket, paramClientAddress, paramTransferScheduler=self.transferScheduler )
+        try:
+            # Serve request after request on the same TLS session as long as the client wants it
+            while True:
+                self.filterClientRequest( connection )
+                if connection.keepAlive == False:
+                    break
+        except Exception as e:
+            # A broken request must not kill the worker (or in serial mode the whole server)
+            print( f"Error: connection {paramClientAddress[ 0 ]} {repr(e)}" )
+        finally:
+            connection.close()
+            self.metrics.connectionClosed()
+
+    def doHandshake( self, paramClientSocket: socket ):
+        # Wrap the client socket and count how long the handshake takes and if the session was resumed
+        handshakeStart = perf_counter()
+        sslSocket = self.getSslContext().wrap_socket( paramClientSocket, server_side=True, do_handshake_on_connect=False )
+
+        # Non-blocking with one deadline for the whole handshake - a client that sends its hello byte by byte gets no more time
+        sslSocket.setblocking( False )
+        handshakeDeadline = monotonic() + self.handshakeTimeout
+        handshakePoll = poll()
+        while True:
+            try:
+                sslSocket.do_handshake()
+                break
+            except SSLWantReadError:
+                handshakePoll.register( sslSocket, POLLIN )
+            except SSLWantWriteError:
+                handshakePoll.register( sslSocket, POLLOUT )
+            remainingTime = handshakeDeadline - monotonic()
+            if remainingTime <= 0 or handshakePoll.poll( remainingTime * 1000 ) == []:
+                raise TimeoutError( "TLS handshake timeout" )
+        sslSocket.settimeout( self.clientTimeout )
+        handshakeSeconds = perf_counter() - handshakeStart
+        self.metrics.observeHandshake( handshakeSeconds )
+        with self.tlsStatisticsLock:
+            self.tlsStatistics[ "handshakes" ] += 1
+            self.tlsStatistics[ "handshakeSeconds" ] += handshakeSeconds
+            if sslSocket.session_reused:
+                self.tlsStatistics[ "resumed" ] += 1
+            if sslSocket.selected_alpn_protocol() != None:
+                self.tlsStatistics[ "alpn" ] += 1
+        return sslSocket
+
+    def getSslContext( self ):
+        # Rotation: the ticket keys live as long as the context - after the lifetime a new one is made
+        if self.ticketKeyLifetime > 0 and monotonic() - self.sslContextCreated > self.ticketKeyLifetime:
+            with self.sslContextLock:
+                if monotonic() - self.sslContextCreated > self.ticketKeyLifetime:
+                    self.sslContext = createSslContext( *self.certificateFiles )
+                    self.sslContextCreated = monotonic()
+                    self.tlsStatistics[ "rotations" ] += 1
+        return self.sslContext
+
+    def getTlsStatistics( self ):
+        # Rates for the check that returning clients skip the full handshake, and the session cache of OpenSSL
+        with self.tlsStatisticsLock:
+            tlsStatistics = dict( self.tlsStatistics )
+        handshakes = tlsStatistics[ "handshakes" ]
+        tlsStatistics[ "resumptionRate" ] = tlsStatistics[ "resumed" ] / handshakes if handshakes else 0.0
+        tlsStatistics[ "averageHandshakeMilliseconds" ] = tlsStatistics[ "handshakeSeconds" ] * 1000 / handshakes if handshakes else 0.0
+        tlsStatistics[ "ticketKeyAgeSeconds" ] = monotonic() - self.sslContextCreated
+        tlsStatistics[ "sessionCache" ] = self.sslContext.session_stats() if self.sslContext != None else {}
+        return tlsStatistics
+
+    def getConnectionHeader( self, paramKeepAlive: bool ):
+        if paramKeepAlive:
+            return f"""Connection: keep-alive\r\nKeep-Alive: timeout={int( self.keepAliveTimeout )}, max={self.keepAliveRequests}\r\n"""
+        return "Connection: close\r\n"
 
     # Exapmle URL for headerfieldnames: https://en.wikipedia.org/wiki/List_of_HTTP_header_fields
-    def getHeader( self, paramCode: HtmlStatusCode, paramType: str, paramLength: float ):
-        headerContent = f"""Content-Type: {paramType}\r\nContent-Length: {paramLength}\r\n\r\n"""
+    def getHeader( self, paramCode: HtmlStatusCode, paramType: str, paramLength: float, paramKeepAlive: bool = False, paramExtraHeader: str = "" ):
+        headerContent = f"""Content-Type: {paramType}\r\nContent-Length: {paramLength}\r\n{paramExtraHeader}{self.getConnectionHeader( paramKeepAlive )}\r\n"""
         return f"""{paramCode.value}{headerContent}"""
 
         # Old code - not casecade able!
@@ -125,9 +498,13 @@ class WebServer:
         #    case 403:
         #        return f"""HTTP/1.1 403 Forbidden\r\n{headerContent}"""
 
-    def getHeaderDownloadFile( self, paramCode: HtmlStatusCode, paramType: str, paramLength: float, paramSourceFilePath: str ):
+    def getHeaderBytes( self, paramCode: HtmlStatusCode, paramType: str, paramLength: int, paramKeepAlive: bool = False, paramExtraHeader: bytes = b"" ):
+        # Same as getHeader, but from ready bytes - only the length is formatted
+        return b"".join( ( statusLines[ paramCode ], b"Content-Type: ", paramType.encode( 'ascii' ), b"\r\nContent-Length: ", str( paramLength ).encode( 'ascii' ), b"\r\n", paramExtraHeader, self.connectionHeaders[ paramKeepAlive ], b"\r\n" ) )
+
+    def getHeaderDownloadFile( self, paramCode: HtmlStatusCode, paramType: str, paramLength: float, paramSourceFilePath: str, paramKeepAlive: bool = False, paramExtraHeader: str = "" ):
         # Default download header for a webserver
-        headerContent = f"""Content-Type: {paramType}\r\nContent-Length: {paramLength}\r\nContent-Disposition: attachment; filename="{paramSourceFilePath.split( '/' )[ -1 ]}"\r\n\r\n"""
+        headerContent = f"""Content-Type: {paramType}\r\nContent-Length: {paramLength}\r\n{self.getContentDisposition( paramSourceFilePath.split( '/' )[ -1 ] )}Accept-Ranges: bytes\r\n{paramExtraHeader}{self.getConnectionHeader( paramKeepAlive )}\r\n"""
         return f"""{paramCode.value}{headerContent}"""
 
         # Old code - not casecade able! - write it twice is ugly
@@ -137,286 +514,995 @@ class WebServer:
         #    case 403:
         #        return f"""HTTP/1.1 403 Forbidden\r\n{headerContent}"""
 
-    def send( self, paramClientSocket: socket, paramCode: HtmlStatusCode, paramType: str, paramHtmlContent: str ):
-        contentForClient = None
+    def getContentDisposition( self, paramFilename: str ):
+        # RFC 6266: filename is an ASCII fallback for old clients, filename* the exact (UTF-8) name
+        # Example: Content-Disposition: attachment; filename="Gr_n.txt"; filename*=UTF-8''Gr%C3%BCn.txt
+        asciiFilename = unsafeHeaderCharacterPattern.sub( "_", paramFilename )
+        return f"""Content-Disposition: attachment; filename="{asciiFilename}"; filename*=UTF-8''{urlQuote( paramFilename, safe="" )}\r\n"""
+
+    def getHeaderChunked( self, paramCode: HtmlStatusCode, paramType: str, paramClientSocket: ClientConnection, paramExtraHeader: str = "" ):
+        # Body with unknown length: chunked for HTTP/1.1, HTTP/1.0 knows no chunks - there the closed connection ends the body
+        if paramClientSocket.httpVersion != "HTTP/1.1":
+            paramClientSocket.keepAlive = False
+            return f"""{paramCode.value}Content-Type: {paramType}\r\n{paramExtraHeader}{self.getConnectionHeader( False )}\r\n"""
+        return f"""{paramCode.value}Content-Type: {paramType}\r\nTransfer-Encoding: chunked\r\n{paramExtraHeader}{self.getConnectionHeader( paramClientSocket.keepAlive )}\r\n"""
+
+    def getEncodingHeader( self, paramEncoding: str ):
+        # Caches must keep the compressed and the plain version apart
+        return f"Content-Encoding: {paramEncoding}\r\nVary: Accept-Encoding\r\n"
+
+    def getHeaderNotModified( self, paramKeepAlive: bool = False, paramExtraHeader: str = "" ):
+        # 304 has no body - only the validators and the connection state
+        return f"""{HtmlStatusCode.NOTMODIFIED.value}{paramExtraHeader}{self.getConnectionHeader( paramKeepAlive )}\r\n"""
+
+    def send( self, paramClientSocket: ClientConnection, paramCode: HtmlStatusCode, paramType: str, paramHtmlContent, paramExtraHeader: str = "" ):
+        # paramHtmlContent: text (encoded once here) or ready bytes (precompiled page, template, image)
+        htmlContent = paramHtmlContent.encode( 'utf-8' ) if isinstance( paramHtmlContent, str ) else paramHtmlContent
+        extraHeader = paramExtraHeader.encode( 'ascii' )
         match paramType:
-            case 'image/x-icon':
-                header = self.getHeader( paramCode, paramType, len( paramHtmlContent ) ).encode( 'utf-8' )
-                # Create a bytearray to combine easiely the header with the image content.
-                byteData = bytearray()
-                byteData.extend( header )
-                byteData.extend( paramHtmlContent )
-                paramClientSocket.sendall( byteData )
-
-            case 'text/html; charset=utf-8':
-                header = self.getHeader( paramCode, paramType, len( paramHtmlContent.encode( 'utf-8' ) ) )
-                contentForClient = f"""{header}{paramHtmlContent}""".encode( 'utf-8' )
-
-        if contentForClient != None:
-            paramClientSocket.sendall( contentForClient )
-
-    def filterClientRequest( self, paramClientSocket: socket ):
-        # The value must to 864 to get readable header data with a little bit of attached upload file.
-        # That is compatible with decode utf-8 like PDF with 'UnicodeDecodeError: 'utf-8' codec can't decode byte 0x9c'.
-        # I hope that is enough???
-        request = paramClientSocket.recv( 864 ).decode( 'utf-8' )
-
-        # Debugging output
-        #print( request )
-        #return
-
+            case 'text/html; charset=utf-8' | 'application/json':
+                contentEncoding = negotiateEncoding( paramClientSocket.acceptEncoding ) if len( htmlContent ) >= self.compressMinSize else None
+                if contentEncoding != None:
+                    htmlContent = compressBytes( contentEncoding, htmlContent )
+                    extraHeader += self.getEncodingHeader( contentEncoding ).encode( 'ascii' )
+
+        # One buffer join - the header and the content go out with one sendall
+        paramClientSocket.sendall( self.getHeaderBytes( paramCode, paramType, len( htmlContent ), paramClientSocket.keepAlive, extraHeader ) + htmlContent )
+
+    def sendPage( self, paramClientSocket: ClientConnection, paramCode: HtmlStatusCode, paramPageName: str ):
+        # A precompiled static page (see compilePages) - also the compressed version is made only once
+        pageContent = self.pages[ paramPageName ]
+        extraHeader = b""
+        contentEncoding = negotiateEncoding( paramClientSocket.acceptEncoding ) if len( pageContent ) >= self.compressMinSize else None
+        if contentEncoding != None:
+            if ( paramPageName, contentEncoding ) not in self.compressedPages:
+                self.compressedPages[ ( paramPageName, contentEncoding ) ] = compressBytes( contentEncoding, pageContent )
+            pageContent = self.compressedPages[ ( paramPageName, contentEncoding ) ]
+            extraHeader = self.getEncodingHeader( contentEncoding ).encode( 'ascii' )
+        paramClientSocket.sendall( self.getHeaderBytes( paramCode, "text/html; charset=utf-8", len( pageContent ), paramClientSocket.keepAlive, extraHeader ) + pageContent )
+
+    def filterClientRequest( self, paramClientSocket: ClientConnection ):
+        # Nothing is known about the next request - close it if something goes wrong
+        paramClientSocket.keepAlive = False
+
+        if paramClientSocket.requestCount > 0 and paramClientSocket.hasBufferedData() == False:
+            # Idle Keep-Alive connection: wait only a short time for the next request
+            paramClientSocket.settimeout( self.keepAliveTimeout )
+            try:
+                if paramClientSocket.fill() == False:
+                    # Client closed the connection
+                    return
+            except TimeoutError:
+                # Normal end of a Keep-Alive connection
+                return
         try:
-            # This block is need if curl call the web-address is not enough data for split.
-            # Example: curl -I -k [Protocol]://[IP]:[PORT]
-            method, path, _ = request.splitlines()[ 0 ].split( " " )
-
-            # Debugging output
-            #print(method, path)
-        except:
-            print(f"Error: {repr( request )}")
+            # From the first byte on the complete header must arrive in time
+            requestHeader = paramClientSocket.readUntil( b"\r\n\r\n", self.maxHeaderSize, monotonic() + self.headerTimeout )
+        except TimeoutError:
+            print( f"Error: Request header timeout {paramClientSocket.address[ 0 ]}" )
             return -1
+        except ValueError:
+            print( "Error: Request header too large!" )
+            return -1
+        if requestHeader == None:
+            # Client closed the connection
+            return
+        paramClientSocket.settimeout( self.clientTimeout )
+        paramClientSocket.requestCount += 1
+        paramClientSocket.httpVersion = "HTTP/1.1"
+        paramClientSocket.acceptEncoding = ""
+
+        # Metrics: time and bytes of this request - also of a broken or refused one
+        requestStart = perf_counter()
+        bytesSentBefore = paramClientSocket.bytesSent
+        bytesReceivedBefore = paramClientSocket.bytesReceived - len( requestHeader )
+        paramClientSocket.statusCode = None
+        paramClientSocket.requestMethod = ""
+        paramClientSocket.requestPath = ""
+        paramClientSocket.routePath = "invalid"
+        try:
+            return self.serveRequest( paramClientSocket, requestHeader )
+        finally:
+            self.endTransfers( paramClientSocket )
+            self.recordRequest( paramClientSocket, perf_counter() - requestStart, paramClientSocket.bytesSent - bytesSentBefore, paramClientSocket.bytesReceived - bytesReceivedBefore )
 
-        if '?' in path:
-            # If data is send by the path
-            # Example Once-Data: ?key1=value1
-            # Example More-Data: ?key1=value1&key2=value2
-
-            path, urlParameters = path.split( '?' )
-            if '&' in urlParameters:
-                # Get a nice dictionary of all data in the path
-                urlParameters = dict( nameEqualsValue.split( '=' ) for nameEqualsValue in urlParameters.split( '&' ) )
-
-            elif '=' in urlParameters:
-                # Get a nice dictionary of once data in the path
-                urlParameters = dict( urlParameters.split( '=' ) )
-
-        if method != 'GET' and method != 'POST':
-            # Say forbidden if a wrong method is used!
-            self.send( paramClientSocket, HtmlStatusCode.FORBIDDEN, "text/html; charset=utf-8", """<!DOCTYPE html><html lang="en"><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><b>Only GET-AND-POST-Requests allowed!</b><hr /></body></html>""" )
+    def serveRequest( self, paramClientSocket: ClientConnection, paramRequestHeader: bytes ):
+        # Only the header is read. The body stays in the connection - so the next pipelined request is not touched.
+        try:
+            request = parseRequest( paramRequestHeader, self.maxHeaderCount )
+        except ValueError as error:
+            print( f"Error: {error}" )
+            self.sendPage( paramClientSocket, HtmlStatusCode.BADREQUEST, "badRequest" )
             return -1
 
-        postData = None
-        if method == 'POST':
-            # Split header and body data for better information grabbing
-            submitHeader, submitBody = request.split('\r\n\r\n', 1)
-
-            if path != '/upload':
-                # Get a nice dictionary of the input form that was given from the user
-                postData = dict(nameEqualsValue.split('=') for nameEqualsValue in submitBody.split('&'))
-
-        match path:
-            case '/favicon.ico':
-                # Debugging output
-                # print( "Asking for favicon" )
-                faviconImage = self.filesystemService.readFile( self.filesystemService.madeWorkPath( self.favicon ) )
-                if type(faviconImage) != type(bool):
-                    # Debugging output
-                    #print( "Byte-Read: /favicon.ico" )
-                    self.send( paramClientSocket, HtmlStatusCode.OK, "image/x-icon", faviconImage )
-
-            case '/':
-                self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html lang="en"><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><b>Welcome Guest</b><hr /><br /><a href='/list'>Show your files!</a><br /><br /><a href='/signup'>Sign Up</a></body></html>""" )
-                return
+        # Debugging output
+        #print( request.method, request.path, request.headers )
+
+        paramClientSocket.httpVersion = request.httpVersion
+        paramClientSocket.requestMethod = request.method
+        paramClientSocket.requestPath = request.path
+        paramClientSocket.acceptEncoding = request.getHeader( "Accept-Encoding" )
+
+        # HTTP/1.1 keeps the connection open if not closed, HTTP/1.0 only on request
+        connectionHeader = request.getHeader( "Connection" ).lower()
+        if request.httpVersion == "HTTP/1.1":
+            paramClientSocket.keepAlive = connectionHeader != "close"
+        else:
+            paramClientSocket.keepAlive = connectionHeader == "keep-alive"
+        if paramClientSocket.requestCount >= self.keepAliveRequests:
+            paramClientSocket.keepAlive = False
+
+        bodyStart = paramClientSocket.bytesReceived
+        result = self.dispatchRequest( paramClientSocket, request )
+        # The handler may have left (a part of) the body in the connection - it must never be read as the next request
+        self.skipUnreadBody( paramClientSocket, ( request.getContentLength() or 0 ) - ( paramClientSocket.bytesReceived - bodyStart ) )
+        return result
+
+    def dispatchRequest( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        route, pathKnown = self.routes.findRoute( paramRequest.method, paramRequest.path )
+        paramClientSocket.routePath = route.path if route != None else "unknown"
+        if route == None:
+            if pathKnown or paramRequest.method not in self.routes.methods:
+                # Say forbidden if a wrong method is used!
+                self.sendPage( paramClientSocket, HtmlStatusCode.FORBIDDEN, "onlyGetAndPost" )
+                return -1
+            # Unknown path
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "notFound" )
+            return
 
-            case '/signup':
-                self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Register a new User to the Simple File Server Python</h2><form action='/register' method='POST'>
-                          <input type='text' name='{PostForm.USERNAME.value}' placeholder='{PostForm.USERNAME.name}' />
-                          <input type='password' name='{PostForm.PASSWORD.value}' placeholder='{PostForm.PASSWORD.name}' />
-                          <input type='submit' name='{PostForm.SUBMIT.value}' value='Register' />
-                          <input type='reset' name='{PostForm.RESET.value}' value='Reset' />
-                          </form><hr /><br /><pre>Form is disabled. The Submit-Button is not functional because it always is positiv message that a new user created.<br />But it is not the case! Sorry, for that -.-</pre></body></html>""" )
+        if paramRequest.method == 'POST' and route.readBody:
+            # Read exactly the body - the next pipelined request stays untouched.
+            # An upload body is streamed by the handler itself.
+            contentLength = paramRequest.getContentLength() or 0
+            if contentLength > self.maxFormSize:
+                paramClientSocket.keepAlive = False
+                self.sendPage( paramClientSocket, HtmlStatusCode.PAYLOADTOOLARGE, "formTooLarge" )
+                return -1
+            paramRequest.setBody( paramClientSocket.readExact( contentLength ) )
+
+        if self.profiler != None:
+            return self.profiler.run( route.path, route.handler, paramClientSocket, paramRequest )
+        return route.handler( paramClientSocket, paramRequest )
+
+    def skipUnreadBody( self, paramClientSocket: ClientConnection, paramUnreadBytes: int ):
+        # A small rest is read and thrown away, so the connection can be used again. A big rest is not worth it - close.
+        if paramUnreadBytes <= 0 or paramClientSocket.keepAlive == False:
+            return
+        if paramUnreadBytes > self.maxFormSize:
+            paramClientSocket.keepAlive = False
+            return
+        while paramUnreadBytes > 0:
+            skippedBytes = len( paramClientSocket.readExact( min( paramUnreadBytes, self.uploadChunkSize ) ) )
+            if skippedBytes == 0:
+                # Client closed the connection
+                paramClientSocket.keepAlive = False
                 return
+            paramUnreadBytes -= skippedBytes
 
-            case '/register':
-                # ToDo: not enough time to complete the functionallity
-                if postData == None:
-                    # Error - no user form data
-                    self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Signup could not complete an unknown error occured!</h2></body></html>""" )
-                    print("Error: method POST")
-                    return
-
-                # Debugging output
-                #print(postData)
+    def getUserKey( self, paramClientSocket: ClientConnection ):
+        # Only the guest user exists - the IP address stands for the user until there is a login
+        return paramClientSocket.address[ 0 ]
 
-                backToUrl = f"https://{self.host}:{self.port}"
-                self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title><meta http-equiv='refresh' content='5;url={backToUrl}' /></head><body><h2>Signup successfull!</h2><pre>Page refresh in 5 seconds or click <a href='/list'>here</a>!</pre></body></html>""" )
-
-            case '/signin':
-                # ToDo: not enough time to implement
-                self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Not implemented!</h2></body></html>""")
-
-            case '/logout':
-                # ToDo: not enough time to implement
-                self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Not implemented!</h2></body></html>""")
+    def startTransfer( self, paramClientSocket: ClientConnection, paramDirection: TransferDirection, paramSize: int = None ):
+        # A big download, archive or upload of this request gets its bandwidth stream (paramSize None: unknown size)
+        if self.transferScheduler == None or self.transferScheduler.isShaped( paramSize ) == False:
+            return
+        transferStream = self.transferScheduler.openStream( self.getUserKey( paramClientSocket ), paramDirection )
+        if paramDirection == TransferDirection.SEND:
+            paramClientSocket.sendStream = transferStream
+        else:
+            paramClientSocket.receiveStream = transferStream
+
+    def endTransfers( self, paramClientSocket: ClientConnection ):
+        for transferStream in ( paramClientSocket.sendStream, paramClientSocket.receiveStream ):
+            if transferStream != None:
+                transferStream.close()
+        paramClientSocket.sendStream = None
+        paramClientSocket.receiveStream = None
+
+    def recordRequest( self, paramClientSocket: ClientConnection, paramSeconds: float, paramBytesSent: int, paramBytesReceived: int ):
+        statusCode = paramClientSocket.statusCode or 0
+        self.metrics.observeRequest( paramClientSocket.routePath, paramClientSocket.requestMethod, statusCode, paramSeconds, paramBytesSent, paramBytesReceived )
+        if self.accessLog == None:
+            return
+        # One line JSON per request, written with one write call - more worker processes can use the same file
+        accessLogLine = json.dumps( { "time": round( time(), 3 ), "client": paramClientSocket.address[ 0 ], "method": paramClientSocket.requestMethod, "path": paramClientSocket.requestPath, "route": paramClientSocket.routePath,
+                                      "status": statusCode, "seconds": round( paramSeconds, 6 ), "sent": paramBytesSent, "received": paramBytesReceived, "keepAlive": paramClientSocket.keepAlive } )
+        osWrite( self.accessLog, f"{accessLogLine}\n".encode( 'utf-8' ) )
+
+    def getMetrics( self ):
+        # Prometheus text of this process: requests and connections (see metrics.py) and the numbers of TLS, content cache and send paths
+        tlsStatistics = self.getTlsStatistics()
+        cacheStatistics = self.filesystemService.contentCache.getStatistics()
+        with self.sendPathLock:
+            sendPathCounter = dict( self.sendPathCounter )
+        moreMetrics = [
+            ( "webserver_tls_handshakes_total", "counter", "Successful TLS handshakes.", [ ( {}, tlsStatistics[ "handshakes" ] ) ] ),
+            ( "webserver_tls_resumed_handshakes_total", "counter", "TLS handshakes with a resumed session (ticket).", [ ( {}, tlsStatistics[ "resumed" ] ) ] ),
+            ( "webserver_tls_failed_handshakes_total", "counter", "Broken or too slow TLS handshakes.", [ ( {}, tlsStatistics[ "failed" ] ) ] ),
+            ( "webserver_tls_ticket_key_rotations_total", "counter", "New session ticket keys.", [ ( {}, tlsStatistics[ "rotations" ] ) ] ),
+            ( "webserver_content_cache_events_total", "counter", "Content cache hits, misses, evictions and invalidations.", [ ( { "event": event }, cacheStatistics[ event ] ) for event in ( "hits", "misses", "evictions", "invalidations" ) ] ),
+            ( "webserver_content_cache_entries", "gauge", "Files in the content cache.", [ ( {}, cacheStatistics[ "entries" ] ) ] ),
+            ( "webserver_content_cache_bytes", "gauge", "Bytes in the content cache.", [ ( {}, cacheStatistics[ "bytes" ] ) ] ),
+            ( "webserver_download_send_path_total", "counter", "Downloads by send path (sendfile, ktls-sendfile, buffered).", [ ( { "path": sendPath.value }, count ) for sendPath, count in sendPathCounter.items() ] ),
+        ]
+        if self.filesystemService.blobStore != None:
+            blobStatistics = self.filesystemService.blobStore.getStatistics()
+            moreMetrics += [
+                ( "webserver_blobs", "gauge", "Deduplicated contents on disk.", [ ( {}, blobStatistics[ "blobs" ] ) ] ),
+                ( "webserver_blob_references", "gauge", "User files that are a reference to a blob.", [ ( {}, blobStatistics[ "references" ] ) ] ),
+                ( "webserver_blob_bytes", "gauge", "Bytes of the blobs on disk (stored) and of all user files (logical).", [ ( { "kind": "stored" }, blobStatistics[ "storedBytes" ] ), ( { "kind": "logical" }, blobStatistics[ "logicalBytes" ] ) ] ),
+                ( "webserver_blob_collected_total", "counter", "Blobs without a reference that the garbage collection removed.", [ ( {}, blobStatistics[ "collectedBlobs" ] ) ] ),
+                ( "webserver_blob_collected_bytes_total", "counter", "Bytes freed by the garbage collection.", [ ( {}, blobStatistics[ "collectedBytes" ] ) ] ),
+            ]
+        if self.transferScheduler != None:
+            bandwidthStatistics = self.transferScheduler.getStatistics()
+            moreMetrics += [
+                ( "webserver_bandwidth_active_streams", "gauge", "Big transfers that are shaped now.", [ ( {}, bandwidthStatistics[ "activeStreams" ] ) ] ),
+                ( "webserver_bandwidth_shaped_bytes_total", "counter", "Bytes of the shaped transfers.", [ ( { "direction": direction }, value ) for direction, value in bandwidthStatistics[ "shapedBytes" ].items() ] ),
+                ( "webserver_bandwidth_wait_seconds_total", "counter", "Time the shaped transfers waited for their bandwidth.", [ ( { "direction": direction }, value ) for direction, value in bandwidthStatistics[ "waitSeconds" ].items() ] ),
+            ]
+        return self.metrics.render( moreMetrics )
+
+    def serveProfile( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Example: /metrics/profile?route=/list - the functions with the most time of the profiled requests
+        if self.profiler == None:
+            self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "text/plain; charset=utf-8", "Profiling is off (paramProfile)!\n" )
+            return
+        self.send( paramClientSocket, HtmlStatusCode.OK, "text/plain; charset=utf-8", self.profiler.getReport( paramRequest.query.get( "route" ) ) )
+
+    def registerRoutes( self ):
+        # Method + path to handler - a new endpoint is only a new line here
+        self.routes.addRoute( ( 'GET', 'POST' ), '/favicon.ico', self.serveFavicon )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/', lambda paramClientSocket, paramRequest: self.sendPage( paramClientSocket, HtmlStatusCode.OK, "index" ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/signup', lambda paramClientSocket, paramRequest: self.sendPage( paramClientSocket, HtmlStatusCode.OK, "signup" ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/register', self.serveRegister )
+        # ToDo: not enough time to implement
+        self.routes.addRoute( ( 'GET', 'POST' ), '/signin', lambda paramClientSocket, paramRequest: self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "notImplemented" ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/logout', lambda paramClientSocket, paramRequest: self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "notImplemented" ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/list', lambda paramClientSocket, paramRequest: self.listFiles( paramClientSocket, paramRequest.query ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/download', self.serveDownload )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/archive', self.serveArchive )
+        self.routes.addRoute( ( 'GET', ), '/upload', lambda paramClientSocket, paramRequest: self.sendPage( paramClientSocket, HtmlStatusCode.FORBIDDEN, "uploadOnlyPost" ) )
+        self.routes.addRoute( ( 'POST', ), '/upload', self.serveUpload, paramReadBody=False )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/stats/tls', lambda paramClientSocket, paramRequest: self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( self.getTlsStatistics() ) ) )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/files', self.serveFileOperation )
+        self.routes.addRoute( ( 'GET', ), '/metrics', lambda paramClientSocket, paramRequest: self.send( paramClientSocket, HtmlStatusCode.OK, "text/plain; version=0.0.4; charset=utf-8", self.getMetrics() ) )
+        self.routes.addRoute( ( 'GET', ), '/metrics/profile', self.serveProfile )
+        self.routes.addRoute( ( 'GET', 'POST' ), '/jobs/', self.serveJob, paramPrefix=True )
+        self.routes.addRoute( ( 'GET', 'POST', 'PUT', 'DELETE' ), '/upload/session', self.handleUploadSession, paramPrefix=True )
+
+    def serveFavicon( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Debugging output
+        # print( "Asking for favicon" )
+        # From memory - the disk is only asked with a stat if the image was changed
+        faviconImage = self.filesystemService.getCachedFile( self.filesystemService.madeWorkPath( self.favicon ) )
+        if faviconImage != None:
+            validatorHeader = self.getValidatorHeader( faviconImage.entityTag, faviconImage.lastModified, self.cacheControlStatic )
+            if self.isNotModified( paramRequest, faviconImage.entityTag, faviconImage.lastModified ):
+                # The browser has it already - no body
+                paramClientSocket.sendall( self.getCachedFileHeader( faviconImage, HtmlStatusCode.NOTMODIFIED, paramClientSocket.keepAlive, lambda: self.getHeaderNotModified( paramClientSocket.keepAlive, validatorHeader ) ) )
+                return
 
-            case '/list':
-                userFilePath = self.filesystemService.madeUserPath("")
-                FolderFiles = self.filesystemService.listDirectory( userFilePath )
-                # Debugging output
-                #print( FolderFiles )
+            # Debugging output
+            #print( "Memory-Read: /favicon.ico" )
+            header = self.getCachedFileHeader( faviconImage, HtmlStatusCode.OK, paramClientSocket.keepAlive, lambda: self.getHeader( HtmlStatusCode.OK, "image/x-icon", faviconImage.size, paramClientSocket.keepAlive, validatorHeader ) )
+            paramClientSocket.sendall( header + faviconImage.content )
+            return
+        # Every request needs an answer, otherwise a Keep-Alive client waits forever
+        self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "notFound" )
+
+    def serveRegister( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # ToDo: not enough time to complete the functionallity
+        if paramRequest.method != 'POST':
+            # Error - no user form data
+            self.sendPage( paramClientSocket, HtmlStatusCode.OK, "signupError" )
+            print("Error: method POST")
+            return
 
-                # Create all rows for folder and files.
-                # But for time saveing only files
-                tableData = ""
-                for data in FolderFiles:
-                    tableData += f"""<tr><td>{data[ "type" ]}</td><td>{data[ "name" ]}</td><td>{data[ "size" ]} KB</td><td>{data[ "creationDate" ]}</td><td>{data[ "modifiedDate" ]}</td><td><form action='/download' method='POST'><input type='hidden' name='{PostForm.DOWNLOAD.value}' value='{data[ "name" ]}' /><input type='submit' name='{PostForm.SUBMIT.value}' value='Download' /></form></td></tr>"""
+        # Debugging output
+        #print( paramRequest.form )
 
-                self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><link rel="icon" type="image/x-icon" href="/favicon.ico"><title>SimpleFileServerPython</title></head><body><h2>Upload new file:</h2><form action='/upload' method='POST' enctype='{PostForm.ENCTYPEMULTIPART.value}'><input type='file' name='{PostForm.UPLOAD.value}' placeholder='File (*.*)' /><input type='submit' name='{PostForm.SUBMIT.value}' value='Upload' /></form><hr /><h2>List of files</h2><table border='1'><tr><th>Type</th><th>Name</th><th>Size</th><th>Creation Date</th><th>Modified Date</th></tr>{tableData}</table></body></html>""" )
+        self.sendPage( paramClientSocket, HtmlStatusCode.OK, "signupCompleted" )
 
-            case '/download':
-                if postData == None:
-                    # Error - no download file selected
-                    self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Download file not found!</h2></body></html>""" )
-                    return
-                self.downloadFile( paramClientSocket, postData[PostForm.DOWNLOAD.value])
+    def serveDownload( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # POST from the /list form or GET /download?FilePath=name - a plain link that download managers can resume with Range
+        formData = paramRequest.form if paramRequest.method == 'POST' else paramRequest.query
+        if PostForm.DOWNLOAD.value not in formData:
+            # Error - no download file selected
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "downloadNotFound" )
+            return
+        self.downloadFile( paramClientSocket, formData[ PostForm.DOWNLOAD.value ], paramRequest )
+
+    def serveArchive( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Example: /archive?FilePath=folder&FilePath=file.txt&format=zip (or the same as POST form)
+        formFields = paramRequest.formFields if paramRequest.method == 'POST' else paramRequest.queryFields
+        archiveNames = [ value for name, value in formFields if name == PostForm.DOWNLOAD.value ]
+        archiveFormat = next( ( value for name, value in formFields if name == "format" ), ArchiveFormat.ZIP.value )
+        self.downloadArchive( paramClientSocket, archiveNames, archiveFormat )
+
+    def serveUpload( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        uploadDone, uploadStatusCode, uploadMessage = self.uploadFile( paramClientSocket, paramRequest )
+        if uploadDone:
+            # Upload was positive
+            self.sendPage( paramClientSocket, HtmlStatusCode.OK, "uploadCompleted" )
+            return
 
-            case '/upload':
-                if self.uploadFile( paramClientSocket, submitHeader, submitBody ):
-                    # Upload was positive
-                    backToUrl = f"https://{self.host}:{self.port}/list"
-                    self.send( paramClientSocket, HtmlStatusCode.OK, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><title>SimpleFileServerPython</title><meta http-equiv='refresh' content='5;url={backToUrl}' /></head><body><h2>Upload completed!</h2><pre>Page refresh in 5 seconds or click <a href='/list'>here</a>!</pre></body></html>""" )
-                    return
+        # Upload error
+        print( uploadMessage )
+        self.send( paramClientSocket, uploadStatusCode, "text/html; charset=utf-8", self.pageTemplates[ "uploadFailed" ].render( message=htmlEscape( uploadMessage ) ) )
 
-                # Upload error
-                self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "text/html; charset=utf-8", f"""<!DOCTYPE html><html><head><title>SimpleFileServerPython</title></head><body><h2>Upload file not found!</h2></body></html>""" )
-                return
+    def serveFileOperation( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Example: POST Operation=move&FilePath=old.txt&Target=folder%2Fnew.txt (copy and delete the same way)
+        if paramRequest.method != 'POST':
+            self.send( paramClientSocket, HtmlStatusCode.FORBIDDEN, "application/json", json.dumps( { "error": "File operations only with POST!" } ) )
+            return
+        self.startFileOperation( paramClientSocket, paramRequest.form )
 
-    def findContentOfHeader(self, paramHeader: str, paramSearch: str):
-        # Find the right spot of the header response (request)?
+    def serveJob( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Example: /jobs/<id> - state queued, running, done or failed with copied bytes and files
+        jobStatus = self.fileJobs.getJob( paramRequest.path[ len( '/jobs/' ): ] )
+        if jobStatus == None:
+            self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "application/json", json.dumps( { "error": "Unknown job!" } ) )
+            return
+        self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( jobStatus ) )
+
+    def listFiles( self, paramClientSocket: ClientConnection, paramUrlParameters: dict ):
+        # Example: /list?offset=500&limit=100&sort=size&order=desc
+        sortKey = paramUrlParameters.get( "sort", "name" )
+        if sortKey not in sortKeys:
+            sortKey = "name"
+        descending = paramUrlParameters.get( "order", "asc" ) == "desc"
         try:
-            return [ headerResultLine.split( ": " )[ 1 ] for headerResultLine in paramHeader.split( "\r\n" ) if headerResultLine.startswith( paramSearch ) ][ 0 ]
-        except:
-            # If not found send nothing back
-            return ""
+            offset = max( 0, int( paramUrlParameters.get( "offset", 0 ) ) )
+            limit = min( self.listMaxPageSize, max( 1, int( paramUrlParameters.get( "limit", self.listPageSize ) ) ) )
+        except ValueError:
+            offset, limit = 0, self.listPageSize
 
-    def downloadFile( self, paramClientSocket: socket, paramSourceFilePath: str ):
+        userFilePath = self.filesystemService.madeUserPath("")
+        FolderFiles = self.filesystemService.listDirectory( userFilePath, sortKey, descending ) or []
+        # Debugging output
+        #print( FolderFiles )
+
+        pageFiles = FolderFiles[ offset:offset + limit ]
+        def listUrl( paramOffset: int, paramSortKey: str, paramDescending: bool ):
+            return f"/list?offset={paramOffset}&amp;limit={limit}&amp;sort={paramSortKey}&amp;order={'desc' if paramDescending else 'asc'}"
+        def sortLink( paramSortKey: str, paramTitle: str ):
+            # A click on the current sort column turns the order around
+            return f"<a href='{listUrl( 0, paramSortKey, descending == False if paramSortKey == sortKey else False )}'>{paramTitle}</a>"
+
+        pageLinks = f"Entries {min( offset + 1, len( FolderFiles ) )} - {offset + len( pageFiles )} of {len( FolderFiles )}"
+        if offset > 0:
+            pageLinks += f" | <a href='{listUrl( max( 0, offset - limit ), sortKey, descending )}'>Previous</a>"
+        if offset + limit < len( FolderFiles ):
+            pageLinks += f" | <a href='{listUrl( offset + limit, sortKey, descending )}'>Next</a>"
+
+        # Stream the page: the browser shows the first rows while the rest is still made
+        contentEncoding = negotiateEncoding( paramClientSocket.acceptEncoding )
+        paramClientSocket.sendall( self.getHeaderChunked( HtmlStatusCode.OK, "text/html; charset=utf-8", paramClientSocket, self.getEncodingHeader( contentEncoding ) if contentEncoding else "" ).encode( 'utf-8' ) )
+        pageWriter = ChunkedWriter( paramClientSocket, paramClientSocket.httpVersion == "HTTP/1.1" )
+        if contentEncoding != None:
+            pageWriter = CompressingWriter( pageWriter, contentEncoding )
+        pageWriter.write( self.pageTemplates[ "listHead" ].render( uploadScript=self.resumableUploadScript, pageLinks=pageLinks, sortName=sortLink( "name", "Name" ), sortSize=sortLink( "size", "Size" ), sortCreated=sortLink( "created", "Creation Date" ), sortModified=sortLink( "modified", "Modified Date" ) ) )
+
+        # Create all rows for folder and files.
+        # But for time saveing only files
+        # The rows are joined once per batch - no string that grows with every row
+        for batchStart in range( 0, len( pageFiles ), 200 ):
+            pageWriter.write( "".join( f"""<tr><td><input type='checkbox' form='archiveForm' name='{PostForm.DOWNLOAD.value}' value='{htmlEscape( data[ "name" ] )}' /></td><td>{data[ "type" ]}</td><td>{htmlEscape( data[ "name" ] )}</td><td>{data[ "size" ]} KB</td><td>{data[ "creationDate" ]}</td><td>{data[ "modifiedDate" ]}</td><td><form action='{"/archive" if data[ "type" ] == "DIR" else "/download"}' method='POST'><input type='hidden' name='{PostForm.DOWNLOAD.value}' value='{htmlEscape( data[ "name" ] )}' /><input type='submit' name='{PostForm.SUBMIT.value}' value='{"Download ZIP" if data[ "type" ] == "DIR" else "Download"}' /></form></td></tr>""" for data in pageFiles[ batchStart:batchStart + 200 ] ).encode( 'utf-8' ) )
+            pageWriter.flush()
+
+        pageWriter.write( self.pageTemplates[ "listTail" ].render( pageLinks=pageLinks ) )
+        pageWriter.close()
+
+    def getResumableUploadScript( self ):
+        # Browser side of the resumable upload: 4 chunks at the same time, the session id stays in the localStorage,
+        # so after a broken connection or a reload only the missing chunks are sent again.
+        return f"""<script>
+async function resumableUpload() {{
+  const file = document.getElementById('resumableFile').files[0], state = document.getElementById('resumableState');
+  if (!file) return;
+  const key = 'upload:' + file.name + ':' + file.size + ':' + file.lastModified, chunkSize = {self.uploadSessionChunkSize};
+  let status = null, id = localStorage.getItem(key);
+  if (id) {{ const answer = await fetch('/upload/session/' + id); status = answer.ok ? await answer.json() : null; }}
+  if (!status) {{
+    let digest = '';
+    if (file.size <= {self.uploadHashMaxSize} && window.crypto && crypto.subtle) {{
+      state.textContent = 'Hashing...';
+      const hash = new Uint8Array(await crypto.subtle.digest('SHA-256', await file.arrayBuffer()));
+      digest = '&{self.uploadHashName}=' + Array.from(hash, (byte) => byte.toString(16).padStart(2, '0')).join('');
+    }}
+    status = await (await fetch('/upload/session?{PostForm.DOWNLOAD.value}=' + encodeURIComponent(file.name) + '&size=' + file.size + digest, {{method: 'POST'}})).json();
+    if (status.error) {{ state.textContent = status.error; return; }}
+    if (status.complete) {{ state.textContent = 'Upload completed!'; location.reload(); return; }}
+    localStorage.setItem(key, status.id);
+  }}
+  id = status.id;
+  const chunks = [];
+  for (const [first, last] of status.missing)
+    for (let start = first; start <= last; start += chunkSize) chunks.push([start, Math.min(last, start + chunkSize - 1)]);
+  let done = 0;
+  async function worker() {{
+    for (let chunk; (chunk = chunks.shift()); ) {{
+      for (let attempt = 0; ; attempt++) {{
+        try {{
+          const answer = await fetch('/upload/session/' + id, {{method: 'PUT', headers: {{'Content-Range': 'bytes ' + chunk[0] + '-' + chunk[1] + '/' + file.size}}, body: file.slice(chunk[0], chunk[1] + 1)}});
+          if (answer.ok) break;
+        }} catch (e) {{}}
+        if (attempt == 4) throw new Error('chunk ' + chunk[0]);
+      }}
+      state.textContent = ++done + ' chunks sent';
+    }}
+  }}
+  try {{ await Promise.all([worker(), worker(), worker(), worker()]); }} catch (e) {{ state.textContent = 'Interrupted - upload again to resume'; return; }}
+  const answer = await fetch('/upload/session/' + id, {{method: 'POST'}});
+  state.textContent = answer.ok ? 'Upload completed!' : 'Upload failed!';
+  if (answer.ok) {{ localStorage.removeItem(key); location.reload(); }}
+}}
+</script>"""
+
+    def downloadFile( self, paramClientSocket: ClientConnection, paramSourceFilePath: str, paramRequest: HttpRequest ):
         # Set it to the right user directory
         userFilePath = self.filesystemService.madeUserPath( paramSourceFilePath )
 
         # Debugging output
         #print( f"User-Path: {userFilePath}" )
 
-        if self.filesystemService.checkExists( userFilePath ) == False:
-            # Do nothing if the file not exists
+        if self.filesystemService.isUserPath( userFilePath ) == False:
+            # Only files inside the user directory - also after '..', absolute paths and symbolic links
+            print( f"Error: Download outside of the user directory {repr( paramSourceFilePath )}" )
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "downloadNotFound" )
+            return
+
+        fileStats = self.filesystemService.getFileStats( userFilePath )
+        if fileStats == None or statIsFile( fileStats.st_mode ) == False:
+            # A directory (or a device, ...) is no download - folders come with /archive
             print( "Error: File not found!" )
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "downloadNotFound" )
             return
 
-        with open( userFilePath, 'rb' ) as downloadFileHanlder:
+        # Small files come from memory, big files from disk
+        cachedFile = self.filesystemService.getCachedFile( userFilePath )
+        if cachedFile != None:
+            downloadFileSize = cachedFile.size
+            entityTag, lastModified = cachedFile.entityTag, cachedFile.lastModified
+        else:
             # Create header, that the browser knows the total file size of the download
-            downloadFileSize = self.filesystemService.getFileSize( userFilePath )
-            if downloadFileSize == 0:
-                # Filesize 0 no file to download
-                print( "Error: Filesize is 0 bytes!" )
-                return
+            downloadFileSize = fileStats.st_size
+            # A changed file must never be combined with pieces of the old one
+            entityTag, lastModified = self.filesystemService.getValidatorsFromStats( fileStats )
+
+        if downloadFileSize == 0:
+            # Filesize 0 no file to download
+            print( "Error: Filesize is 0 bytes!" )
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "downloadEmpty" )
+            return
 
-            # Create the download header and send it to the client - How big the file is
-            header = self.getHeaderDownloadFile( HtmlStatusCode.OK, ContentType.OCTETSTREAM.value, downloadFileSize, userFilePath )
-            paramClientSocket.sendall( header.encode( 'utf-8' ) )
+        downloadContentType = self.getContentTypeFromFilename( userFilePath )
+        rangeHeader = paramRequest.getHeader( "Range" )
+
+        # Text, JSON and XML are compressed if the client can read it. Never for ranges: they count the plain bytes.
+        contentEncoding = None
+        if rangeHeader == "" and isCompressible( downloadContentType ) and self.compressMinSize <= downloadFileSize <= self.compressMaxSize:
+            contentEncoding = negotiateEncoding( paramClientSocket.acceptEncoding )
+        if contentEncoding != None:
+            # Every representation needs its own ETag
+            entityTag = f'{entityTag[ :-1 ]}-{contentEncoding}"'
+            validatorHeader = self.getValidatorHeader( entityTag, lastModified, self.cacheControlUserFile ) + self.getEncodingHeader( contentEncoding )
+        else:
+            validatorHeader = self.getValidatorHeader( entityTag, lastModified, self.cacheControlUserFile )
+
+        if self.isNotModified( paramRequest, entityTag, lastModified ):
+            # The client has already this version of the file
+            paramClientSocket.sendall( self.getHeaderNotModified( paramClientSocket.keepAlive, validatorHeader ).encode( 'utf-8' ) )
+            return
 
-            # Read file as chunks
-            # The operator := does set a value and give it out; both at same time. Nice :-)
-            while chunk := downloadFileHanlder.read( self.chunkSize ):
-                paramClientSocket.sendall( chunk )
+        byteRanges = None
+        if rangeHeader and self.isIfRangeFresh( paramRequest.getHeader( "If-Range" ), entityTag, lastModified ):
+            byteRanges = parseRangeHeader( rangeHeader, downloadFileSize )
+
+        if byteRanges == None and cachedFile != None:
+            downloadContent = cachedFile.content
+            if contentEncoding != None:
+                # Compressed only once per cached version of the file
+                downloadContent = cachedFile.encodedContents.get( contentEncoding )
+                if downloadContent == None:
+                    downloadContent = cachedFile.encodedContents[ contentEncoding ] = compressBytes( contentEncoding, cachedFile.content )
+
+            # Header and content ready in memory - one send
+            header = self.getCachedFileHeader( cachedFile, HtmlStatusCode.OK, paramClientSocket.keepAlive, lambda: self.getHeaderDownloadFile( HtmlStatusCode.OK, downloadContentType, len( downloadContent ), userFilePath, paramClientSocket.keepAlive, validatorHeader ), contentEncoding )
+            paramClientSocket.sendall( header + downloadContent )
+            return
 
-    def uploadFile( self, paramClientSocket: socket, paramSubmitHeader: str, paramSubmitBody: str ):
-        # ToDo: Upload works part-wise: File is too large as should be!
+        if byteRanges == None and contentEncoding != None:
+            self.sendCompressedFile( paramClientSocket, userFilePath, fileStats, downloadContentType, contentEncoding, validatorHeader )
+            return
 
-        # Filter filesize
-        uploadFileLength = int( self.findContentOfHeader( paramSubmitHeader, "Content-Length" ) )
+        if byteRanges != None and len( byteRanges ) == 0:
+            # No asked range is inside the file
+            header = self.getHeader( HtmlStatusCode.RANGENOTSATISFIABLE, "text/plain", 0, paramClientSocket.keepAlive, f"Content-Range: bytes */{downloadFileSize}\r\n" )
+            paramClientSocket.sendall( header.encode( 'utf-8' ) )
+            return
 
-        try:
-            # None textfiles need only 864 bytes. complicated. Symtome defense. Trial and error.
-            # Like PDFs
-            submitBoundaryHeader, submitBoundaryBody = paramSubmitBody.split('\r\n\r\n', 1)
-        except:
-            # Textfiles need 1024 bytes
-            # receive the next 160 bytes for already 1024 bytes
-            paramSubmitBody += paramClientSocket.recv( 160 ).decode( 'utf-8' )
-            submitBoundaryHeader, submitBoundaryBody = paramSubmitBody.split('\r\n\r\n', 1)
+        self.startTransfer( paramClientSocket, TransferDirection.SEND, downloadFileSize if byteRanges == None else sum( lastByte - firstByte + 1 for firstByte, lastByte in byteRanges ) )
+        with ( open( userFilePath, 'rb' ) if cachedFile == None else nullcontext() ) as downloadFileHanlder:
+            def sendPart( paramOffset: int, paramCount: int ):
+                if cachedFile != None:
+                    paramClientSocket.sendall( memoryview( cachedFile.content )[ paramOffset:paramOffset + paramCount ] )
+                else:
+                    self.sendFileContent( paramClientSocket, downloadFileHanlder, paramOffset, paramCount )
+
+            if byteRanges == None:
+                # Create the download header and send it to the client - How big the file is
+                header = self.getHeaderDownloadFile( HtmlStatusCode.OK, downloadContentType, downloadFileSize, userFilePath, paramClientSocket.keepAlive, validatorHeader )
+                paramClientSocket.sendall( header.encode( 'utf-8' ) )
+                sendPart( 0, downloadFileSize )
+                return
 
-        # Filter the filename and filetype - extensions check.
-        uploadFilename = str( self.findContentOfHeader( submitBoundaryHeader, "Content-Disposition" ) ).split( "; filename=" )[ 1 ].replace( '"', '' )
-        uploadFiletype = str( self.findContentOfHeader( submitBoundaryHeader, "Content-Type" ) )
+            if len( byteRanges ) == 1:
+                firstByte, lastByte = byteRanges[ 0 ]
+                rangeHeader = f"{validatorHeader}Content-Range: bytes {firstByte}-{lastByte}/{downloadFileSize}\r\n"
+                header = self.getHeaderDownloadFile( HtmlStatusCode.PARTIALCONTENT, downloadContentType, lastByte - firstByte + 1, userFilePath, paramClientSocket.keepAlive, rangeHeader )
+                paramClientSocket.sendall( header.encode( 'utf-8' ) )
+                sendPart( firstByte, lastByte - firstByte + 1 )
+                return
 
-        # Get boundary for break upload part
-        uploadBoundary = str( self.findContentOfHeader( paramSubmitHeader, "Content-Type" ) ).split( "; boundary=" )[ 1 ]
+            # More ranges: multipart/byteranges - the length of all part headers is known before, so Content-Length is exact
+            rangeBoundary = uuid4().hex
+            partHeaders = [ f"\r\n--{rangeBoundary}\r\nContent-Type: {downloadContentType}\r\nContent-Range: bytes {firstByte}-{lastByte}/{downloadFileSize}\r\n\r\n".encode( 'utf-8' ) for firstByte, lastByte in byteRanges ]
+            closingBoundary = f"\r\n--{rangeBoundary}--\r\n".encode( 'utf-8' )
+            bodyLength = sum( len( partHeader ) for partHeader in partHeaders ) + sum( lastByte - firstByte + 1 for firstByte, lastByte in byteRanges ) + len( closingBoundary )
 
-        filetypeFound = ContentType( uploadFiletype )
+            header = self.getHeaderDownloadFile( HtmlStatusCode.PARTIALCONTENT, f"multipart/byteranges; boundary={rangeBoundary}", bodyLength, userFilePath, paramClientSocket.keepAlive, validatorHeader )
+            paramClientSocket.sendall( header.encode( 'utf-8' ) )
+            for partHeader, ( firstByte, lastByte ) in zip( partHeaders, byteRanges ):
+                paramClientSocket.sendall( partHeader )
+                sendPart( firstByte, lastByte - firstByte + 1 )
+            paramClientSocket.sendall( closingBoundary )
+
+    def downloadArchive( self, paramClientSocket: ClientConnection, paramNames: list, paramFormat: str ):
+        # Folders and more files in one download: the archive is made while it is sent - no temporary file,
+        # the memory need is one chunk. The size is unknown before, so the body is chunked.
+        userDirectory = self.filesystemService.madeUserPath( "" )
+        if len( paramNames ) == 0 or paramFormat not in [ archiveFormat.value for archiveFormat in ArchiveFormat ]:
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "archiveEmpty" )
+            return
+        # Only existing files and folders inside the user directory - an empty archive is no answer
+        archiveNames = [ name for name in paramNames if self.filesystemService.isUserPath( self.filesystemService.madeUserPath( name ) ) and self.filesystemService.checkExists( self.filesystemService.madeUserPath( name ) ) ]
+        if len( archiveNames ) == 0:
+            self.sendPage( paramClientSocket, HtmlStatusCode.NOTFOUND, "downloadNotFound" )
+            return
+
+        archiveFormat = ArchiveFormat( paramFormat )
+        archiveFilename = f"{archiveNames[ 0 ].rstrip( '/' ).split( '/' )[ -1 ] if len( archiveNames ) == 1 else 'guest'}.{archiveFormat.value}"
+        header = self.getHeaderChunked( HtmlStatusCode.OK, archiveContentTypes[ archiveFormat ], paramClientSocket, self.getContentDisposition( archiveFilename ) )
+        paramClientSocket.sendall( header.encode( 'utf-8' ) )
+
+        # The size is unknown - always a big transfer
+        self.startTransfer( paramClientSocket, TransferDirection.SEND )
+        archiveWriter = ChunkedWriter( paramClientSocket, paramClientSocket.httpVersion == "HTTP/1.1", self.transferScheduler.quantum if paramClientSocket.sendStream != None else self.sendBufferSize )
+        archiveEntries = walkArchiveEntries( userDirectory, archiveNames, ( sidecarDirectory, ) )
+        if archiveFormat == ArchiveFormat.ZIP:
+            writeZip( archiveWriter, archiveEntries, self.sendBufferSize, lambda paramName: isCompressible( self.getContentTypeFromFilename( paramName ) ) )
+        else:
+            writeTarGz( archiveWriter, archiveEntries, self.sendBufferSize )
+        archiveWriter.close()
+
+    def sendCompressedFile( self, paramClientSocket: ClientConnection, paramUserFilePath: str, paramFileStats, paramContentType: str, paramEncoding: str, paramValidatorHeader: str ):
+        sidecarPath = getSidecarPath( paramUserFilePath, paramFileStats, paramEncoding )
+        self.startTransfer( paramClientSocket, TransferDirection.SEND, paramFileStats.st_size )
+        if sidecarExists( sidecarPath ):
+            # Compressed before: send the sidecar file like a normal file - also zero-copy
+            try:
+                with open( sidecarPath, 'rb' ) as sidecarHandler:
+                    sidecarSize = self.filesystemService.getFileSize( sidecarPath )
+                    header = self.getHeaderDownloadFile( HtmlStatusCode.OK, paramContentType, sidecarSize, paramUserFilePath, paramClientSocket.keepAlive, paramValidatorHeader )
+                    paramClientSocket.sendall( header.encode( 'utf-8' ) )
+                    self.sendFileContent( paramClientSocket, sidecarHandler, 0, sidecarSize )
+                    return
+            except FileNotFoundError:
+                # Replaced by a newer version in the meantime - compress again
+                pass
+
+        # First download of this version: compress while sending and store the result as sidecar.
+        # The compressed size is unknown before - chunked.
+        header = self.getHeaderChunked( HtmlStatusCode.OK, paramContentType, paramClientSocket, f"""{self.getContentDisposition( paramUserFilePath.split( '/' )[ -1 ] )}{paramValidatorHeader}""" )
+        paramClientSocket.sendall( header.encode( 'utf-8' ) )
+        compressingWriter = CompressingWriter( ChunkedWriter( paramClientSocket, paramClientSocket.httpVersion == "HTTP/1.1" ), paramEncoding, paramUserFilePath, paramFileStats )
+        try:
+            with open( paramUserFilePath, 'rb' ) as downloadFileHanlder:
+                while chunk := downloadFileHanlder.read( self.sendBufferSize ):
+                    compressingWriter.write( chunk )
+            compressingWriter.close()
+        except BaseException:
+            compressingWriter.abort()
+            raise
+
+    def getContentTypeFromFilename( self, paramFilename: str ):
+        # The ContentType names are the file extensions. Unknown -> application/octet-stream
+        fileExtension = paramFilename.rsplit( ".", 1 )[ -1 ].upper() if "." in paramFilename.split( "/" )[ -1 ] else ""
+        if fileExtension in ContentType.__members__:
+            return ContentType[ fileExtension ].value
+        return ContentType.OCTETSTREAM.value
+
+    def getCachedFileHeader( self, paramCachedFile, paramCode: HtmlStatusCode, paramKeepAlive: bool, paramBuildHeader, paramEncoding: str = None ):
+        # The header of a cached file is built and encoded only once per status, keep-alive state and encoding
+        headerKey = ( paramCode, paramKeepAlive, paramEncoding )
+        header = paramCachedFile.responseHeaders.get( headerKey )
+        if header == None:
+            header = paramCachedFile.responseHeaders[ headerKey ] = paramBuildHeader().encode( 'utf-8' )
+        return header
+
+    def isIfRangeFresh( self, paramIfRange: str, paramEntityTag: str, paramLastModified: str ):
+        # Without If-Range the range is always used. With If-Range only if the file was not changed since.
+        if paramIfRange == "":
+            return True
+        if paramIfRange.startswith( '"' ) or paramIfRange.startswith( 'W/' ):
+            # Only a strong ETag may be used for ranges
+            return paramIfRange == paramEntityTag
+        try:
+            return parsedate_to_datetime( paramIfRange ) == parsedate_to_datetime( paramLastModified )
+        except ( TypeError, ValueError ):
+            # An unknown validator - send the full file
+            return False
+
+    def getValidatorHeader( self, paramEntityTag: str, paramLastModified: str, paramCacheControl: str ):
+        return f"ETag: {paramEntityTag}\r\nLast-Modified: {paramLastModified}\r\nCache-Control: {paramCacheControl}\r\n"
+
+    def isNotModified( self, paramRequest: HttpRequest, paramEntityTag: str, paramLastModified: str ):
+        # Conditional GET: True if the client already has this version and a 304 without body is enough.
+        # Example URL: https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+        if paramRequest.method != 'GET':
+            return False
+
+        # Reload in the browser: the client wants the body again
+        cacheControl = paramRequest.getHeader( "Cache-Control" ).lower()
+        if "no-cache" in cacheControl or "no-store" in cacheControl or "no-cache" in paramRequest.getHeader( "Pragma" ).lower():
+            return False
+
+        # If-None-Match wins over If-Modified-Since; ETags are compared weak (W/ prefix ignored)
+        ifNoneMatch = paramRequest.getHeader( "If-None-Match" )
+        if ifNoneMatch:
+            if ifNoneMatch.strip() == "*":
+                return True
+            return paramEntityTag in [ entityTag.strip().removeprefix( "W/" ) for entityTag in ifNoneMatch.split( "," ) ]
+
+        ifModifiedSince = paramRequest.getHeader( "If-Modified-Since" )
+        if ifModifiedSince:
+            try:
+                return parsedate_to_datetime( paramLastModified ) <= parsedate_to_datetime( ifModifiedSince )
+            except ( TypeError, ValueError ):
+                return False
+        return False
+
+    def sendFileContent( self, paramClientSocket: ClientConnection, paramFileHandler, paramOffset: int, paramCount: int ):
+        # Send paramCount bytes of the file from paramOffset on with the fastest way the connection allows
+        clientSocket = paramClientSocket.socket
+        if isinstance( clientSocket, SSLSocket ) == False:
+            sendPath = SendPath.SENDFILE
+        elif self.usesKernelTls( clientSocket ):
+            sendPath = SendPath.KTLS
+        else:
+            sendPath = SendPath.BUFFERED
+
+        with self.sendPathLock:
+            if self.sendPathCounter[ sendPath ] == 0:
+                print( f"Download send path: {sendPath.value}" )
+            self.sendPathCounter[ sendPath ] += 1
+
+        # A shaped transfer (see startTransfer) goes in pieces of one quantum - every stream gets its turn
+        pieceSize = self.transferScheduler.quantum if paramClientSocket.sendStream != None else self.sendBufferSize
+
+        if sendPath != SendPath.BUFFERED:
+            # Zero-copy: the file content never reaches Python. socket.sendfile uses os.sendfile, but SSLSocket.sendfile
+            # always reads and sends in Python - with kernel TLS os.sendfile is called direct on the socket.
+            sendFile = clientSocket.sendfile if sendPath == SendPath.SENDFILE else partial( self.sendFileKernelTls, clientSocket )
+            if paramClientSocket.sendStream == None:
+                paramClientSocket.bytesSent += sendFile( paramFileHandler, paramOffset, paramCount )
+                return sendPath
+            sentBytes = 0
+            while sentBytes < paramCount:
+                pieceCount = min( pieceSize, paramCount - sentBytes )
+                paramClientSocket.sendStream.throttle( pieceCount )
+                pieceSent = sendFile( paramFileHandler, paramOffset + sentBytes, pieceCount )
+                if pieceSent == 0:
+                    # File was made shorter in the meantime
+                    break
+                sentBytes += pieceSent
+            paramClientSocket.bytesSent += sentBytes
+            return sendPath
+
+        # Userspace TLS must see every byte. Read large pieces into one reused buffer without new bytes objects.
+        sendBuffer = getattr( self.sendBuffers, "buffer", None )
+        if sendBuffer == None:
+            sendBuffer = self.sendBuffers.buffer = memoryview( bytearray( self.sendBufferSize ) )
+
+        paramFileHandler.seek( paramOffset )
+        remaining = paramCount
+        # The operator := does set a value and give it out; both at same time. Nice :-)
+        while remaining > 0 and ( readBytes := paramFileHandler.readinto( sendBuffer[ :min( remaining, pieceSize ) ] ) ):
+            paramClientSocket.sendall( sendBuffer[ :readBytes ] )
+            remaining -= readBytes
+        return sendPath
+
+    def sendFileKernelTls( self, paramSslSocket: SSLSocket, paramFileHandler, paramOffset: int, paramCount: int ):
+        # The kernel encrypts, so the plain file goes with os.sendfile into the socket. Give back the sent bytes (less at the end of the file).
+        # A socket with timeout is non-blocking inside: wait until it can take more, like socket.sendfile does.
+        socketDescriptor = paramSslSocket.fileno()
+        timeout = paramSslSocket.gettimeout()
+        sentBytes = 0
+        while sentBytes < paramCount:
+            try:
+                pieceSent = osSendfile( socketDescriptor, paramFileHandler.fileno(), paramOffset + sentBytes, paramCount - sentBytes )
+            except BlockingIOError:
+                writePoll = poll()
+                writePoll.register( socketDescriptor, POLLOUT )
+                if not writePoll.poll( None if timeout == None else timeout * 1000 ):
+                    raise TimeoutError( "Send timeout" )
+                continue
+            if pieceSent == 0:
+                # End of the file
+                break
+            sentBytes += pieceSent
+        return sentBytes
+
+    def usesKernelTls( self, paramSslSocket: SSLSocket ):
+        # Python can not tell if OpenSSL gave the encryption to the kernel - the kernel can: only then the socket has a TLS send key.
+        # Never True without ssl.OP_ENABLE_KTLS (Python 3.11 and older) - then the downloads use the buffered path.
+        try:
+            paramSslSocket.getsockopt( SOL_TLS, TLS_TX, 64 )
+        except OSError:
+            return False
+        return True
+
+    def uploadFile( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # The body is read as bytes piece by piece and written direct into the file.
+        # Memory usage is only one chunk - also for uploads with many gigabytes.
+        uploadFileLength = paramRequest.getContentLength()
+        if uploadFileLength == None:
+            paramClientSocket.keepAlive = False
+            return ( False, HtmlStatusCode.LENGTHREQUIRED, "Error: Content-Length is missing!" )
+
+        contentType, contentTypeParameters = parseHeaderParameters( paramRequest.getHeader( "Content-Type" ) )
+        if contentType != PostForm.ENCTYPEMULTIPART.value or "boundary" not in contentTypeParameters:
+            paramClientSocket.keepAlive = False
+            return ( False, HtmlStatusCode.BADREQUEST, "Error: Upload must be multipart/form-data with a boundary!" )
 
         # Debugging output
         #print( f"func: uploadFile()" )
-        #print( f"Filename: {uploadFilename}" )
-        #print( f"Filetype: {uploadFiletype}" )
         #print( f"Filelength: {uploadFileLength}" )
-        #print( f"Boundary: {uploadBoundary}" )
+        #print( f"Boundary: {contentTypeParameters[ 'boundary' ]}" )
 
-        if filetypeFound.name != uploadFilename.split( "." )[ 1 ].upper():
+        self.startTransfer( paramClientSocket, TransferDirection.RECEIVE, uploadFileLength )
+        multipartParser = MultipartParser( paramClientSocket, contentTypeParameters[ "boundary" ], uploadFileLength, self.uploadChunkSize )
+        uploadResult = ( False, HtmlStatusCode.BADREQUEST, "Error: No file in the upload!" )
+        try:
+            while ( partHeaders := multipartParser.nextPart() ) != None:
+                _, dispositionParameters = parseHeaderParameters( partHeaders.get( "content-disposition", "" ) )
+                if dispositionParameters.get( "name" ) != PostForm.UPLOAD.value or "filename" not in dispositionParameters:
+                    # Other form fields like the submit button
+                    multipartParser.readPart()
+                    continue
+
+                uploadResult = self.storeUploadPart( multipartParser, dispositionParameters[ "filename" ], partHeaders )
+                if uploadResult[ 0 ] == False:
+                    # The rest of the body is not read - the connection can not be used again
+                    paramClientSocket.keepAlive = False
+                    return uploadResult
+        except ( ValueError, ConnectionError ) as e:
+            paramClientSocket.keepAlive = False
+            return ( False, HtmlStatusCode.BADREQUEST, f"Error: {e}" )
+
+        return uploadResult
+
+    def storeUploadPart( self, paramMultipartParser: MultipartParser, paramFilename: str, paramPartHeaders: dict ):
+        uploadFilename = self.getUploadFilename( paramFilename )
+        if uploadFilename == None:
+            return ( False, HtmlStatusCode.BADREQUEST, "Error: No valid filename!" )
+
+        # Filter the filetype - extensions check. Only a known type that does not fit to the known extension is refused.
+        uploadFiletype = paramPartHeaders.get( "content-type", ContentType.OCTETSTREAM.value ).split( ";" )[ 0 ].strip()
+        uploadExtension = uploadFilename.rsplit( ".", 1 )[ -1 ].upper() if "." in uploadFilename else ""
+        filetypeFound = next( ( contentType for contentType in ContentType if contentType.value == uploadFiletype ), ContentType.OCTETSTREAM )
+        if filetypeFound != ContentType.OCTETSTREAM and uploadExtension in ContentType.__members__ and filetypeFound.name != uploadExtension:
             # Filetype does not match!
             # Upload unallowed
             return ( False, HtmlStatusCode.CONFLICT, "Error: Filetype is not the same!" )
 
-        # Reduce the filesize because extra data is added to the size
-        # Body attached with boundary after the regular file
-        tooMuchBytes = len( f"""{uploadBoundary}\r\nContent-Disposition: form-data; name="btnSubmit"\r\n\r\nUpload\r\n{uploadBoundary}\r\nContent-Disposition: form-data; name="FilePath"\r\n\r\n{uploadFilename}\r\n{uploadBoundary}--\r\n""".encode( 'utf-8' ) )
-        uploadFileLength -= tooMuchBytes
-
-        # Debugging output
-        #print( f"After Reduce the upload file size: {uploadFileLength}" )
-
         # Upload allowed
         # Check header: Content-Range (for resume upload?)
-        contentRange = self.findContentOfHeader( submitBoundaryHeader, "Content-Range" )
-
-        # Get already loaded bytes
         # Example URL: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Content-Range
         # Example: Content-Range: bytes 200-1000/67589
-        startByte = 0
-        if contentRange:
-            startByte = int( contentRange.split( " " )[ 1 ].split( "-" )[ 0 ] )
+        # Resumable uploads in any order use handleUploadSession - here only one stream that is appended
+        contentRange = parseContentRange( paramPartHeaders.get( "content-range", "" ) )
+        startByte = contentRange[ 0 ] if contentRange != None else 0
 
         # Set it to the right user directory
         userFilePath = self.filesystemService.madeUserPath( uploadFilename )
+        if self.filesystemService.isUserPath( userFilePath ) == False:
+            # Never write outside of the user directory
+            return ( False, HtmlStatusCode.BADREQUEST, "Error: No valid filename!" )
+
+        # Continue a started upload at the end of the file or create a new one
+        fileWriteMode = 'ab' if startByte > 0 else 'wb'
+        if startByte > 0 and self.filesystemService.getFileSize( userFilePath ) != startByte:
+            # Check filesize - that the correct continue begins - otherwise terminate the upload
+            return ( False, HtmlStatusCode.CONFLICT, "Error: Mismatched Start Byte" )
+
+        blobStore = self.filesystemService.blobStore
+        if startByte > 0 or blobStore == None:
+            # A shared content is never changed for all users
+            self.filesystemService.detachFile( userFilePath, startByte > 0 )
+            with open( userFilePath, fileWriteMode ) as writeFileHandler:
+                receivedBytes = paramMultipartParser.streamPart( writeFileHandler.write )
+            self.filesystemService.notifyChanged( userFilePath )
+        else:
+            # Deduplicated: the hash is computed while the data streams in - no second read of the file
+            temporaryPath = blobStore.getTemporaryPath()
+            uploadHash = blobStore.newHash()
+            try:
+                with open( temporaryPath, 'wb' ) as writeFileHandler:
+                    def writeAndHash( paramData ):
+                        uploadHash.update( paramData )
+                        writeFileHandler.write( paramData )
+                    receivedBytes = paramMultipartParser.streamPart( writeAndHash )
+            except BaseException:
+                osRemove( temporaryPath )
+                raise
+            self.filesystemService.storeFile( temporaryPath, userFilePath, uploadHash.hexdigest() )
 
-        # if file exists append or it does not exists create a new one
-        fileWriteMode = 'ab' if self.filesystemService.checkExists( userFilePath ) else 'wb'
+        # Debugging output
+        #print( f"Upload {uploadFilename}: {receivedBytes} bytes" )
 
-        with open( userFilePath, fileWriteMode ) as writeFileHandler:
-            if startByte > 0:
-                # Check filesize - that the correct continue begins - otherwise terminate the upload
-                currentFileSize = self.filesystemService.getFileSize( userFilePath )
-                if currentFileSize != startByte:
-                    return ( False, HtmlStatusCode.CONFLICT, "Error: Mismatched Start Byte" )
-            else:
-                if len(submitBoundaryBody) > 0:
-                    writeFileHandler.write( submitBoundaryBody.encode( 'utf-8' ) )
-                    # Received data missing BoundaryHeader and BoundaryBody are possible
-                    # But why is so many bytes missing the last len(...\r\n...)??? No Idea, not yet!!! No Time to waste
-                    startByte = len( submitBoundaryBody.encode( 'utf-8' ) ) + len( submitBoundaryHeader.encode( 'utf-8' ) ) + len( '\r\n\r\n\r\n\r\n\r\n\r\n'.encode( 'utf-8' ) )
-
-            # Read file at position and continue with store at that position
-            received = startByte
-            while received < uploadFileLength:
-                # Debugging output
-                #print( f"Received size: {received} | uploadFileLength: {uploadFileLength}")
-
-                if ( received + self.chunkSize ) > uploadFileLength:
-                    # Debugging output
-                    #print( f"{received + self.chunkSize} > {uploadFileLength}" )
-                    #print( f"uploadFileLength - received = {uploadFileLength - received}" )
-
-                    # The last puzzle is received from the socket. Break the while-loop
-                    chunk = paramClientSocket.recv( uploadFileLength - received )
-                    writeFileHandler.write( chunk )
-                    break
+        return ( True, HtmlStatusCode.OK, "Upload completed!" )
+
+    def startFileOperation( self, paramClientSocket: ClientConnection, paramFormFields: dict ):
+        # Source and target are relative to the user directory and must stay inside of it
+        try:
+            fileOperation = FileOperation( paramFormFields.get( PostForm.OPERATION.value, "" ) )
+        except ValueError:
+            self.send( paramClientSocket, HtmlStatusCode.BADREQUEST, "application/json", json.dumps( { "error": f"{PostForm.OPERATION.value} must be copy, move or delete!" } ) )
+            return
+        sourceName = paramFormFields.get( PostForm.DOWNLOAD.value, "" )
+        targetName = paramFormFields.get( PostForm.TARGET.value, "" )
+        sourcePath = self.filesystemService.madeUserPath( sourceName )
+        targetPath = self.filesystemService.madeUserPath( targetName )
+        if sourceName == "" or self.filesystemService.isUserPath( sourcePath ) == False or ( fileOperation != FileOperation.DELETE and ( targetName == "" or self.filesystemService.isUserPath( targetPath ) == False ) ):
+            self.send( paramClientSocket, HtmlStatusCode.FORBIDDEN, "application/json", json.dumps( { "error": "Source and target must be inside of your directory!" } ) )
+            return
+        if self.filesystemService.getFileStats( sourcePath ) == None:
+            self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "application/json", json.dumps( { "error": "Source not found!" } ) )
+            return
 
-                # Debugging output
-                #print(" Continue normal chunk-size ")
+        match fileOperation:
+            case FileOperation.COPY:
+                jobFunction = lambda progress: self.filesystemService.doCopy( sourcePath, targetPath, progress )
+            case FileOperation.MOVE:
+                jobFunction = lambda progress: self.filesystemService.doMove( sourcePath, targetPath, progress )
+            case FileOperation.DELETE:
+                targetName = ""
+                jobFunction = lambda progress: self.filesystemService.doRemove( sourcePath, progress )
+
+        jobId = self.fileJobs.submit( fileOperation, sourceName, targetName, jobFunction )
+        jobStatus = self.fileJobs.waitForJob( jobId, self.fileJobWaitTime )
+        match jobStatus[ "state" ]:
+            case "done":
+                self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( jobStatus ) )
+            case "failed":
+                self.send( paramClientSocket, HtmlStatusCode.CONFLICT, "application/json", json.dumps( jobStatus ) )
+            case _:
+                # Still running - the client asks again with the Location
+                self.send( paramClientSocket, HtmlStatusCode.ACCEPTED, "application/json", json.dumps( jobStatus ), f"Location: /jobs/{jobId}\r\n" )
+
+    def getUploadFilename( self, paramFilename: str ):
+        # Only the filename - never a path from the client. None if the name is not allowed.
+        uploadFilename = paramFilename.replace( "\\", "/" ).split( "/" )[ -1 ]
+        if uploadFilename in ( "", "." ) or ".." in uploadFilename or percentSequencePattern.search( uploadFilename ) != None:
+            return None
+        if self.filesystemService.isUserPath( self.filesystemService.madeUserPath( uploadFilename ) ) == False:
+            # Example: a symbolic link in the user directory that points outside
+            return None
+        return uploadFilename
+
+    def handleUploadSession( self, paramClientSocket: ClientConnection, paramRequest: HttpRequest ):
+        # Resumable upload protocol (answers are JSON with the session status):
+        #   POST   /upload/session?FilePath=name&size=N  create a session - 201 with Location
+        #   PUT    /upload/session/<id>                  one chunk with "Content-Range: bytes first-last/N", any order, also parallel
+        #   GET    /upload/session/<id>                  received and missing byte ranges
+        #   POST   /upload/session/<id>                  finalize: the complete file is moved atomically into the user directory
+        #   DELETE /upload/session/<id>                  abort
+        sessionId = paramRequest.path[ len( '/upload/session' ): ].strip( "/" )
+        if sessionId == "":
+            if paramRequest.method != 'POST':
+                self.send( paramClientSocket, HtmlStatusCode.FORBIDDEN, "application/json", json.dumps( { "error": "Create a session with POST!" } ) )
+                return
+            sessionFields = paramRequest.query
+            uploadFilename = self.getUploadFilename( sessionFields.get( PostForm.DOWNLOAD.value, "" ) )
+            uploadSize = sessionFields.get( "size", "" )
+            if uploadFilename == None or uploadSize.isdigit() == False:
+                self.send( paramClientSocket, HtmlStatusCode.BADREQUEST, "application/json", json.dumps( { "error": f"{PostForm.DOWNLOAD.value} and size are needed!" } ) )
+                return
 
-                chunk = paramClientSocket.recv( self.chunkSize )
-                writeFileHandler.write( chunk )
-                received += len( chunk )
+            if self.filesystemService.linkContent( sessionFields.get( self.uploadHashName, "" ).lower(), int( uploadSize ), self.filesystemService.madeUserPath( uploadFilename ) ):
+                # Known content (&sha256=...): done without sending one byte.
+                # Who knows the hash gets the file - not checked per user, deduplication is single-tenant only (see server.py).
+                self.send( paramClientSocket, HtmlStatusCode.CREATED, "application/json", json.dumps( { "filename": uploadFilename, "size": int( uploadSize ), "complete": True, "deduplicated": True } ) )
+                return
 
-                if not chunk:
-                    break
+            sessionId = self.uploadSessions.createSession( uploadFilename, int( uploadSize ) )
+            if sessionId == None:
+                self.send( paramClientSocket, HtmlStatusCode.PAYLOADTOOLARGE, "application/json", json.dumps( { "error": "The upload is too big!" } ) )
+                return
+            sessionStatus = self.uploadSessions.getStatus( sessionId, self.uploadSessions.getSession( sessionId ) )
+            sessionStatus[ "chunkSize" ] = self.uploadSessionChunkSize
+            self.send( paramClientSocket, HtmlStatusCode.CREATED, "application/json", json.dumps( sessionStatus ), f"Location: /upload/session/{sessionId}\r\n" )
+            return
+
+        uploadSession = self.uploadSessions.getSession( sessionId )
+        if uploadSession == None:
+            if paramRequest.method == 'PUT':
+                # The chunk body is not read
+                paramClientSocket.keepAlive = False
+            self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "application/json", json.dumps( { "error": "Unknown upload session!" } ) )
+            return
+
+        match paramRequest.method:
+            case 'GET':
+                self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( self.uploadSessions.getStatus( sessionId, uploadSession ) ) )
+
+            case 'PUT':
+                chunkRange = parseContentRange( paramRequest.getHeader( "Content-Range" ) )
+                chunkLength = paramRequest.getContentLength()
+                if chunkLength == None:
+                    chunkLength = -1
+                if chunkRange == None or chunkRange[ 2 ] not in ( None, uploadSession[ "size" ] ) or chunkRange[ 1 ] >= uploadSession[ "size" ] or chunkLength != chunkRange[ 1 ] - chunkRange[ 0 ] + 1:
+                    # The body is not read - the connection can not be used again
+                    paramClientSocket.keepAlive = False
+                    self.send( paramClientSocket, HtmlStatusCode.RANGENOTSATISFIABLE, "application/json", json.dumps( { "error": "Content-Range and Content-Length do not fit to the upload!" } ) )
+                    return
+
+                self.startTransfer( paramClientSocket, TransferDirection.RECEIVE, chunkLength )
+                remainingBytes = chunkLength
+                def readChunk():
+                    nonlocal remainingBytes
+                    chunk = paramClientSocket.readExact( min( remainingBytes, self.uploadChunkSize ) ) if remainingBytes > 0 else b""
+                    remainingBytes -= len( chunk )
+                    return chunk
+                try:
+                    writtenBytes = self.uploadSessions.writeChunk( sessionId, chunkRange[ 0 ], readChunk )
+                except FileNotFoundError:
+                    # Finalized or aborted by an other connection while this chunk was on the way
+                    paramClientSocket.keepAlive = False
+                    self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "application/json", json.dumps( { "error": "Unknown upload session!" } ) )
+                    return
+                if writtenBytes != chunkLength:
+                    # Client is gone - the chunk is not marked as received and is sent again later
+                    paramClientSocket.keepAlive = False
+                    return
+
+                self.uploadSessions.markReceived( sessionId, chunkRange[ 0 ], chunkRange[ 1 ] )
+                self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( { "id": sessionId, "received": list( chunkRange[ :2 ] ) } ) )
+
+            case 'POST':
+                sessionStatus = self.uploadSessions.getStatus( sessionId, uploadSession )
+                if sessionStatus[ "complete" ] == False:
+                    self.send( paramClientSocket, HtmlStatusCode.CONFLICT, "application/json", json.dumps( sessionStatus ) )
+                    return
+
+                userFilePath = self.filesystemService.madeUserPath( uploadSession[ "filename" ] )
+                if self.filesystemService.isUserPath( userFilePath ) == False:
+                    # Checked when the session was made - but the session file lives on disk and the directory can change
+                    self.uploadSessions.removeSession( sessionId )
+                    self.send( paramClientSocket, HtmlStatusCode.BADREQUEST, "application/json", json.dumps( { "error": "No valid filename!" } ) )
+                    return
+                try:
+                    self.uploadSessions.finalizeSession( sessionId, userFilePath, self.filesystemService.storeFile )
+                except FileNotFoundError:
+                    # An other connection was faster
+                    self.send( paramClientSocket, HtmlStatusCode.NOTFOUND, "application/json", json.dumps( { "error": "Unknown upload session!" } ) )
+                    return
+                self.send( paramClientSocket, HtmlStatusCode.CREATED, "application/json", json.dumps( { "id": sessionId, "filename": uploadSession[ "filename" ], "size": uploadSession[ "size" ], "complete": True } ) )
 
-            return ( True, HtmlStatusCode.OK, "Upload completed!" )
+            case 'DELETE':
+                self.uploadSessions.removeSession( sessionId )
+                self.send( paramClientSocket, HtmlStatusCode.OK, "application/json", json.dumps( { "id": sessionId, "removed": True } ) )